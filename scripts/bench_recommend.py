@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+智能推荐查询基准
+对比逐个产品查询供应商（N+1）与 JOIN 一次取回供应商字段的查询次数和延迟
+
+请使用本地的临时数据库运行，脚本会建表并写入测试数据:
+    PGDATABASE_URL=postgresql://postgres@localhost/bench python scripts/bench_recommend.py --products 100000
+也可以用 --url 指定其他 SQLAlchemy 连接串（如 sqlite:///bench.db）快速试跑
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from sqlalchemy import create_engine, event, func, insert
+from sqlalchemy.orm import sessionmaker
+
+from storage.database.shared.model import Product, ProductRanking, Supplier, UserPreference
+from storage.database.supplier_manager import SupplierManager
+
+CATEGORIES = ["手机壳", "面膜", "收纳盒", "宠物用品", "户外露营", "家居香薰", "数据线", "瑜伽服"]
+PLATFORMS = ["1688", "alibaba", "pinduoduo"]
+BENCH_USER = "bench_user"
+
+
+def _seed(db, products: int, suppliers: int, chunk: int = 5000) -> None:
+    """写入测试供应商、产品和一条用户偏好"""
+    rng = random.Random(42)
+    existing = db.query(func.count(Product.id)).scalar()
+    if existing >= products:
+        print(f"已有 {existing} 个产品，跳过写入")
+        return
+
+    supplier_ids = [row[0] for row in db.query(Supplier.id).limit(suppliers).all()]
+    if len(supplier_ids) < suppliers:
+        rows = [{
+            "name": f"基准供应商_{i}",
+            "platform": rng.choice(PLATFORMS),
+            "region": "浙江",
+            "is_verified": bool(i % 2),
+            "status": "active",
+            "source": "bench",
+        } for i in range(suppliers - len(supplier_ids))]
+        db.execute(insert(Supplier), rows)
+        db.commit()
+        supplier_ids = [row[0] for row in db.query(Supplier.id).limit(suppliers).all()]
+
+    todo = products - existing
+    print(f"写入 {todo} 个产品...")
+    for start in range(0, todo, chunk):
+        rows = []
+        for _ in range(min(chunk, todo - start)):
+            purchase = round(rng.uniform(1, 200), 2)
+            estimated = round(purchase * rng.uniform(1.1, 3), 2)
+            rows.append({
+                "supplier_id": rng.choice(supplier_ids),
+                "name": f"基准产品_{existing + start + len(rows)}",
+                "category": rng.choice(CATEGORIES),
+                "purchase_price": purchase,
+                "estimated_price": estimated,
+                "profit_margin": round((estimated - purchase) / estimated * 100, 2),
+                "roi": round((estimated - purchase) / purchase * 100, 2),
+                "potential_score": rng.randint(1, 10),
+                "image_urls": [f"https://example.com/{start}.jpg"],
+                "tags": ["基准"],
+                "status": "active",
+            })
+        db.execute(insert(Product), rows)
+        db.commit()
+    # 批量 INSERT 不触发 ORM 事件，写入后全量重建排名表
+    print(f"重建排名表: {SupplierManager().refresh_product_rankings(db)} 行")
+
+    if db.query(UserPreference).filter(UserPreference.user_id == BENCH_USER).first() is None:
+        SupplierManager().create_or_update_preference(
+            db, BENCH_USER, preferred_categories=CATEGORIES[:3], min_roi=50,
+        )
+
+
+def _n_plus_one(mgr: SupplierManager, db, limit: int) -> int:
+    """原实现：推荐查询后逐个产品查询供应商"""
+    products = mgr.recommend_products(db, BENCH_USER, limit)
+    names = []
+    for prod in products:
+        supplier = mgr.get_supplier_by_id(db, prod.supplier_id)
+        names.append((supplier.name, supplier.platform) if supplier else ("未知", ""))
+    return len(names)
+
+
+def _joined(mgr: SupplierManager, db, limit: int) -> int:
+    """新实现：JOIN 一次取回供应商字段"""
+    rows = mgr.recommend_product_rows(db, BENCH_USER, limit)
+    return len([(row.supplier_name, row.supplier_platform) for row in rows])
+
+
+def _bench(name, fn, session_factory, counter, runs: int, limit: int) -> None:
+    latencies = []
+    queries = 0
+    returned = 0
+    for _ in range(runs):
+        db = session_factory()
+        try:
+            counter["n"] = 0
+            start = time.perf_counter()
+            returned = fn(SupplierManager(), db, limit)
+            latencies.append((time.perf_counter() - start) * 1000)
+            queries = counter["n"]
+        finally:
+            db.close()
+    latencies.sort()
+    print(f"{name:>10}: {returned} 条, 每次 {queries} 条 SQL, "
+          f"p50={statistics.median(latencies):.2f}ms "
+          f"p95={latencies[int(len(latencies) * 0.95) - 1]:.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark N+1 vs joined product recommendations")
+    parser.add_argument("--url", default=os.getenv("PGDATABASE_URL"), help="数据库连接串，默认读取 PGDATABASE_URL")
+    parser.add_argument("--products", type=int, default=100000, help="产品数量")
+    parser.add_argument("--suppliers", type=int, default=2000, help="供应商数量")
+    parser.add_argument("--limit", type=int, default=50, help="每次推荐数量")
+    parser.add_argument("--runs", type=int, default=50, help="每组执行次数")
+    args = parser.parse_args()
+    if not args.url:
+        parser.error("请通过 --url 或 PGDATABASE_URL 指定数据库")
+
+    engine = create_engine(args.url)
+    for model in (Supplier, Product, ProductRanking, UserPreference):
+        try:
+            model.__table__.create(engine, checkfirst=True)
+        except Exception as e:
+            # user_preferences 上的 user_id 索引重复定义，表本身已创建（同 init_db.py）
+            if "already exists" not in str(e):
+                raise
+    session_factory = sessionmaker(bind=engine)
+
+    db = session_factory()
+    try:
+        _seed(db, args.products, args.suppliers)
+    finally:
+        db.close()
+
+    counter = {"n": 0}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        counter["n"] += 1
+
+    print(f"产品数: {args.products}, 推荐数量: {args.limit}, 执行次数: {args.runs}")
+    _bench("n+1", _n_plus_one, session_factory, counter, args.runs, args.limit)
+    _bench("joined", _joined, session_factory, counter, args.runs, args.limit)
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
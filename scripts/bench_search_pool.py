@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+搜索客户端连接池微基准
+在本地启动一个模拟搜索接口，对比每次新建 SearchClient（冷连接）与共享连接池的调用延迟
+
+用法: python scripts/bench_search_pool.py [-n 200] [--latency-ms 0]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+STUB_RESPONSE = json.dumps({
+    "ResponseMetadata": {},
+    "Result": {
+        "WebResults": [
+            {"Id": str(i), "SortId": i, "Title": f"结果 {i}", "Url": f"https://example.com/{i}",
+             "SiteName": "example", "Snippet": "摘要", "AuthInfoDes": "", "AuthInfoLevel": 0}
+            for i in range(10)
+        ],
+        "Choices": [{"Message": {"Content": "AI 总结"}}],
+    },
+}, ensure_ascii=False).encode("utf-8")
+
+
+class StubSearchHandler(BaseHTTPRequestHandler):
+    """模拟搜索接口，支持 HTTP/1.1 keep-alive"""
+    protocol_version = "HTTP/1.1"
+    # 避免 keep-alive 连接上头部与正文分包触发 Nagle/延迟确认
+    disable_nagle_algorithm = True
+    latency = 0.0
+    connections = 0
+
+    def setup(self):
+        super().setup()
+        StubSearchHandler.connections += 1
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        if self.latency:
+            time.sleep(self.latency)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(STUB_RESPONSE)))
+        self.end_headers()
+        self.wfile.write(STUB_RESPONSE)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def _bench(name, make_client, n):
+    StubSearchHandler.connections = 0
+    latencies = []
+    for i in range(n):
+        start = time.perf_counter()
+        client = make_client()
+        response = client.web_search(query=f"测试 {i}", count=10)
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert len(response.web_items) == 10
+    print(f"{name:<10} mean={statistics.mean(latencies):7.3f}ms "
+          f"p50={_percentile(latencies, 0.5):7.3f}ms "
+          f"p99={_percentile(latencies, 0.99):7.3f}ms "
+          f"connections={StubSearchHandler.connections}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pooled vs cold SearchClient")
+    parser.add_argument("-n", type=int, default=200, help="每组调用次数")
+    parser.add_argument("--latency-ms", type=float, default=0, help="模拟服务端处理延迟")
+    args = parser.parse_args()
+
+    StubSearchHandler.latency = args.latency_ms / 1000
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubSearchHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    os.environ["COZE_INTEGRATION_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ.setdefault("COZE_INTEGRATION_MODEL_BASE_URL", os.environ["COZE_INTEGRATION_BASE_URL"])
+    os.environ.setdefault("COZE_WORKLOAD_IDENTITY_API_KEY", "bench-key")
+    # 基准只测量连接开销，不受 search 配额限制
+    os.environ.setdefault("RATE_LIMIT_SEARCH", "100000/1")
+
+    from coze_coding_dev_sdk import SearchClient
+    from coze_coding_utils.runtime_ctx.context import new_context
+    from utils.search_client_pool import SearchClientPool
+
+    pool = SearchClientPool()
+    print(f"调用次数: {args.n}, 模拟延迟: {args.latency_ms}ms")
+    _bench("cold", lambda: SearchClient(ctx=new_context(method="search.bench")), args.n)
+    _bench("pooled", lambda: pool.client("search.bench", use_cache=False), args.n)
+
+    pool.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
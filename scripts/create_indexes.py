@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+补建索引脚本
+create_all 只会创建不存在的表，已存在的表上新增的索引需要补建；init_db.py 在 JSON 列迁移之后调用，
+单独执行时同样先迁移 JSON 列（jsonb_path_ops 的 GIN 索引只能建在 jsonb 列上）
+"""
+import sys
+import os
+
+# 设置 PYTHONPATH
+workspace_path = os.path.join(os.path.dirname(__file__), '..')
+src_path = os.path.join(workspace_path, 'src')
+sys.path.insert(0, src_path)
+sys.path.insert(0, os.path.dirname(__file__))
+os.environ['PYTHONPATH'] = src_path
+
+from sqlalchemy import inspect
+from sqlalchemy.schema import CreateIndex
+from storage.database.db import get_engine
+from storage.database.shared.model import Base
+from migrate_json_columns import migrate_json_columns
+
+# 由 init_db.py 在确认没有重复数据后单独创建
+_SKIPPED_INDEXES = {"uq_suppliers_name_platform"}
+
+
+def create_indexes(engine=None):
+    """为已存在的表创建模型中定义但数据库中缺失的索引（IF NOT EXISTS，可重复执行）"""
+    try:
+        print("开始补建索引...")
+        engine = engine or get_engine()
+        existing_tables = set(inspect(engine).get_table_names())
+
+        with engine.begin() as conn:
+            for table in Base.metadata.sorted_tables:
+                if table.name not in existing_tables:
+                    continue
+                for index in table.indexes:
+                    if index.name not in _SKIPPED_INDEXES:
+                        conn.execute(CreateIndex(index, if_not_exists=True))
+
+        print("✅ 索引补建完成！")
+        return True
+
+    except Exception as e:
+        print(f"❌ 索引补建失败: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+if __name__ == "__main__":
+    success = migrate_json_columns() and create_indexes()
+    sys.exit(0 if success else 1)
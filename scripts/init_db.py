@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """
 数据库初始化脚本
-创建所有数据库表
+创建所有数据库表，在没有重复数据时补建供应商自然键唯一索引，并回填 product_rankings 等由其他表派生的数据
 """
 import sys
 import os
@@ -12,11 +12,69 @@ src_path = os.path.join(workspace_path, 'src')
 sys.path.insert(0, src_path)
 os.environ['PYTHONPATH'] = src_path
 
-from storage.database.db import get_engine
-from storage.database.shared.model import Base
+from sqlalchemy.schema import CreateIndex
+
+from storage.database.db import get_engine, session_scope
+from storage.database.shared.model import Base, Product, ProductRanking, Supplier
+from storage.database.supplier_manager import SupplierManager
+from migrate_json_columns import migrate_json_columns
+from create_indexes import create_indexes
+
+
+def _create_tables(engine):
+    """逐个创建表（如果不存在）；某张表的索引已存在不影响其他表的创建"""
+    for table in Base.metadata.sorted_tables:
+        try:
+            table.create(bind=engine, checkfirst=True)
+        except Exception as e:
+            # 检查错误是否是索引重复（可以忽略）
+            if "DuplicateTable" in str(e) or "already exists" in str(e):
+                print(f"⚠️  {table.name} 的部分索引已存在，跳过创建")
+            else:
+                raise
+
+
+def _backfill_product_rankings():
+    """排名表为空而产品表有数据时（首次上线或从旧版本升级）全量回填"""
+    with session_scope() as db:
+        if db.query(ProductRanking.product_id).first() is not None:
+            return
+        if db.query(Product.id).first() is None:
+            return
+        print("正在回填产品排名表...")
+        count = SupplierManager().refresh_product_rankings(db)
+        print(f"✅ 产品排名表回填完成，共 {count} 行")
+
+
+def _ensure_supplier_natural_key(engine):
+    """
+    在没有重复数据时补建供应商自然键（名称 + 平台）唯一索引
+
+    create_all 不会给已存在的表加索引；旧数据里有重复行时不在这里删除任何数据，
+    只列出阻止建索引的重复行，由 scripts/merge_duplicate_suppliers.py 预览并确认后合并
+    """
+    with session_scope() as db:
+        plans = SupplierManager().find_duplicate_suppliers(db)
+    if plans:
+        print(f"⚠️  有 {len(plans)} 组名称 + 平台重复的供应商，暂不创建唯一索引 uq_suppliers_name_platform：")
+        for plan in plans[:20]:
+            ids = [plan["keep_id"]] + plan["duplicate_ids"]
+            print(f"  - {plan['name']}（平台: {plan['platform'] or '未指定'}）: {', '.join(f'#{i}' for i in ids)}")
+        if len(plans) > 20:
+            print(f"  ... 另有 {len(plans) - 20} 组")
+        print("   运行 python scripts/merge_duplicate_suppliers.py 预览合并方案")
+        return
+    index = next(i for i in Supplier.__table__.indexes if i.name == "uq_suppliers_name_platform")
+    with engine.begin() as conn:
+        conn.execute(CreateIndex(index, if_not_exists=True))
+
 
 def init_database():
-    """初始化数据库，创建所有表"""
+    """
+    初始化数据库：创建所有表，迁移 JSON 列，补建索引，并回填新增的派生表
+
+    每次部署启动服务前执行（start.sh 中已包含），可重复执行
+    """
     try:
         print("开始初始化数据库...")
 
@@ -25,8 +83,20 @@ def init_database():
 
         # 创建所有表（如果不存在）
         print("正在创建数据库表...")
-        Base.metadata.create_all(bind=engine, checkfirst=True)
+        _create_tables(engine)
+        # 旧库的 JSON 列转为 jsonb 并还原二次编码的值；供应商品类查询（@>）和读取方都依赖它
+        migrated = migrate_json_columns(engine)
+        # 已存在的表上补建新增索引；GIN（jsonb_path_ops）索引要求列已是 jsonb，迁移失败时不建
+        indexed = migrated and create_indexes(engine)
+        _ensure_supplier_natural_key(engine)
+        _backfill_product_rankings()
 
+        if not migrated:
+            print("❌ JSON 字段迁移失败，未补建索引，其余初始化步骤已完成")
+            return False
+        if not indexed:
+            print("❌ 索引补建失败，其余初始化步骤已完成")
+            return False
         print("✅ 数据库表创建成功！")
 
         # 列出所有表
@@ -39,23 +109,10 @@ def init_database():
         return True
 
     except Exception as e:
-        # 检查错误是否是索引重复（可以忽略）
-        if "DuplicateTable" in str(e) or "already exists" in str(e):
-            print("⚠️  部分表或索引已存在，跳过创建")
-
-            # 列出所有表
-            from sqlalchemy import inspect
-            engine = get_engine()
-            inspector = inspect(engine)
-            print("\n数据库中的表：")
-            for table_name in inspector.get_table_names():
-                print(f"  - {table_name}")
-            return True
-        else:
-            print(f"❌ 数据库初始化失败: {e}")
-            import traceback
-            traceback.print_exc()
-            return False
+        print(f"❌ 数据库初始化失败: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
 
 if __name__ == "__main__":
     success = init_database()
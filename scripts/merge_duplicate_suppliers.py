@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+重复供应商合并脚本
+旧版本没有自然键（名称 + 平台）唯一索引，suppliers 表可能有重复行，init_db 因此不会创建该索引。
+默认只打印合并方案；确认无误后加 --apply 执行合并并创建唯一索引。
+合并会删除重复行，执行前请先备份 suppliers / products 表
+"""
+import argparse
+import sys
+import os
+
+# 设置 PYTHONPATH
+workspace_path = os.path.join(os.path.dirname(__file__), '..')
+src_path = os.path.join(workspace_path, 'src')
+sys.path.insert(0, src_path)
+os.environ['PYTHONPATH'] = src_path
+
+from sqlalchemy.schema import CreateIndex
+
+from storage.database.db import get_engine, session_scope
+from storage.database.shared.model import Supplier
+from storage.database.supplier_manager import SupplierManager
+
+
+def _print_plan(plan):
+    print(f"  - {plan['name']}（平台: {plan['platform'] or '未指定'}）: "
+          f"保留 #{plan['keep_id']}，合并 {', '.join(f'#{i}' for i in plan['duplicate_ids'])}")
+    for field, value in plan["updates"].items():
+        print(f"      补齐 {field} = {value!r}")
+    for field, values in plan["conflicts"].items():
+        print(f"      ⚠️  {field} 存在不同的值 {values!r}，保留原值，其余写入备注")
+
+
+def merge_duplicate_suppliers(apply: bool = False):
+    """打印（apply=True 时执行）重复供应商的合并方案，合并后创建唯一索引"""
+    try:
+        manager = SupplierManager()
+        with session_scope() as db:
+            plans = manager.merge_duplicate_suppliers(db) if apply else manager.find_duplicate_suppliers(db)
+
+        if not plans:
+            print("✅ 没有重复的供应商")
+        else:
+            print(f"{'已合并' if apply else '将合并'} {len(plans)} 组重复供应商：")
+            for plan in plans:
+                _print_plan(plan)
+            if not apply:
+                print("\n以上为预览，未修改数据。备份后加 --apply 执行合并")
+                return True
+
+        index = next(i for i in Supplier.__table__.indexes if i.name == "uq_suppliers_name_platform")
+        with get_engine().begin() as conn:
+            conn.execute(CreateIndex(index, if_not_exists=True))
+        print("✅ 唯一索引 uq_suppliers_name_platform 已创建")
+        return True
+
+    except Exception as e:
+        print(f"❌ 重复供应商合并失败: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="合并名称 + 平台重复的供应商")
+    parser.add_argument("--apply", action="store_true", help="执行合并（默认只预览）")
+    args = parser.parse_args()
+    success = merge_duplicate_suppliers(apply=args.apply)
+    sys.exit(0 if success else 1)
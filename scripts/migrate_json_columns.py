@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+JSON 字段迁移脚本
+将 JSON 列转换为 JSONB，并把历史上被 json.dumps 二次编码的值（JSON 字符串里的数组/对象）还原为原生 JSON，
+然后创建 GIN 索引。可重复执行：已是 JSONB 的列不再改类型，只还原残留的二次编码值
+"""
+import sys
+import os
+
+# 设置 PYTHONPATH
+workspace_path = os.path.join(os.path.dirname(__file__), '..')
+src_path = os.path.join(workspace_path, 'src')
+sys.path.insert(0, src_path)
+os.environ['PYTHONPATH'] = src_path
+
+from sqlalchemy import create_engine, inspect, text
+from storage.database.db import get_db_url
+
+# 表名 -> 需要迁移的 JSON 列
+JSON_COLUMNS = {
+    "suppliers": ["categories", "tags"],
+    "products": ["image_urls", "specifications", "tags"],
+    "market_trends": ["trend_data", "hot_keywords"],
+    "user_preferences": ["preferred_categories", "preferred_platforms", "preferred_regions",
+                         "keywords", "exclude_keywords"],
+    "notifications": ["data"],
+    "product_link_analyses": ["image_urls", "market_analysis", "competitor_info", "sourcing_suggestions"],
+    "shop_link_analyses": ["top_products", "pricing_analysis", "market_position", "sourcing_opportunities"],
+}
+
+# (索引名, 表名, 列名)：用 jsonb_path_ops 支持 @> 包含查询
+GIN_INDEXES = [
+    ("ix_suppliers_categories_gin", "suppliers", "categories"),
+    ("ix_suppliers_tags_gin", "suppliers", "tags"),
+]
+
+
+def _decode_expr(column: str) -> str:
+    """值为 JSON 字符串且内容是数组/对象时解码一层，否则原样转换为 jsonb"""
+    return (
+        f"CASE WHEN jsonb_typeof({column}::jsonb) = 'string' "
+        f"AND left(ltrim({column}::jsonb #>> '{{}}'), 1) IN ('[', '{{') "
+        f"THEN ({column}::jsonb #>> '{{}}')::jsonb "
+        f"ELSE {column}::jsonb END"
+    )
+
+
+def _column_types(conn, table: str) -> dict:
+    """列名 -> information_schema 中的 data_type"""
+    rows = conn.execute(text(
+        "SELECT column_name, data_type FROM information_schema.columns "
+        "WHERE table_schema = current_schema() AND table_name = :table"
+    ), {"table": table})
+    return {name: data_type for name, data_type in rows}
+
+
+def migrate_json_columns(engine=None):
+    """
+    迁移 JSON 列并创建 GIN 索引（scripts/init_db.py 每次部署时调用）
+
+    Args:
+        engine: 数据库引擎，不传时按 PGDATABASE_URL 创建
+    """
+    try:
+        print("开始迁移 JSON 字段...")
+
+        if engine is None:
+            engine = create_engine(get_db_url(), pool_pre_ping=True)
+        if engine.dialect.name != "postgresql":
+            print(f"  - 跳过（{engine.dialect.name} 不支持 jsonb）")
+            return True
+        inspector = inspect(engine)
+        existing_tables = set(inspector.get_table_names())
+
+        with engine.begin() as conn:
+            for table, columns in JSON_COLUMNS.items():
+                if table not in existing_tables:
+                    print(f"  - 跳过 {table}（表不存在）")
+                    continue
+                column_types = _column_types(conn, table)
+                for column in columns:
+                    data_type = column_types.get(column)
+                    if data_type is None:
+                        print(f"  - 跳过 {table}.{column}（列不存在）")
+                        continue
+                    if data_type != "jsonb":
+                        # 改类型会重写整张表并持有排他锁，只对尚未迁移的列执行；USING 中同时还原二次编码的值
+                        conn.execute(text(
+                            f"ALTER TABLE {table} ALTER COLUMN {column} TYPE jsonb USING {_decode_expr(column)}"
+                        ))
+                        print(f"  ✓ {table}.{column}: {data_type} -> jsonb")
+                        continue
+                    # 已是 jsonb 的列只还原二次编码的行
+                    result = conn.execute(text(
+                        f"UPDATE {table} SET {column} = {_decode_expr(column)} "
+                        f"WHERE jsonb_typeof({column}) = 'string'"
+                    ))
+                    print(f"  ✓ {table}.{column} 已是 jsonb（还原 {result.rowcount} 行）")
+
+            for index_name, table, column in GIN_INDEXES:
+                if table not in existing_tables:
+                    continue
+                conn.execute(text(
+                    f"CREATE INDEX IF NOT EXISTS {index_name} ON {table} USING gin ({column} jsonb_path_ops)"
+                ))
+                print(f"  ✓ 索引 {index_name}")
+
+        print("✅ JSON 字段迁移完成！")
+        return True
+
+    except Exception as e:
+        print(f"❌ JSON 字段迁移失败: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+if __name__ == "__main__":
+    success = migrate_json_columns()
+    sys.exit(0 if success else 1)
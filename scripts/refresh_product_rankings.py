@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+产品排名表重建脚本
+创建 product_rankings 表（如不存在）并按 products 全量重建。
+首次上线时回填一次；之后经 ORM 的产品写入会增量维护，批量 INSERT 导入产品后需重新执行
+"""
+import sys
+import os
+
+# 设置 PYTHONPATH
+workspace_path = os.path.join(os.path.dirname(__file__), '..')
+src_path = os.path.join(workspace_path, 'src')
+sys.path.insert(0, src_path)
+os.environ['PYTHONPATH'] = src_path
+
+from storage.database.db import get_engine, session_scope
+from storage.database.shared.model import ProductRanking
+from storage.database.supplier_manager import SupplierManager
+
+
+def refresh_product_rankings():
+    """创建排名表并全量重建"""
+    try:
+        print("开始重建产品排名表...")
+        ProductRanking.__table__.create(bind=get_engine(), checkfirst=True)
+
+        with session_scope() as db:
+            count = SupplierManager().refresh_product_rankings(db)
+
+        print(f"✅ 产品排名表重建完成，共 {count} 行")
+        return True
+
+    except Exception as e:
+        print(f"❌ 产品排名表重建失败: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+if __name__ == "__main__":
+    success = refresh_product_rankings()
+    sys.exit(0 if success else 1)
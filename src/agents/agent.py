@@ -1,21 +1,37 @@
 import os
 import json
-from typing import Annotated
+import asyncio
+import inspect
+from typing import Annotated, List, Optional, Tuple
 from langchain.agents import create_agent
+from langchain.agents.middleware import AgentMiddleware, ModelRequest
 from langchain_openai import ChatOpenAI
+from langgraph.config import get_config
 from langgraph.graph import MessagesState
 from langgraph.graph.message import add_messages
 from langchain_core.messages import AnyMessage
 from langchain.tools import tool, ToolRuntime
+from langchain_core.tools import StructuredTool
+from sqlalchemy.orm import Session
 from coze_coding_utils.runtime_ctx.context import default_headers, new_context
-from coze_coding_dev_sdk import SearchClient, LLMClient, get_session
+from coze_coding_dev_sdk import LLMClient
 from storage.memory.memory_saver import get_memory_saver
-from storage.database.db import execute_with_retry
+from storage.database.db import aexecute_with_retry, execute_with_retry
 from storage.database.supplier_manager import (
     SupplierManager, SupplierCreate, ProductCreate, 
     ProductUpdate, MarketTrendCreate
 )
-from storage.database.shared.model import Supplier, Product, MarketTrend, UserPreference, Notification
+from storage.database.shared.model import Supplier, Product, MarketTrend, UserPreference, Notification, json_value
+from storage.database.pagination import next_cursor
+from utils.helper.agent_registry import REQUEST_HEADERS_KEY
+from utils.search_client_pool import get_search_client
+from utils.deadline_executor import DeadlineExceeded, remaining_time, run_all_with_deadline, run_with_deadline
+from utils.single_flight import get_single_flight
+from utils.rate_limiter import get_rate_limiter
+from utils.circuit_breaker import CircuitOpenError, get_circuit_breaker
+from utils.image_prep import MAX_BASE64_SIZE, ImageFingerprint, fingerprint, prepare_image
+from utils.vision_cache import get_vision_cache
+from utils.image_store import get_image_store, is_image_ref
 
 LLM_CONFIG = "config/agent_llm_config.json"
 
@@ -43,9 +59,8 @@ def web_search_tool(query: str, count: int = 10, need_summary: bool = True) -> s
         搜索结果的JSON格式字符串，包含标题、URL、摘要、AI总结等信息
     """
     try:
-        # 使用new_context创建context
-        ctx = new_context(method="search.web")
-        client = SearchClient(ctx=ctx)
+        # 使用共享连接池的搜索客户端，每次调用携带新的 context
+        client = get_search_client("search.web")
         
         response = client.web_search(
             query=query,
@@ -97,8 +112,7 @@ def advanced_search_tool(query: str, search_type: str = "web", count: int = 10,
         搜索结果的JSON格式字符串
     """
     try:
-        ctx = new_context(method="search.advanced")
-        client = SearchClient(ctx=ctx)
+        client = get_search_client("search.advanced")
         
         response = client.search(
             query=query,
@@ -150,8 +164,7 @@ def image_search_tool(query: str, count: int = 10) -> str:
         图片搜索结果的JSON格式字符串，包含图片URL、尺寸、来源等信息
     """
     try:
-        ctx = new_context(method="search.image")
-        client = SearchClient(ctx=ctx)
+        client = get_search_client("search.image")
         
         response = client.image_search(
             query=query,
@@ -186,135 +199,44 @@ def image_search_tool(query: str, count: int = 10) -> str:
         return f"图片搜索失败: {str(e)}\n详细信息: {error_details}"
 
 @tool
-def image_analysis_tool(image_url: str, analysis_type: str = "general") -> str:
+def image_analysis_tool(image_url: str, analysis_type: str = "general",
+                        analysis_types: Optional[List[str]] = None) -> str:
     """
     分析产品图片，识别产品类型、特征、风格等信息，并基于图片内容进行市场分析和货源推荐。
     
     Args:
-        image_url: 产品图片URL，可以是网络图片URL或本地图片路径（支持 assets/ 目录或绝对路径）
+        image_url: 产品图片URL，可以是网络图片URL、本地图片路径（支持 assets/ 目录或绝对路径）
+            或用户上传图片的 image:// 引用
         analysis_type: 分析类型，可选值：
             - "general": 通用分析（识别产品类型、特征、风格）
             - "product": 产品分析（识别产品细节、材质、功能）
             - "market": 市场分析（基于图片推荐类似产品和市场趋势）
             - "sourcing": 货源分析（基于图片推荐供应商和采购建议）
+        analysis_types: 需要同一张图片的多种分析时传入类型列表（如 ["general", "market", "sourcing"]），
+            一次调用并发完成，耗时与单次分析相当；传入时忽略 analysis_type
     
     Returns:
-        图片分析结果的JSON格式字符串，包含产品识别、特征分析、市场建议等信息
+        图片分析结果的JSON格式字符串，包含产品识别、特征分析、市场建议等信息；
+        多种分析时 results 按分析类型给出各自的结果
     """
-    try:
-        import os
-        import base64
-        import imghdr
-        from io import BytesIO
-        from PIL import Image
-        from langchain_core.messages import SystemMessage, HumanMessage
-        
-        # 处理本地图片路径，转换为 base64
-        processed_image_url = image_url
-        image_data_original = None
-        image_format = 'jpg'
-        
-        # 检查是否是本地路径
-        if image_url.startswith('assets/') or image_url.startswith('./assets/') or image_url.startswith('/'):
-            # 构建完整路径
-            if image_url.startswith('assets/'):
-                image_path = os.path.join(os.getcwd(), image_url)
-            elif image_url.startswith('./assets/'):
-                image_path = os.path.join(os.getcwd(), image_url.lstrip('./'))
-            else:
-                # 绝对路径
-                image_path = image_url
-            
-            # 检查文件是否存在
-            if os.path.exists(image_path) and os.path.isfile(image_path):
-                try:
-                    with open(image_path, 'rb') as f:
-                        image_data_original = f.read()
-                    
-                    # 检测图片格式
-                    detected_format = imghdr.what(None, h=image_data_original)
-                    image_format = detected_format if detected_format else 'jpg'
-                    
-                    print(f"[image_analysis_tool] 读取本地图片成功，格式: {image_format}, 原始大小: {len(image_data_original)} 字节")
-                except Exception as e:
-                    print(f"[image_analysis_tool] 读取本地图片失败: {str(e)}")
-                    raise Exception(f"无法读取本地图片: {str(e)}")
-            else:
-                print(f"[image_analysis_tool] 本地图片文件不存在: {image_path}")
-                raise Exception(f"本地图片文件不存在: {image_path}")
-        
-        # 压缩图片以适应 API 限制
-        max_base64_size = 500000  # 500KB base64 字符限制
-        compression_attempts = 0
-        max_attempts = 5
-        
-        while compression_attempts < max_attempts:
-            # 如果是本地图片，压缩后编码
-            if image_data_original:
-                # 第一次尝试：直接编码
-                if compression_attempts == 0:
-                    image_data_to_encode = image_data_original
-                else:
-                    # 后续尝试：压缩图片
-                    img = Image.open(BytesIO(image_data_original))
-                    
-                    # 计算新的尺寸（每次缩小 20%）
-                    scale_factor = 0.8 ** compression_attempts
-                    new_width = int(img.width * scale_factor)
-                    new_height = int(img.height * scale_factor)
-                    
-                    # 调整大小
-                    img_resized = img.resize((new_width, new_height), Image.LANCZOS)
-                    
-                    # 转换为字节
-                    output_buffer = BytesIO()
-                    img_resized.save(output_buffer, format='JPEG', quality=85, optimize=True)
-                    image_data_to_encode = output_buffer.getvalue()
-                    image_format = 'jpg'
-                    
-                    print(f"[image_analysis_tool] 压缩尝试 #{compression_attempts + 1}: {new_width}x{new_height}, 大小: {len(image_data_to_encode)} 字节")
-            else:
-                # 网络图片，直接使用
-                image_data_to_encode = None
-                break
-            
-            # 转换为 base64
-            if image_data_to_encode:
-                image_base64 = base64.b64encode(image_data_to_encode).decode('utf-8')
-                processed_image_url = f"data:image/{image_format};base64,{image_base64}"
-                
-                print(f"[image_analysis_tool] base64 大小: {len(image_base64)} 字符")
-                
-                # 如果大小满足要求，停止压缩
-                if len(image_base64) <= max_base64_size:
-                    print(f"[image_analysis_tool] 图片大小满足要求，停止压缩")
-                    break
-                else:
-                    print(f"[image_analysis_tool] base64 大小超过限制 ({max_base64_size} 字符)，继续压缩...")
-                    compression_attempts += 1
-            else:
-                break
-        
-        # 如果压缩后仍然太大，返回错误
-        if image_data_to_encode and len(base64.b64encode(image_data_to_encode)) > max_base64_size:
-            error_msg = (
-                f"图片太大，无法处理（原始: {len(image_data_original)} 字节）。"
-                f"请使用较小的图片（建议小于 400KB）或提供图片 URL。"
-            )
-            print(f"[image_analysis_tool] {error_msg}")
-            raise Exception(error_msg)
-        
-        print(f"[image_analysis_tool] 最终图片 URL 大小: {len(processed_image_url)} 字符")
-        
-        # 创建 context
-        ctx = new_context(method="image_analysis")
-        
-        # 创建 LLM 客户端，使用视觉模型
-        llm_client = LLMClient(ctx=ctx)
-        
-        # 根据分析类型设置不同的提示词
-        system_prompts = {
-            "general": """你是电商产品视觉分析专家。请详细分析用户上传的产品图片，包括：
+    if analysis_types:
+        # 去重并保持顺序
+        types = list(dict.fromkeys(analysis_types))
+        return get_single_flight().do(
+            f"image_analysis:{','.join(types)}:{image_url}",
+            lambda: _run_multi_image_analysis(image_url, types),
+        )
+    # 同一图片、同一分析类型的并发调用只请求一次视觉模型
+    return get_single_flight().do(
+        f"image_analysis:{analysis_type}:{image_url}",
+        lambda: _run_image_analysis(image_url, analysis_type),
+    )
+
+# 视觉模型及各分析类型的提示词；修改提示词时递增版本号，使缓存的旧分析结果失效
+VISION_MODEL = "doubao-seed-1-6-vision-250815"
+IMAGE_ANALYSIS_PROMPT_VERSION = 1
+IMAGE_ANALYSIS_PROMPTS = {
+    "general": """你是电商产品视觉分析专家。请详细分析用户上传的产品图片，包括：
 1. 产品类型识别（这是什么产品？属于哪个品类？）
 2. 产品特征描述（颜色、材质、设计风格、尺寸等）
 3. 目标用户群体分析
@@ -322,8 +244,8 @@ def image_analysis_tool(image_url: str, analysis_type: str = "general") -> str:
 5. 潜在竞争优势和劣势
 
 请以结构化的JSON格式返回分析结果。""",
-            
-            "product": """你是电商产品细节分析专家。请深入分析用户上传的产品图片，包括：
+    
+    "product": """你是电商产品细节分析专家。请深入分析用户上传的产品图片，包括：
 1. 产品名称和品类
 2. 详细规格参数（尺寸、重量、材质等）
 3. 产品功能和卖点
@@ -333,8 +255,8 @@ def image_analysis_tool(image_url: str, analysis_type: str = "general") -> str:
 7. 预估成本和利润空间
 
 请以结构化的JSON格式返回分析结果。""",
-            
-            "market": """你是电商市场趋势分析专家。请基于用户上传的产品图片进行市场分析，包括：
+    
+    "market": """你是电商市场趋势分析专家。请基于用户上传的产品图片进行市场分析，包括：
 1. 产品品类和细分市场
 2. 当前市场热度（高/中/低）
 3. 目标平台建议（淘宝/拼多多/京东等）
@@ -345,8 +267,8 @@ def image_analysis_tool(image_url: str, analysis_type: str = "general") -> str:
 8. 热销关键词推荐
 
 请以结构化的JSON格式返回分析结果。""",
-            
-            "sourcing": """你是电商货源推荐专家。请基于用户上传的产品图片进行货源分析，包括：
+    
+    "sourcing": """你是电商货源推荐专家。请基于用户上传的产品图片进行货源分析，包括：
 1. 产品品类和规格
 2. 推荐采购渠道（1688/阿里巴巴/批发市场等）
 3. 预估进货价格区间
@@ -357,79 +279,187 @@ def image_analysis_tool(image_url: str, analysis_type: str = "general") -> str:
 8. 风险提示
 
 请以结构化的JSON格式返回分析结果。"""
-        }
+}
+
+def _load_image_for_vision(image_url: str) -> Tuple[str, Optional[ImageFingerprint]]:
+    """
+    把图片转换为视觉模型可用的 URL
+
+    本地图片读取后预处理为 data URL，并计算预处理后图片的指纹；网络图片原样返回，指纹为 None
+    """
+    import os
+    
+    # 对话中上传的图片：存储时已缩放到模型输入尺寸
+    if is_image_ref(image_url):
+        image_data = get_image_store().read(image_url)
+        prepared = prepare_image(image_data, max_base64_size=MAX_BASE64_SIZE)
+        return prepared.to_data_url(), fingerprint(prepared.data)
+    
+    # 检查是否是本地路径
+    if not (image_url.startswith('assets/') or image_url.startswith('./assets/') or image_url.startswith('/')):
+        return image_url, None
+    
+    # 构建完整路径
+    if image_url.startswith('assets/'):
+        image_path = os.path.join(os.getcwd(), image_url)
+    elif image_url.startswith('./assets/'):
+        image_path = os.path.join(os.getcwd(), image_url.lstrip('./'))
+    else:
+        # 绝对路径
+        image_path = image_url
+    
+    # 检查文件是否存在
+    if not (os.path.exists(image_path) and os.path.isfile(image_path)):
+        print(f"[image_analysis_tool] 本地图片文件不存在: {image_path}")
+        raise Exception(f"本地图片文件不存在: {image_path}")
+    try:
+        with open(image_path, 'rb') as f:
+            image_data_original = f.read()
+        print(f"[image_analysis_tool] 读取本地图片成功，原始大小: {len(image_data_original)} 字节")
+    except Exception as e:
+        print(f"[image_analysis_tool] 读取本地图片失败: {str(e)}")
+        raise Exception(f"无法读取本地图片: {str(e)}")
+    
+    # 压缩图片以适应 API 限制：只解码一次，预估缩放比例后二分查找质量，最终只编码一次
+    prepared = prepare_image(image_data_original, max_base64_size=MAX_BASE64_SIZE)
+    print(f"[image_analysis_tool] 图片预处理完成: {prepared.width}x{prepared.height}, "
+          f"base64 大小: {prepared.base64_size} 字符")
+    return prepared.to_data_url(), fingerprint(prepared.data)
+
+def _get_text_content(content) -> str:
+    """安全地从 AIMessage content 中提取文本"""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return " ".join(
+            item.get("text", "") for item in content
+            if isinstance(item, dict) and item.get("type") == "text"
+        )
+    return str(content)
+
+def _analyze_image(processed_image_url: str, fp: Optional[ImageFingerprint], image_url: str,
+                   analysis_type: str) -> Tuple[str, bool]:
+    """
+    调用视觉模型分析一张已处理的图片，结果按图片内容缓存
+
+    Returns:
+        (分析文本, 是否命中缓存)
+    """
+    from langchain_core.messages import SystemMessage, HumanMessage
+    
+    prompt_key = analysis_type if analysis_type in IMAGE_ANALYSIS_PROMPTS else "general"
+    cache = get_vision_cache()
+    variant = cache.variant(prompt_key, IMAGE_ANALYSIS_PROMPT_VERSION, VISION_MODEL)
+    content_key = cache.content_key(fp.digest if fp else None, image_url)
+    phash, color = (fp.phash, fp.color) if fp else (None, None)
+    cached = cache.get(content_key, variant, phash, color)
+    if cached is not None:
+        print(f"[image_analysis_tool] 命中分析缓存: {prompt_key}")
+        return cached, True
+    
+    # 创建 LLM 客户端，使用视觉模型
+    llm_client = LLMClient(ctx=new_context(method="image_analysis"))
+    
+    # 构建消息
+    messages = [
+        SystemMessage(content=IMAGE_ANALYSIS_PROMPTS[prompt_key]),
+        HumanMessage(content=[
+            {
+                "type": "text",
+                "text": "请详细分析这张产品图片，并按照上述要求返回结构化的JSON格式结果。"
+            },
+            {
+                "type": "image_url",
+                "image_url": {
+                    "url": processed_image_url
+                }
+            }
+        ])
+    ]
+    
+    # 调用视觉模型
+    print(f"[image_analysis_tool] 开始调用视觉模型...")
+    if not get_rate_limiter("vision").acquire(timeout=remaining_time()):
+        raise DeadlineExceeded("deadline exceeded waiting for vision rate limit")
+    response = get_circuit_breaker("vision").call(
+        llm_client.invoke,
+        messages=messages,
+        model=VISION_MODEL,
+        temperature=0.7,
+        max_completion_tokens=4096
+    )
+    
+    analysis_text = _get_text_content(response.content)
+    print(f"[image_analysis_tool] 提取的分析文本长度: {len(analysis_text) if analysis_text else 0}")
+    
+    # 如果分析文本为空，返回友好的错误
+    if not analysis_text or len(analysis_text.strip()) == 0:
+        error_msg = "模型未能生成分析结果，可能是图片质量问题或服务异常。请尝试：\n1. 使用更清晰的图片\n2. 减小图片大小\n3. 稍后重试"
+        print(f"[image_analysis_tool] 分析结果为空")
+        raise Exception(error_msg)
+    
+    cache.set(content_key, variant, analysis_text, phash, color)
+    return analysis_text, False
+
+def _run_image_analysis(image_url: str, analysis_type: str) -> str:
+    """执行图片分析，参数同 image_analysis_tool"""
+    try:
+        processed_image_url, fp = _load_image_for_vision(image_url)
+        analysis_text, cached = _analyze_image(processed_image_url, fp, image_url, analysis_type)
         
-        system_prompt = system_prompts.get(analysis_type, system_prompts["general"])
+        # 构建输出结果
+        output = {
+            "analysis_type": analysis_type,
+            "image_url": image_url,
+            "analysis_result": analysis_text,
+            "model": VISION_MODEL,
+            "cached": cached,
+            "timestamp": "当前时间"
+        }
         
-        # 构建消息
-        messages = [
-            SystemMessage(content=system_prompt),
-            HumanMessage(content=[
-                {
-                    "type": "text",
-                    "text": "请详细分析这张产品图片，并按照上述要求返回结构化的JSON格式结果。"
-                },
-                {
-                    "type": "image_url",
-                    "image_url": {
-                        "url": processed_image_url
-                    }
-                }
-            ])
-        ]
+        print(f"[image_analysis_tool] 返回结果，总大小: {len(json.dumps(output))} 字符")
+        return json.dumps(output, ensure_ascii=False, indent=2)
         
-        # 调用视觉模型
-        print(f"[image_analysis_tool] 开始调用视觉模型...")
-        response = llm_client.invoke(
-            messages=messages,
-            model="doubao-seed-1-6-vision-250815",
-            temperature=0.7,
-            max_completion_tokens=4096
+    except Exception as e:
+        import traceback
+        error_details = traceback.format_exc()
+        return f"图片分析失败: {str(e)}\n详细信息: {error_details}"
+
+def _run_multi_image_analysis(image_url: str, analysis_types: List[str]) -> str:
+    """
+    对同一张图片执行多种分析
+
+    图片只读取和预处理一次，各分析类型共用处理后的图片并发调用视觉模型，
+    每种类型仍单独缓存，已缓存的类型不再请求模型
+    """
+    try:
+        processed_image_url, fp = _load_image_for_vision(image_url)
+        outcomes = run_all_with_deadline(
+            "image_analysis",
+            lambda analysis_type: _analyze_image(processed_image_url, fp, image_url, analysis_type),
+            analysis_types,
         )
-        print(f"[image_analysis_tool] 视觉模型响应: type={type(response)}, content type={type(response.content)}")
         
-        # 安全地提取响应内容
-        def get_text_content(content):
-            """安全地从 AIMessage content 中提取文本"""
-            print(f"[image_analysis_tool] get_text_content 输入: type={type(content)}")
-            if isinstance(content, str):
-                print(f"[image_analysis_tool] 返回字符串内容，长度: {len(content)}")
-                return content
-            elif isinstance(content, list):
-                print(f"[image_analysis_tool] 返回列表内容，元素数: {len(content)}")
-                text_parts = []
-                for i, item in enumerate(content):
-                    print(f"[image_analysis_tool]   item {i}: type={type(item)}")
-                    if isinstance(item, dict) and item.get("type") == "text":
-                        text_part = item.get("text", "")
-                        text_parts.append(text_part)
-                        print(f"[image_analysis_tool]   item {i} text 长度: {len(text_part)}")
-                result = " ".join(text_parts)
-                print(f"[image_analysis_tool] 拼接后长度: {len(result)}")
-                return result
+        results = {}
+        for analysis_type, outcome in zip(analysis_types, outcomes):
+            if isinstance(outcome, Exception):
+                print(f"[image_analysis_tool] {analysis_type} 分析失败: {outcome}")
+                results[analysis_type] = {"error": str(outcome)}
             else:
-                print(f"[image_analysis_tool] 返回字符串化内容")
-                return str(content)
-        
-        analysis_text = get_text_content(response.content)
-        print(f"[image_analysis_tool] 提取的分析文本长度: {len(analysis_text) if analysis_text else 0}")
+                analysis_text, cached = outcome
+                results[analysis_type] = {"analysis_result": analysis_text, "cached": cached}
+        if all("error" in result for result in results.values()):
+            raise Exception("; ".join(f"{t}: {r['error']}" for t, r in results.items()))
         
-        # 如果分析文本为空，返回友好的错误
-        if not analysis_text or len(analysis_text.strip()) == 0:
-            error_msg = "模型未能生成分析结果，可能是图片质量问题或服务异常。请尝试：\n1. 使用更清晰的图片\n2. 减小图片大小\n3. 稍后重试"
-            print(f"[image_analysis_tool] 分析结果为空")
-            raise Exception(error_msg)
-        
-        # 构建输出结果
         output = {
-            "analysis_type": analysis_type,
+            "analysis_types": analysis_types,
             "image_url": image_url,
-            "analysis_result": analysis_text,
-            "model": "doubao-seed-1-6-vision-250815",
+            "results": results,
+            "model": VISION_MODEL,
             "timestamp": "当前时间"
         }
         
-        print(f"[image_analysis_tool] 返回结果，总大小: {len(json.dumps(output))} 字符")
+        print(f"[image_analysis_tool] 返回 {len(results)} 种分析结果，总大小: {len(json.dumps(output))} 字符")
         return json.dumps(output, ensure_ascii=False, indent=2)
         
     except Exception as e:
@@ -504,18 +534,12 @@ def competitor_analysis_tool(category: str, platform: str = "淘宝") -> str:
         竞品分析结果的JSON格式字符串
     """
     try:
-        from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
-
-        # 设置超时时间
-        SEARCH_TIMEOUT = 12
-
         def search_competitors():
             # 构建搜索关键词
             search_query = f"{platform} {category} 销量排行"
 
             # 使用网络搜索获取竞品信息
-            ctx = new_context(method="search.competitor")
-            client = SearchClient(ctx=ctx)
+            client = get_search_client("search.competitor")
 
             response = client.web_search(
                 query=search_query,
@@ -529,24 +553,24 @@ def competitor_analysis_tool(category: str, platform: str = "淘宝") -> str:
         ai_summary = ""
 
         try:
-            with ThreadPoolExecutor(max_workers=1) as executor:
-                future = executor.submit(search_competitors)
-                response = future.result(timeout=SEARCH_TIMEOUT)
-
-                # 分析搜索结果
-                if response.web_items:
-                    for item in response.web_items[:8]:  # 只取前8个
-                        competitor = {
-                            "title": item.title,
-                            "url": item.url,
-                            "site_name": item.site_name,
-                            "snippet": item.snippet
-                        }
-                        competitors.append(competitor)
-
-                ai_summary = response.summary if hasattr(response, 'summary') else ""
-        except FutureTimeoutError:
+            response = run_with_deadline("competitor_analysis", search_competitors)
+
+            # 分析搜索结果
+            if response.web_items:
+                for item in response.web_items[:8]:  # 只取前8个
+                    competitor = {
+                        "title": item.title,
+                        "url": item.url,
+                        "site_name": item.site_name,
+                        "snippet": item.snippet
+                    }
+                    competitors.append(competitor)
+
+            ai_summary = response.summary if hasattr(response, 'summary') else ""
+        except DeadlineExceeded:
             ai_summary = "搜索超时，仅返回部分结果"
+        except CircuitOpenError:
+            ai_summary = "搜索服务暂时不可用（已熔断），请稍后重试"
         except Exception as e:
             ai_summary = f"搜索出错: {str(e)}"
 
@@ -581,18 +605,12 @@ def trend_analysis_tool(category: str, time_range: str = "1m") -> str:
         趋势分析结果的JSON格式字符串
     """
     try:
-        from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
-
-        # 设置超时时间
-        SEARCH_TIMEOUT = 12
-
         def search_trends():
             # 构建搜索关键词
             search_query = f"{category} 热销趋势 增长率"
 
             # 使用网络搜索获取趋势信息
-            ctx = new_context(method="search.trend")
-            client = SearchClient(ctx=ctx)
+            client = get_search_client("search.trend")
 
             response = client.search(
                 query=search_query,
@@ -608,25 +626,25 @@ def trend_analysis_tool(category: str, time_range: str = "1m") -> str:
         trend_summary = ""
 
         try:
-            with ThreadPoolExecutor(max_workers=1) as executor:
-                future = executor.submit(search_trends)
-                response = future.result(timeout=SEARCH_TIMEOUT)
-
-                # 提取趋势信息
-                if response.web_items:
-                    for item in response.web_items[:6]:  # 只取前6个
-                        trend_item = {
-                            "title": item.title,
-                            "url": item.url,
-                            "site_name": item.site_name,
-                            "snippet": item.snippet,
-                            "publish_time": item.publish_time if hasattr(item, 'publish_time') else ""
-                        }
-                        results.append(trend_item)
-
-                trend_summary = response.summary if hasattr(response, 'summary') else ""
-        except FutureTimeoutError:
+            response = run_with_deadline("trend_analysis", search_trends)
+
+            # 提取趋势信息
+            if response.web_items:
+                for item in response.web_items[:6]:  # 只取前6个
+                    trend_item = {
+                        "title": item.title,
+                        "url": item.url,
+                        "site_name": item.site_name,
+                        "snippet": item.snippet,
+                        "publish_time": item.publish_time if hasattr(item, 'publish_time') else ""
+                    }
+                    results.append(trend_item)
+
+            trend_summary = response.summary if hasattr(response, 'summary') else ""
+        except DeadlineExceeded:
             trend_summary = "搜索超时，仅返回部分结果"
+        except CircuitOpenError:
+            trend_summary = "搜索服务暂时不可用（已熔断），请稍后重试"
         except Exception as e:
             trend_summary = f"搜索出错: {str(e)}"
 
@@ -662,11 +680,6 @@ def supplier_evaluation_tool(category: str, region: str = None, min_price: float
         供应商评估结果的JSON格式字符串
     """
     try:
-        from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
-
-        # 设置超时时间
-        SEARCH_TIMEOUT = 12
-
         def search_suppliers():
             # 构建搜索关键词
             search_parts = [category, "供应商", "批发"]
@@ -678,8 +691,7 @@ def supplier_evaluation_tool(category: str, region: str = None, min_price: float
             search_query = " ".join(search_parts)
 
             # 使用网络搜索获取供应商信息
-            ctx = new_context(method="search.supplier")
-            client = SearchClient(ctx=ctx)
+            client = get_search_client("search.supplier")
 
             response = client.web_search(
                 query=search_query,
@@ -693,25 +705,25 @@ def supplier_evaluation_tool(category: str, region: str = None, min_price: float
         evaluation_summary = ""
 
         try:
-            with ThreadPoolExecutor(max_workers=1) as executor:
-                future = executor.submit(search_suppliers)
-                response = future.result(timeout=SEARCH_TIMEOUT)
-
-                # 提取供应商信息
-                if response.web_items:
-                    for item in response.web_items[:8]:  # 只取前8个
-                        supplier = {
-                            "title": item.title,
-                            "url": item.url,
-                            "site_name": item.site_name,
-                            "snippet": item.snippet,
-                            "summary": item.summary if hasattr(item, 'summary') else ""
-                        }
-                        suppliers.append(supplier)
-
-                evaluation_summary = response.summary if hasattr(response, 'summary') else ""
-        except FutureTimeoutError:
+            response = run_with_deadline("supplier_evaluation", search_suppliers)
+
+            # 提取供应商信息
+            if response.web_items:
+                for item in response.web_items[:8]:  # 只取前8个
+                    supplier = {
+                        "title": item.title,
+                        "url": item.url,
+                        "site_name": item.site_name,
+                        "snippet": item.snippet,
+                        "summary": item.summary if hasattr(item, 'summary') else ""
+                    }
+                    suppliers.append(supplier)
+
+            evaluation_summary = response.summary if hasattr(response, 'summary') else ""
+        except DeadlineExceeded:
             evaluation_summary = "搜索超时，仅返回部分结果"
+        except CircuitOpenError:
+            evaluation_summary = "搜索服务暂时不可用（已熔断），请稍后重试"
         except Exception as e:
             evaluation_summary = f"搜索出错: {str(e)}"
 
@@ -732,14 +744,58 @@ def supplier_evaluation_tool(category: str, region: str = None, min_price: float
         error_details = traceback.format_exc()
         return f"供应商评估失败: {str(e)}\n详细信息: {error_details}"
 
-@tool
-def save_supplier_to_db(name: str, company_name: str = None, contact_person: str = None,
+def db_tool(error_label: str, retries: int = 0):
+    """
+    数据库工具装饰器：被装饰函数的第一个参数是同步 Session，其余参数作为工具参数
+
+    同步调用（graph.stream）时在连接池会话中执行；异步调用（graph.astream）时通过
+    AsyncSession.run_sync 在异步引擎上执行同一个函数，SQL 经异步驱动发出，不占用线程池。
+    异常统一转为 "<error_label>: ..." 文本返回给模型
+
+    Args:
+        error_label: 失败时返回文本的前缀，如 "查询供应商失败"
+        retries: 连接类错误的重试次数
+    """
+    def decorator(fn):
+        signature = inspect.signature(fn)
+        params = list(signature.parameters.values())[1:]
+        annotations = {k: v for k, v in fn.__annotations__.items()
+                       if k == "return" or k in {p.name for p in params}}
+
+        def _error(e: Exception) -> str:
+            import traceback
+            error_details = traceback.format_exc()
+            return f"{error_label}: {str(e)}\n详细信息: {error_details}"
+
+        def func(**kwargs) -> str:
+            try:
+                return execute_with_retry(lambda db: fn(db, **kwargs), max_retries=retries, retry_delay=1)
+            except Exception as e:
+                return _error(e)
+
+        async def coroutine(**kwargs) -> str:
+            try:
+                return await aexecute_with_retry(lambda db: fn(db, **kwargs), max_retries=retries, retry_delay=1)
+            except Exception as e:
+                return _error(e)
+
+        for wrapper in (func, coroutine):
+            wrapper.__name__ = fn.__name__
+            wrapper.__doc__ = fn.__doc__
+            wrapper.__signature__ = signature.replace(parameters=params)
+            wrapper.__annotations__ = annotations
+        return StructuredTool.from_function(func=func, coroutine=coroutine)
+
+    return decorator
+
+@db_tool("保存供应商失败", retries=3)
+def save_supplier_to_db(db: Session, name: str, company_name: str = None, contact_person: str = None,
                         contact_phone: str = None, region: str = None, platform: str = None,
                         platform_url: str = None, min_order_quantity: int = None,
-                        is_verified: bool = False, rating: float = None,
+                        is_verified: bool = None, rating: float = None,
                         categories: list = None, tags: list = None, notes: str = None) -> str:
     """
-    将供应商信息保存到数据库。
+    将供应商信息保存到数据库。名称 + 平台相同的供应商已存在时更新其信息，只覆盖本次提供的字段。
     
     Args:
         name: 供应商名称（必填）
@@ -750,7 +806,7 @@ def save_supplier_to_db(name: str, company_name: str = None, contact_person: str
         platform: 主要平台（如1688、阿里巴巴等）
         platform_url: 平台店铺URL
         min_order_quantity: 最小起订量
-        is_verified: 是否为认证供应商
+        is_verified: 是否为认证供应商（新建时默认否）
         rating: 评分（0-5分）
         categories: 经营的品类列表
         tags: 标签列表
@@ -759,47 +815,38 @@ def save_supplier_to_db(name: str, company_name: str = None, contact_person: str
     Returns:
         保存结果的JSON格式字符串
     """
-    try:
-        def save_supplier(db):
-            mgr = SupplierManager()
-            supplier_in = SupplierCreate(
-                name=name,
-                company_name=company_name,
-                contact_person=contact_person,
-                contact_phone=contact_phone,
-                region=region,
-                platform=platform,
-                platform_url=platform_url,
-                min_order_quantity=min_order_quantity,
-                is_verified=is_verified,
-                rating=rating,
-                categories=categories or [],
-                tags=tags or [],
-                notes=notes,
-                source="智能体搜索"
-            )
-            supplier = mgr.create_supplier(db, supplier_in)
-            db.refresh(supplier)  # 刷新以获取ID
-            return {
-                "id": supplier.id,
-                "name": supplier.name
-            }
-        
-        supplier_data = execute_with_retry(save_supplier, max_retries=3, retry_delay=1)
-
-        result = {
-            "success": True,
-            "supplier_id": supplier_data["id"],
-            "message": f"供应商'{name}'已成功保存到数据库"
-        }
-        return json.dumps(result, ensure_ascii=False, indent=2)
-    except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        return f"保存供应商失败: {str(e)}\n详细信息: {error_details}"
-
-@tool
-def save_product_to_db(supplier_id: int, name: str, category: str = None,
+    mgr = SupplierManager()
+    fields = dict(
+        company_name=company_name,
+        contact_person=contact_person,
+        contact_phone=contact_phone,
+        region=region,
+        platform=platform,
+        platform_url=platform_url,
+        min_order_quantity=min_order_quantity,
+        is_verified=is_verified,
+        rating=rating,
+        categories=categories,
+        tags=tags,
+        notes=notes,
+    )
+    # 只传入提供的字段，更新已存在的供应商时未提供的字段保持不变
+    supplier_in = SupplierCreate(
+        name=name, source="智能体搜索", **{k: v for k, v in fields.items() if v is not None}
+    )
+    supplier, created = mgr.upsert_supplier(db, supplier_in)
+
+    result = {
+        "success": True,
+        "supplier_id": supplier.id,
+        "created": created,
+        "message": f"供应商'{name}'已成功保存到数据库" if created
+                   else f"供应商'{name}'已存在，已更新本次提供的信息"
+    }
+    return json.dumps(result, ensure_ascii=False, indent=2)
+
+@db_tool("保存产品失败", retries=3)
+def save_product_to_db(db: Session, supplier_id: int, name: str, category: str = None,
                        purchase_price: float = None, estimated_price: float = None,
                        logistics_cost: float = 0, min_order_quantity: int = None,
                        potential_score: int = None, image_urls: list = None,
@@ -823,129 +870,92 @@ def save_product_to_db(supplier_id: int, name: str, category: str = None,
     Returns:
         保存结果的JSON格式字符串
     """
-    try:
-        def save_product(db):
-            mgr = SupplierManager()
-            product_in = ProductCreate(
-                supplier_id=supplier_id,
-                name=name,
-                category=category,
-                purchase_price=purchase_price,
-                estimated_price=estimated_price,
-                logistics_cost=logistics_cost,
-                min_order_quantity=min_order_quantity,
-                potential_score=potential_score,
-                image_urls=image_urls or [],
-                product_url=product_url,
-                notes=notes
-            )
-            product = mgr.create_product(db, product_in)
-            db.refresh(product)  # 刷新以获取ID
-            return {
-                "id": product.id,
-                "name": product.name,
-                "profit_margin": product.profit_margin,
-                "roi": product.roi
-            }
-        
-        product_data = execute_with_retry(save_product, max_retries=3, retry_delay=1)
-
-        result = {
-            "success": True,
-            "product_id": product_data["id"],
-            "supplier_id": supplier_id,
-            "profit_margin": product_data["profit_margin"],
-            "roi": product_data["roi"],
-            "message": f"产品'{name}'已成功保存到数据库"
-        }
-        return json.dumps(result, ensure_ascii=False, indent=2)
-    except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        return f"保存产品失败: {str(e)}\n详细信息: {error_details}"
-
-@tool
-def query_suppliers_from_db(category: str = None, region: str = None, platform: str = None,
+    mgr = SupplierManager()
+    product_in = ProductCreate(
+        supplier_id=supplier_id,
+        name=name,
+        category=category,
+        purchase_price=purchase_price,
+        estimated_price=estimated_price,
+        logistics_cost=logistics_cost,
+        min_order_quantity=min_order_quantity,
+        potential_score=potential_score,
+        image_urls=image_urls or [],
+        product_url=product_url,
+        notes=notes
+    )
+    product = mgr.create_product(db, product_in)
+
+    result = {
+        "success": True,
+        "product_id": product.id,
+        "supplier_id": supplier_id,
+        "profit_margin": product.profit_margin,
+        "roi": product.roi,
+        "message": f"产品'{name}'已成功保存到数据库"
+    }
+    return json.dumps(result, ensure_ascii=False, indent=2)
+
+@db_tool("查询供应商失败")
+def query_suppliers_from_db(db: Session, category: str = None, region: str = None, platform: str = None,
                             min_price: float = None, max_price: float = None,
-                            limit: int = 20) -> str:
+                            limit: int = 20, cursor: str = None) -> str:
     """
     从数据库查询供应商信息。
     
     Args:
-        category: 产品品类
+        category: 产品品类（匹配供应商经营品类列表中的某一项）
         region: 地区
         platform: 平台
         min_price: 最低价格
         max_price: 最高价格
         limit: 返回数量限制，默认20
+        cursor: 翻页游标，传入上一次结果中的 next_cursor 获取下一页
     
     Returns:
-        查询结果的JSON格式字符串
+        查询结果的JSON格式字符串，还有更多结果时包含 next_cursor
     """
-    try:
-        db = get_session()
-        try:
-            mgr = SupplierManager()
-            suppliers = mgr.search_suppliers(
-                db=db,
-                category=category,
-                region=region,
-                platform=platform,
-                min_price=min_price,
-                max_price=max_price,
-                skip=0,
-                limit=limit
-            )
-            
-            suppliers_data = []
-            for sup in suppliers:
-                # 处理JSON字段
-                categories_data = []
-                if sup.categories is not None:
-                    try:
-                        categories_data = json.loads(sup.categories)
-                    except:
-                        categories_data = []
-                
-                tags_data = []
-                if sup.tags is not None:
-                    try:
-                        tags_data = json.loads(sup.tags)
-                    except:
-                        tags_data = []
-                
-                sup_data = {
-                    "id": sup.id,
-                    "name": sup.name,
-                    "company_name": sup.company_name,
-                    "contact_person": sup.contact_person,
-                    "contact_phone": sup.contact_phone,
-                    "region": sup.region,
-                    "platform": sup.platform,
-                    "platform_url": sup.platform_url,
-                    "min_order_quantity": sup.min_order_quantity,
-                    "is_verified": sup.is_verified,
-                    "rating": sup.rating,
-                    "categories": categories_data,
-                    "tags": tags_data,
-                    "status": sup.status
-                }
-                suppliers_data.append(sup_data)
-            
-            result = {
-                "total": len(suppliers_data),
-                "suppliers": suppliers_data
-            }
-            return json.dumps(result, ensure_ascii=False, indent=2)
-        finally:
-            db.close()
-    except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        return f"查询供应商失败: {str(e)}\n详细信息: {error_details}"
-
-@tool
-def save_trend_to_db(category: str, platform: str = None, growth_rate: float = None,
+    mgr = SupplierManager()
+    suppliers = mgr.search_suppliers(
+        db=db,
+        category=category,
+        region=region,
+        platform=platform,
+        min_price=min_price,
+        max_price=max_price,
+        limit=limit,
+        cursor=cursor
+    )
+    
+    suppliers_data = []
+    for sup in suppliers:
+        sup_data = {
+            "id": sup.id,
+            "name": sup.name,
+            "company_name": sup.company_name,
+            "contact_person": sup.contact_person,
+            "contact_phone": sup.contact_phone,
+            "region": sup.region,
+            "platform": sup.platform,
+            "platform_url": sup.platform_url,
+            "min_order_quantity": sup.min_order_quantity,
+            "is_verified": sup.is_verified,
+            "rating": sup.rating,
+            "categories": json_value(sup.categories, []),
+            "tags": json_value(sup.tags, []),
+            "status": sup.status
+        }
+        suppliers_data.append(sup_data)
+    
+    result = {
+        "total": len(suppliers_data),
+        "suppliers": suppliers_data,
+        "next_cursor": next_cursor(suppliers, Supplier.created_at, limit)
+    }
+    return json.dumps(result, ensure_ascii=False, indent=2)
+
+@db_tool("保存趋势数据失败")
+def save_trend_to_db(db: Session, category: str, platform: str = None, growth_rate: float = None,
                      hot_keywords: list = None, summary: str = None,
                      trend_type: str = "monthly") -> str:
     """
@@ -962,37 +972,29 @@ def save_trend_to_db(category: str, platform: str = None, growth_rate: float = N
     Returns:
         保存结果的JSON格式字符串
     """
-    try:
-        from datetime import datetime
-        db = get_session()
-        try:
-            mgr = SupplierManager()
-            trend_in = MarketTrendCreate(
-                category=category,
-                platform=platform,
-                growth_rate=growth_rate,
-                hot_keywords=hot_keywords or [],
-                summary=summary,
-                trend_type=trend_type,
-                data_date=datetime.now()
-            )
-            trend = mgr.create_market_trend(db, trend_in)
-            
-            result = {
-                "success": True,
-                "trend_id": trend.id,
-                "message": f"趋势数据'{category}'已成功保存到数据库"
-            }
-            return json.dumps(result, ensure_ascii=False, indent=2)
-        finally:
-            db.close()
-    except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        return f"保存趋势数据失败: {str(e)}\n详细信息: {error_details}"
-
-@tool
-def query_trends_from_db(category: str = None, platform: str = None, limit: int = 10) -> str:
+    from datetime import datetime
+    mgr = SupplierManager()
+    trend_in = MarketTrendCreate(
+        category=category,
+        platform=platform,
+        growth_rate=growth_rate,
+        hot_keywords=hot_keywords or [],
+        summary=summary,
+        trend_type=trend_type,
+        data_date=datetime.now()
+    )
+    trend = mgr.create_market_trend(db, trend_in)
+    
+    result = {
+        "success": True,
+        "trend_id": trend.id,
+        "message": f"趋势数据'{category}'已成功保存到数据库"
+    }
+    return json.dumps(result, ensure_ascii=False, indent=2)
+
+@db_tool("查询趋势数据失败")
+def query_trends_from_db(db: Session, category: str = None, platform: str = None, limit: int = 10,
+                         cursor: str = None) -> str:
     """
     从数据库查询市场趋势数据。
     
@@ -1000,63 +1002,48 @@ def query_trends_from_db(category: str = None, platform: str = None, limit: int
         category: 品类
         platform: 平台
         limit: 返回数量限制，默认10
+        cursor: 翻页游标，传入上一次结果中的 next_cursor 获取下一页
     
     Returns:
-        查询结果的JSON格式字符串
+        查询结果的JSON格式字符串，还有更多结果时包含 next_cursor
     """
-    try:
-        db = get_session()
-        try:
-            mgr = SupplierManager()
-            trends = mgr.get_market_trends(
-                db=db,
-                category=category,
-                platform=platform,
-                skip=0,
-                limit=limit
-            )
-            
-            trends_data = []
-            for trend in trends:
-                # 处理JSON字段
-                hot_keywords_data = []
-                if trend.hot_keywords is not None:
-                    try:
-                        hot_keywords_data = json.loads(trend.hot_keywords)
-                    except:
-                        hot_keywords_data = []
-                
-                # 处理日期字段
+    mgr = SupplierManager()
+    trends = mgr.get_market_trends(
+        db=db,
+        category=category,
+        platform=platform,
+        limit=limit,
+        cursor=cursor
+    )
+    
+    trends_data = []
+    for trend in trends:
+        # 处理日期字段
+        data_date_str = None
+        if trend.data_date is not None:
+            try:
+                data_date_str = trend.data_date.isoformat()
+            except:
                 data_date_str = None
-                if trend.data_date is not None:
-                    try:
-                        data_date_str = trend.data_date.isoformat()
-                    except:
-                        data_date_str = None
-                
-                trend_data = {
-                    "id": trend.id,
-                    "category": trend.category,
-                    "platform": trend.platform,
-                    "growth_rate": trend.growth_rate,
-                    "hot_keywords": hot_keywords_data,
-                    "summary": trend.summary,
-                    "trend_type": trend.trend_type,
-                    "data_date": data_date_str
-                }
-                trends_data.append(trend_data)
-            
-            result = {
-                "total": len(trends_data),
-                "trends": trends_data
-            }
-            return json.dumps(result, ensure_ascii=False, indent=2)
-        finally:
-            db.close()
-    except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        return f"查询趋势数据失败: {str(e)}\n详细信息: {error_details}"
+        
+        trend_data = {
+            "id": trend.id,
+            "category": trend.category,
+            "platform": trend.platform,
+            "growth_rate": trend.growth_rate,
+            "hot_keywords": json_value(trend.hot_keywords, []),
+            "summary": trend.summary,
+            "trend_type": trend.trend_type,
+            "data_date": data_date_str
+        }
+        trends_data.append(trend_data)
+    
+    result = {
+        "total": len(trends_data),
+        "trends": trends_data,
+        "next_cursor": next_cursor(trends, MarketTrend.data_date, limit)
+    }
+    return json.dumps(result, ensure_ascii=False, indent=2)
 
 @tool
 def search_1688_tool(keyword: str, category: str = None, min_price: float = None,
@@ -1075,14 +1062,9 @@ def search_1688_tool(keyword: str, category: str = None, min_price: float = None
         1688搜索结果的JSON格式字符串
     """
     try:
-        from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
-
         # 限制返回结果数量
         count = min(count, 20)
 
-        # 设置超时时间
-        SEARCH_TIMEOUT = 12
-
         def search_1688():
             # 构建搜索查询
             search_parts = ["1688", keyword]
@@ -1094,8 +1076,7 @@ def search_1688_tool(keyword: str, category: str = None, min_price: float = None
 
             search_query = " ".join(search_parts)
 
-            ctx = new_context(method="search.1688")
-            client = SearchClient(ctx=ctx)
+            client = get_search_client("search.1688")
 
             response = client.search(
                 query=search_query,
@@ -1111,24 +1092,24 @@ def search_1688_tool(keyword: str, category: str = None, min_price: float = None
         ai_summary = ""
 
         try:
-            with ThreadPoolExecutor(max_workers=1) as executor:
-                future = executor.submit(search_1688)
-                response = future.result(timeout=SEARCH_TIMEOUT)
-
-                if response.web_items:
-                    for item in response.web_items:
-                        result = {
-                            "title": item.title,
-                            "url": item.url,
-                            "snippet": item.snippet,
-                            "site_name": item.site_name,
-                            "summary": item.summary if hasattr(item, 'summary') else ""
-                        }
-                        results.append(result)
-
-                ai_summary = response.summary if hasattr(response, 'summary') else ""
-        except FutureTimeoutError:
+            response = run_with_deadline("search_1688", search_1688)
+
+            if response.web_items:
+                for item in response.web_items:
+                    result = {
+                        "title": item.title,
+                        "url": item.url,
+                        "snippet": item.snippet,
+                        "site_name": item.site_name,
+                        "summary": item.summary if hasattr(item, 'summary') else ""
+                    }
+                    results.append(result)
+
+            ai_summary = response.summary if hasattr(response, 'summary') else ""
+        except DeadlineExceeded:
             ai_summary = "搜索超时，仅返回部分结果"
+        except CircuitOpenError:
+            ai_summary = "搜索服务暂时不可用（已熔断），请稍后重试"
         except Exception as e:
             ai_summary = f"搜索出错: {str(e)}"
 
@@ -1165,14 +1146,9 @@ def search_alibaba_tool(keyword: str, category: str = None, min_price: float = N
         阿里巴巴搜索结果的JSON格式字符串
     """
     try:
-        from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
-
         # 限制返回结果数量
         count = min(count, 20)
 
-        # 设置超时时间
-        SEARCH_TIMEOUT = 12
-
         def search_alibaba():
             search_parts = ["alibaba", keyword]
             if category:
@@ -1183,8 +1159,7 @@ def search_alibaba_tool(keyword: str, category: str = None, min_price: float = N
 
             search_query = " ".join(search_parts)
 
-            ctx = new_context(method="search.alibaba")
-            client = SearchClient(ctx=ctx)
+            client = get_search_client("search.alibaba")
 
             response = client.search(
                 query=search_query,
@@ -1200,24 +1175,24 @@ def search_alibaba_tool(keyword: str, category: str = None, min_price: float = N
         ai_summary = ""
 
         try:
-            with ThreadPoolExecutor(max_workers=1) as executor:
-                future = executor.submit(search_alibaba)
-                response = future.result(timeout=SEARCH_TIMEOUT)
-
-                if response.web_items:
-                    for item in response.web_items:
-                        result = {
-                            "title": item.title,
-                            "url": item.url,
-                            "snippet": item.snippet,
-                            "site_name": item.site_name,
-                            "summary": item.summary if hasattr(item, 'summary') else ""
-                        }
-                        results.append(result)
-
-                ai_summary = response.summary if hasattr(response, 'summary') else ""
-        except FutureTimeoutError:
+            response = run_with_deadline("search_alibaba", search_alibaba)
+
+            if response.web_items:
+                for item in response.web_items:
+                    result = {
+                        "title": item.title,
+                        "url": item.url,
+                        "snippet": item.snippet,
+                        "site_name": item.site_name,
+                        "summary": item.summary if hasattr(item, 'summary') else ""
+                    }
+                    results.append(result)
+
+            ai_summary = response.summary if hasattr(response, 'summary') else ""
+        except DeadlineExceeded:
             ai_summary = "搜索超时，仅返回部分结果"
+        except CircuitOpenError:
+            ai_summary = "搜索服务暂时不可用（已熔断），请稍后重试"
         except Exception as e:
             ai_summary = f"搜索出错: {str(e)}"
 
@@ -1237,8 +1212,8 @@ def search_alibaba_tool(keyword: str, category: str = None, min_price: float = N
         return f"阿里巴巴搜索失败: {str(e)}\n详细信息: {error_details}"
 
 
-@tool
-def save_user_preference(user_id: str, preferred_categories: list = None,
+@db_tool("保存用户偏好失败")
+def save_user_preference(db: Session, user_id: str, preferred_categories: list = None,
                          min_price: float = None, max_price: float = None,
                          preferred_platforms: list = None, preferred_regions: list = None,
                          min_roi: float = None, min_profit_margin: float = None,
@@ -1263,51 +1238,42 @@ def save_user_preference(user_id: str, preferred_categories: list = None,
     Returns:
         保存结果的JSON格式字符串
     """
-    try:
-        db = get_session()
-        try:
-            mgr = SupplierManager()
-            pref = mgr.create_or_update_preference(
-                db=db,
-                user_id=user_id,
-                preferred_categories=preferred_categories,
-                min_price=min_price,
-                max_price=max_price,
-                preferred_platforms=preferred_platforms,
-                preferred_regions=preferred_regions,
-                min_roi=min_roi,
-                min_profit_margin=min_profit_margin,
-                keywords=keywords,
-                exclude_keywords=exclude_keywords,
-                notification_enabled=notification_enabled
-            )
-            
-            result = {
-                "success": True,
-                "user_id": user_id,
-                "message": "用户偏好已成功保存",
-                "preferences": {
-                    "preferred_categories": preferred_categories or [],
-                    "min_price": min_price,
-                    "max_price": max_price,
-                    "preferred_platforms": preferred_platforms or [],
-                    "preferred_regions": preferred_regions or [],
-                    "min_roi": min_roi,
-                    "min_profit_margin": min_profit_margin,
-                    "notification_enabled": notification_enabled
-                }
-            }
-            return json.dumps(result, ensure_ascii=False, indent=2)
-        finally:
-            db.close()
-    except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        return f"保存用户偏好失败: {str(e)}\n详细信息: {error_details}"
+    mgr = SupplierManager()
+    pref = mgr.create_or_update_preference(
+        db=db,
+        user_id=user_id,
+        preferred_categories=preferred_categories,
+        min_price=min_price,
+        max_price=max_price,
+        preferred_platforms=preferred_platforms,
+        preferred_regions=preferred_regions,
+        min_roi=min_roi,
+        min_profit_margin=min_profit_margin,
+        keywords=keywords,
+        exclude_keywords=exclude_keywords,
+        notification_enabled=notification_enabled
+    )
+    
+    result = {
+        "success": True,
+        "user_id": user_id,
+        "message": "用户偏好已成功保存",
+        "preferences": {
+            "preferred_categories": preferred_categories or [],
+            "min_price": min_price,
+            "max_price": max_price,
+            "preferred_platforms": preferred_platforms or [],
+            "preferred_regions": preferred_regions or [],
+            "min_roi": min_roi,
+            "min_profit_margin": min_profit_margin,
+            "notification_enabled": notification_enabled
+        }
+    }
+    return json.dumps(result, ensure_ascii=False, indent=2)
 
 
-@tool
-def get_user_preference(user_id: str) -> str:
+@db_tool("获取用户偏好失败")
+def get_user_preference(db: Session, user_id: str) -> str:
     """
     获取用户的偏好设置。
     
@@ -1317,86 +1283,42 @@ def get_user_preference(user_id: str) -> str:
     Returns:
         用户偏好设置的JSON格式字符串
     """
-    try:
-        db = get_session()
-        try:
-            mgr = SupplierManager()
-            pref = mgr.get_user_preference(db, user_id)
-            
-            if not pref:
-                result = {
-                    "success": False,
-                    "message": "未找到用户偏好设置"
-                }
-                return json.dumps(result, ensure_ascii=False, indent=2)
-            
-            # 解析JSON字段
-            categories = []
-            if pref.preferred_categories is not None:
-                try:
-                    categories = json.loads(pref.preferred_categories)
-                except:
-                    pass
-            
-            platforms = []
-            if pref.preferred_platforms is not None:
-                try:
-                    platforms = json.loads(pref.preferred_platforms)
-                except:
-                    pass
-            
-            regions = []
-            if pref.preferred_regions is not None:
-                try:
-                    regions = json.loads(pref.preferred_regions)
-                except:
-                    pass
-            
-            keywords = []
-            if pref.keywords is not None:
-                try:
-                    keywords = json.loads(pref.keywords)
-                except:
-                    pass
-            
-            exclude_keywords = []
-            if pref.exclude_keywords is not None:
-                try:
-                    exclude_keywords = json.loads(pref.exclude_keywords)
-                except:
-                    pass
-            
-            result = {
-                "success": True,
-                "user_id": user_id,
-                "preferences": {
-                    "preferred_categories": categories,
-                    "min_price": pref.min_price,
-                    "max_price": pref.max_price,
-                    "preferred_platforms": platforms,
-                    "preferred_regions": regions,
-                    "min_roi": pref.min_roi,
-                    "min_profit_margin": pref.min_profit_margin,
-                    "keywords": keywords,
-                    "exclude_keywords": exclude_keywords,
-                    "notification_enabled": pref.notification_enabled
-                },
-                "created_at": pref.created_at.isoformat() if pref.created_at is not None else None,
-                "updated_at": pref.updated_at.isoformat() if pref.updated_at is not None else None
-            }
-            return json.dumps(result, ensure_ascii=False, indent=2)
-        finally:
-            db.close()
-    except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        return f"获取用户偏好失败: {str(e)}\n详细信息: {error_details}"
+    mgr = SupplierManager()
+    pref = mgr.get_user_preference(db, user_id)
+    
+    if not pref:
+        result = {
+            "success": False,
+            "message": "未找到用户偏好设置"
+        }
+        return json.dumps(result, ensure_ascii=False, indent=2)
+    
+    result = {
+        "success": True,
+        "user_id": user_id,
+        "preferences": {
+            "preferred_categories": json_value(pref.preferred_categories, []),
+            "min_price": pref.min_price,
+            "max_price": pref.max_price,
+            "preferred_platforms": json_value(pref.preferred_platforms, []),
+            "preferred_regions": json_value(pref.preferred_regions, []),
+            "min_roi": pref.min_roi,
+            "min_profit_margin": pref.min_profit_margin,
+            "keywords": json_value(pref.keywords, []),
+            "exclude_keywords": json_value(pref.exclude_keywords, []),
+            "notification_enabled": pref.notification_enabled
+        },
+        "created_at": pref.created_at.isoformat() if pref.created_at is not None else None,
+        "updated_at": pref.updated_at.isoformat() if pref.updated_at is not None else None
+    }
+    return json.dumps(result, ensure_ascii=False, indent=2)
 
 
-@tool
-def batch_import_suppliers(suppliers_data: list, source: str = "batch_import") -> str:
+@db_tool("批量导入失败")
+def batch_import_suppliers(db: Session, suppliers_data: list, source: str = "batch_import") -> str:
     """
-    批量导入供应商数据到数据库。
+    批量导入供应商数据到数据库。名称和平台都相同的供应商视为同一供应商，
+    已存在时更新其提供的字段；校验失败的行会在结果的 failed_items 中逐条列出。
     
     Args:
         suppliers_data: 供应商数据列表，每个元素是一个字典，包含供应商信息
@@ -1405,22 +1327,13 @@ def batch_import_suppliers(suppliers_data: list, source: str = "batch_import") -
     Returns:
         批量导入结果的JSON格式字符串
     """
-    try:
-        db = get_session()
-        try:
-            mgr = SupplierManager()
-            result = mgr.batch_import_suppliers(db, suppliers_data, source)
-            return json.dumps(result, ensure_ascii=False, indent=2)
-        finally:
-            db.close()
-    except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        return f"批量导入失败: {str(e)}\n详细信息: {error_details}"
+    mgr = SupplierManager()
+    result = mgr.batch_import_suppliers(db, suppliers_data, source)
+    return json.dumps(result, ensure_ascii=False, indent=2)
 
 
-@tool
-def smart_recommend_products(user_id: str, limit: int = 10) -> str:
+@db_tool("智能推荐失败")
+def smart_recommend_products(db: Session, user_id: str, limit: int = 10) -> str:
     """
     基于用户偏好和历史数据智能推荐产品。
     
@@ -1431,131 +1344,97 @@ def smart_recommend_products(user_id: str, limit: int = 10) -> str:
     Returns:
         产品推荐列表的JSON格式字符串
     """
-    try:
-        db = get_session()
-        try:
-            mgr = SupplierManager()
-            products = mgr.recommend_products(db, user_id, limit)
-            
-            products_data = []
-            for prod in products:
-                # 处理JSON字段
-                image_urls = []
-                if prod.image_urls is not None:
-                    try:
-                        image_urls = json.loads(prod.image_urls)
-                    except:
-                        pass
-                
-                tags = []
-                if prod.tags is not None:
-                    try:
-                        tags = json.loads(prod.tags)
-                    except:
-                        pass
-                
-                # 获取供应商信息
-                supplier = mgr.get_supplier_by_id(db, prod.supplier_id)
-                supplier_name = supplier.name if supplier else "未知"
-                supplier_platform = supplier.platform if supplier else ""
-                
-                prod_data = {
-                    "id": prod.id,
-                    "name": prod.name,
-                    "category": prod.category,
-                    "supplier_id": prod.supplier_id,
-                    "supplier_name": supplier_name,
-                    "supplier_platform": supplier_platform,
-                    "purchase_price": prod.purchase_price,
-                    "estimated_price": prod.estimated_price,
-                    "profit_margin": prod.profit_margin,
-                    "roi": prod.roi,
-                    "potential_score": prod.potential_score,
-                    "image_urls": image_urls,
-                    "tags": tags,
-                    "notes": prod.notes
-                }
-                products_data.append(prod_data)
-            
-            result = {
-                "user_id": user_id,
-                "total": len(products_data),
-                "products": products_data
-            }
-            return json.dumps(result, ensure_ascii=False, indent=2)
-        finally:
-            db.close()
-    except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        return f"智能推荐失败: {str(e)}\n详细信息: {error_details}"
+    mgr = SupplierManager()
+    # 产品和供应商字段一次 JOIN 查询取回
+    rows = mgr.recommend_product_rows(db, user_id, limit)
+    
+    products_data = []
+    for row in rows:
+        prod_data = {
+            "id": row.id,
+            "name": row.name,
+            "category": row.category,
+            "supplier_id": row.supplier_id,
+            "supplier_name": row.supplier_name or "未知",
+            "supplier_platform": row.supplier_platform or "",
+            "purchase_price": row.purchase_price,
+            "estimated_price": row.estimated_price,
+            "profit_margin": row.profit_margin,
+            "roi": row.roi,
+            "potential_score": row.potential_score,
+            "image_urls": json_value(row.image_urls, []),
+            "tags": json_value(row.tags, []),
+            "notes": row.notes
+        }
+        products_data.append(prod_data)
+    
+    result = {
+        "user_id": user_id,
+        "total": len(products_data),
+        "products": products_data
+    }
+    return json.dumps(result, ensure_ascii=False, indent=2)
 
 
-@tool
-def generate_trend_chart(category: str = None, platform: str = None, days: int = 30) -> str:
+@db_tool("生成趋势图表失败")
+def generate_trend_chart(db: Session, category: str = None, platform: str = None, days: int = 30) -> str:
     """
     生成市场趋势图表数据（用于数据可视化）。
     
     Args:
         category: 产品品类
         platform: 平台
-        days: 分析天数，默认30天
+        days: 分析最近多少天，默认30天
     
     Returns:
-        趋势图表数据的JSON格式字符串，包含时间序列数据
+        趋势图表数据的JSON格式字符串，时间序列为每天的平均/最高/最低增长率和记录数
     """
-    try:
-        db = get_session()
-        try:
-            mgr = SupplierManager()
-            
-            # 获取趋势数据
-            trends = mgr.get_market_trends(db, category, platform, skip=0, limit=days)
-            
-            # 生成图表数据
-            chart_data = {
-                "category": category or "所有品类",
-                "platform": platform or "所有平台",
-                "days": days,
-                "time_series": [],
-                "summary": {
-                    "avg_growth_rate": 0,
-                    "max_growth_rate": 0,
-                    "min_growth_rate": 0,
-                    "total_trends": len(trends)
-                }
-            }
-            
-            growth_rates = []
-            for trend in trends:
-                trend_data = {
-                    "date": trend.data_date.isoformat() if trend.data_date is not None else None,
-                    "growth_rate": trend.growth_rate,
-                    "hot_keywords": json.loads(trend.hot_keywords) if trend.hot_keywords is not None else [],
-                    "summary": trend.summary
-                }
-                chart_data["time_series"].append(trend_data)
-                
-                if trend.growth_rate is not None:
-                    growth_rates.append(trend.growth_rate)
-            
-            # 计算统计数据
-            if growth_rates:
-                chart_data["summary"]["avg_growth_rate"] = round(sum(growth_rates) / len(growth_rates), 2)
-                chart_data["summary"]["max_growth_rate"] = round(max(growth_rates), 2)
-                chart_data["summary"]["min_growth_rate"] = round(min(growth_rates), 2)
-            
-            return json.dumps(chart_data, ensure_ascii=False, indent=2)
-        finally:
-            db.close()
-    except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        return f"生成趋势图表失败: {str(e)}\n详细信息: {error_details}"
+    mgr = SupplierManager()
+    
+    # 最近 days 天按天聚合，统计在数据库中完成
+    buckets = mgr.get_trend_series(db, category, platform, days=days)
+    
+    # 生成图表数据
+    chart_data = {
+        "category": category or "所有品类",
+        "platform": platform or "所有平台",
+        "days": days,
+        "time_series": [],
+        "summary": {
+            "avg_growth_rate": 0,
+            "max_growth_rate": 0,
+            "min_growth_rate": 0,
+            "total_trends": sum(bucket.trend_count for bucket in buckets)
+        }
+    }
+    
+    growth_total = 0.0
+    growth_samples = 0
+    for bucket in buckets:
+        day = bucket.day
+        chart_data["time_series"].append({
+            "date": day.date().isoformat() if hasattr(day, "date") else str(day),
+            "avg_growth_rate": round(bucket.avg_growth_rate, 2) if bucket.avg_growth_rate is not None else None,
+            "max_growth_rate": bucket.max_growth_rate,
+            "min_growth_rate": bucket.min_growth_rate,
+            "count": bucket.trend_count
+        })
+        if bucket.growth_samples:
+            growth_total += bucket.avg_growth_rate * bucket.growth_samples
+            growth_samples += bucket.growth_samples
+    
+    # 计算统计数据（由每天的聚合结果合并，不再逐条遍历记录）
+    if growth_samples:
+        rated = [bucket for bucket in buckets if bucket.growth_samples]
+        chart_data["summary"]["avg_growth_rate"] = round(growth_total / growth_samples, 2)
+        chart_data["summary"]["max_growth_rate"] = round(max(b.max_growth_rate for b in rated), 2)
+        chart_data["summary"]["min_growth_rate"] = round(min(b.min_growth_rate for b in rated), 2)
+    
+    return json.dumps(chart_data, ensure_ascii=False, indent=2)
 
 
-@tool
-def get_notifications(user_id: str, is_read: bool = None, limit: int = 20) -> str:
+@db_tool("获取通知失败")
+def get_notifications(db: Session, user_id: str, is_read: bool = None, limit: int = 20, cursor: str = None) -> str:
     """
     获取用户的通知列表。
     
@@ -1563,55 +1442,40 @@ def get_notifications(user_id: str, is_read: bool = None, limit: int = 20) -> st
         user_id: 用户ID（必填）
         is_read: 是否已读（None=全部, True=已读, False=未读）
         limit: 返回数量限制，默认20条
+        cursor: 翻页游标，传入上一次结果中的 next_cursor 获取下一页
     
     Returns:
-        通知列表的JSON格式字符串
+        通知列表的JSON格式字符串，还有更多结果时包含 next_cursor
     """
-    try:
-        db = get_session()
-        try:
-            mgr = SupplierManager()
-            notifications = mgr.get_notifications(db, user_id, is_read, skip=0, limit=limit)
-            
-            notifications_data = []
-            for notif in notifications:
-                # 解析附加数据
-                data = {}
-                if notif.data is not None:
-                    try:
-                        data = json.loads(notif.data)
-                    except:
-                        pass
-                
-                notif_data = {
-                    "id": notif.id,
-                    "notification_type": notif.notification_type,
-                    "title": notif.title,
-                    "content": notif.content,
-                    "data": data,
-                    "priority": notif.priority,
-                    "is_read": notif.is_read,
-                    "created_at": notif.created_at.isoformat() if notif.created_at is not None else None,
-                    "read_at": notif.read_at.isoformat() if notif.read_at is not None else None
-                }
-                notifications_data.append(notif_data)
-            
-            result = {
-                "user_id": user_id,
-                "total": len(notifications_data),
-                "notifications": notifications_data
-            }
-            return json.dumps(result, ensure_ascii=False, indent=2)
-        finally:
-            db.close()
-    except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        return f"获取通知失败: {str(e)}\n详细信息: {error_details}"
+    mgr = SupplierManager()
+    notifications = mgr.get_notifications(db, user_id, is_read, limit=limit, cursor=cursor)
+    
+    notifications_data = []
+    for notif in notifications:
+        notif_data = {
+            "id": notif.id,
+            "notification_type": notif.notification_type,
+            "title": notif.title,
+            "content": notif.content,
+            "data": json_value(notif.data, {}),
+            "priority": notif.priority,
+            "is_read": notif.is_read,
+            "created_at": notif.created_at.isoformat() if notif.created_at is not None else None,
+            "read_at": notif.read_at.isoformat() if notif.read_at is not None else None
+        }
+        notifications_data.append(notif_data)
+    
+    result = {
+        "user_id": user_id,
+        "total": len(notifications_data),
+        "notifications": notifications_data,
+        "next_cursor": next_cursor(notifications, Notification.created_at, limit)
+    }
+    return json.dumps(result, ensure_ascii=False, indent=2)
 
 
-@tool
-def create_trend_notification(user_id: str, category: str, growth_rate: float,
+@db_tool("创建趋势通知失败")
+def create_trend_notification(db: Session, user_id: str, category: str, growth_rate: float,
                                summary: str, hot_keywords: list = None) -> str:
     """
     创建趋势警报通知。
@@ -1626,37 +1490,28 @@ def create_trend_notification(user_id: str, category: str, growth_rate: float,
     Returns:
         通知创建结果的JSON格式字符串
     """
-    try:
-        db = get_session()
-        try:
-            mgr = SupplierManager()
-            notification = mgr.create_trend_alert(
-                db=db,
-                user_id=user_id,
-                category=category,
-                growth_rate=growth_rate,
-                summary=summary,
-                hot_keywords=hot_keywords or []
-            )
-            
-            result = {
-                "success": True,
-                "notification_id": notification.id,
-                "title": notification.title,
-                "priority": notification.priority,
-                "message": "趋势警报通知已创建"
-            }
-            return json.dumps(result, ensure_ascii=False, indent=2)
-        finally:
-            db.close()
-    except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        return f"创建趋势通知失败: {str(e)}\n详细信息: {error_details}"
-
-
-def build_agent(ctx=None):
-    # 获取当前工作目录（兼容本地和云端部署）
+    mgr = SupplierManager()
+    notification = mgr.create_trend_alert(
+        db=db,
+        user_id=user_id,
+        category=category,
+        growth_rate=growth_rate,
+        summary=summary,
+        hot_keywords=hot_keywords or []
+    )
+    
+    result = {
+        "success": True,
+        "notification_id": notification.id,
+        "title": notification.title,
+        "priority": notification.priority,
+        "message": "趋势警报通知已创建"
+    }
+    return json.dumps(result, ensure_ascii=False, indent=2)
+
+
+def resolve_llm_config_path() -> str:
+    """定位 LLM 配置文件路径（兼容本地和云端部署）"""
     # 优先使用当前工作目录，而不是环境变量
     workspace_path = os.getcwd()
     
@@ -1675,9 +1530,99 @@ def build_agent(ctx=None):
             f"COZE_WORKSPACE_PATH: {os.getenv('COZE_WORKSPACE_PATH')}\n"
             f"尝试的路径: {config_path}"
         )
-    
-    with open(config_path, 'r', encoding='utf-8') as f:
-        cfg = json.load(f)
+    return config_path
+
+
+class RequestHeadersMiddleware(AgentMiddleware):
+    """
+    按请求注入 LLM 请求头
+
+    编译后的 Agent 会被多个请求复用，因此不能在构建时把某个请求的
+    default_headers(ctx) 固化到 ChatOpenAI 上。这里在每次模型调用前从
+    run config 的 configurable["request_headers"] 读取当前请求的请求头，
+    通过 extra_headers 传给模型。
+    """
+
+    @staticmethod
+    def _with_headers(request: ModelRequest) -> ModelRequest:
+        headers = get_config().get("configurable", {}).get(REQUEST_HEADERS_KEY)
+        if not headers:
+            return request
+        return request.override(
+            model_settings={**request.model_settings, "extra_headers": headers}
+        )
+
+    def wrap_model_call(self, request, handler):
+        return handler(self._with_headers(request))
+
+    async def awrap_model_call(self, request, handler):
+        return await handler(self._with_headers(request))
+
+
+class ImageReferenceMiddleware(AgentMiddleware):
+    """
+    模型调用前把消息中的 image:// 图片引用解析为签名 URL 或缩放后的 data URL
+
+    检查点中只保存引用，历史消息里的图片不会每轮以完整 base64 重复保存
+    """
+
+    @staticmethod
+    def _resolve(request: ModelRequest) -> ModelRequest:
+        messages = get_image_store().resolve_messages(request.messages)
+        if all(new is old for new, old in zip(messages, request.messages)):
+            return request
+        return request.override(messages=messages)
+
+    def wrap_model_call(self, request, handler):
+        return handler(self._resolve(request))
+
+    async def awrap_model_call(self, request, handler):
+        # 解析会读文件或请求签名 URL，放到线程中执行，不阻塞事件循环
+        return await handler(await asyncio.to_thread(self._resolve, request))
+
+
+class ModelRateLimitMiddleware(AgentMiddleware):
+    """
+    模型调用前获取共享的 llm 配额；异步执行时等待不阻塞事件循环，
+    在截止时间内拿不到配额时抛出 DeadlineExceeded
+    """
+
+    def wrap_model_call(self, request, handler):
+        if not get_rate_limiter("llm").acquire(timeout=remaining_time()):
+            raise DeadlineExceeded("deadline exceeded waiting for llm rate limit")
+        return handler(request)
+
+    async def awrap_model_call(self, request, handler):
+        if not await get_rate_limiter("llm").aacquire(timeout=remaining_time()):
+            raise DeadlineExceeded("deadline exceeded waiting for llm rate limit")
+        return await handler(request)
+
+
+class ModelCircuitBreakerMiddleware(AgentMiddleware):
+    """
+    模型调用经过 llm 熔断器：失败率或慢调用率超限后直接拒绝，
+    熔断期结束后只放行少量探测请求
+    """
+
+    def wrap_model_call(self, request, handler):
+        return get_circuit_breaker("llm").call(handler, request)
+
+    async def awrap_model_call(self, request, handler):
+        return await get_circuit_breaker("llm").acall(handler, request)
+
+
+def build_agent(ctx=None, cfg=None):
+    """
+    构建并编译 Agent
+
+    Args:
+        ctx: 请求上下文。传入时请求头会固化到模型上，仅适用于一次性使用的 Agent；
+            可复用的 Agent 请通过 AgentRegistry 获取，请求头由 RequestHeadersMiddleware 注入
+        cfg: 已解析的 LLM 配置，为 None 时从配置文件读取
+    """
+    if cfg is None:
+        with open(resolve_llm_config_path(), 'r', encoding='utf-8') as f:
+            cfg = json.load(f)
     
     # 使用火山方舟集成获取 API Key
     try:
@@ -1757,4 +1702,9 @@ def build_agent(ctx=None):
         tools=tools,
         checkpointer=get_memory_saver(),
         state_schema=AgentState,
+        middleware=[
+            RequestHeadersMiddleware(), ImageReferenceMiddleware(),
+            # 限流在外、熔断在内：等待本地配额超时不计为模型调用失败
+            ModelRateLimitMiddleware(), ModelCircuitBreakerMiddleware(),
+        ],
     )
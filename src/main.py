@@ -17,6 +17,7 @@ from langgraph.graph.state import CompiledStateGraph
 
 from coze_coding_utils.runtime_ctx.context import new_context, Context
 from utils.helper import graph_helper
+from utils.helper.agent_registry import agent_configurable
 from utils.log.node_log import LOG_FILE
 from utils.log.write_log import setup_logging, request_context
 from utils.log.config import LOG_LEVEL
@@ -24,7 +25,10 @@ from utils.messages.server import (
     create_message_end_dict,
     create_message_error_dict,
     MESSAGE_END_CODE_CANCELED,
+    merge_delta_message_dicts,
 )
+from utils.stream_queue import BackpressureQueue, get_stream_queue_registry
+from utils.metrics import collect_runtime_metrics
 from utils.error import ErrorClassifier, classify_error
 
 setup_logging(
@@ -41,6 +45,7 @@ from utils.helper.agent_helper import (
     to_stream_input,
     to_client_message,
     agent_iter_server_messages,
+    agent_aiter_server_messages,
 )
 from utils.openai.handler import OpenAIChatHandler
 from utils.log.parser import LangGraphParser
@@ -77,7 +82,7 @@ class GraphService:
     def stream(self, payload: Dict[str, Any], run_config: RunnableConfig, ctx=Context) -> Iterable[Any]:
         client_msg, session_id = to_client_message(payload)
         run_config["recursion_limit"] = 100
-        run_config["configurable"] = {"thread_id": session_id}
+        run_config["configurable"] = agent_configurable(session_id, ctx)
         stream_input = to_stream_input(client_msg)
         t0 = time.time()
         try:
@@ -130,10 +135,10 @@ class GraphService:
         logger.info(f"Starting run with run_id: {run_id}")
 
         try:
-            graph = self._get_graph(ctx)
+            graph = await asyncio.to_thread(self._get_graph, ctx)
             # custom tracer
             run_config = init_run_config(graph, ctx)
-            run_config["configurable"] = {"thread_id": ctx.run_id}
+            run_config["configurable"] = agent_configurable(ctx.run_id, ctx)
 
             # 直接调用，LangGraph会在当前任务上下文中执行
             # 如果当前任务被取消，LangGraph的执行也会被取消
@@ -164,7 +169,8 @@ class GraphService:
 
         run_id = ctx.run_id
         logger.info(f"Starting stream with run_id: {run_id}")
-        graph = self._get_graph(ctx)
+        # 首次构建或配置变更后重建 Agent 会读文件、请求凭据，放到线程中执行，不阻塞事件循环
+        graph = await asyncio.to_thread(self._get_graph, ctx)
         if graph_helper.is_agent_proj():
             run_config = init_agent_config(graph, ctx)
         else:
@@ -249,12 +255,80 @@ class GraphService:
     async def astream(self, payload: Dict[str, Any], graph: CompiledStateGraph, run_config: RunnableConfig, ctx=Context) -> AsyncIterable[Any]:
         client_msg, session_id = to_client_message(payload)
         run_config["recursion_limit"] = 100
-        run_config["configurable"] = {"thread_id": session_id}
+        run_config["configurable"] = agent_configurable(session_id, ctx)
         stream_input = to_stream_input(client_msg)
 
-        # 使用后台线程拉取同步流，并通过事件循环安全地推送到异步队列
+        if graph_helper.is_async_stream_mode():
+            items = self._astream_native(client_msg, stream_input, graph, run_config, ctx)
+        else:
+            items = self._astream_thread(client_msg, stream_input, graph, run_config, ctx)
+        async for item in items:
+            yield item
+
+    async def _astream_native(self, client_msg, stream_input: Dict[str, Any], graph: CompiledStateGraph,
+                              run_config: RunnableConfig, ctx=Context) -> AsyncIterable[Any]:
+        """在当前事件循环内用 graph.astream 驱动，不占用额外线程；取消沿 asyncio.Task 直接传递到图执行"""
         loop = asyncio.get_running_loop()
-        q: asyncio.Queue = asyncio.Queue()
+        start_time = time.time()
+        deadline = loop.time() + TIMEOUT_SECONDS
+        last_seq = 0
+
+        items = graph.astream(stream_input, stream_mode="messages", config=run_config, context=ctx)
+        server_msgs_iter = agent_aiter_server_messages(
+            items,
+            session_id=client_msg.session_id,
+            query_msg_id=client_msg.local_msg_id,
+            local_msg_id=client_msg.local_msg_id,
+            run_id=ctx.run_id,
+            log_id=ctx.logid,
+        )
+        try:
+            while True:
+                try:
+                    # 超时只约束图执行，不包含下游消费 yield 的时间
+                    async with asyncio.timeout_at(deadline):
+                        sm = await anext(server_msgs_iter)
+                except StopAsyncIteration:
+                    break
+                except TimeoutError:
+                    logger.error(f"Agent execution timeout after {TIMEOUT_SECONDS}s for run_id: {ctx.run_id}")
+                    yield create_message_end_dict(
+                        code="TIMEOUT",
+                        message=f"Execution timeout: exceeded {TIMEOUT_SECONDS} seconds",
+                        session_id=client_msg.session_id,
+                        query_msg_id=client_msg.local_msg_id,
+                        log_id=ctx.logid,
+                        time_cost_ms=int((time.time() - start_time) * 1000),
+                        reply_id="",
+                        sequence_id=last_seq + 1,
+                    )
+                    break
+                yield sm.dict()
+                last_seq = sm.sequence_id
+        except asyncio.CancelledError:
+            logger.info(f"Stream cancelled for run_id: {ctx.run_id}")
+            raise
+        except Exception as ex:
+            # 使用错误分类器获取错误码
+            err = classify_error(ex, {"node_name": "astream"})
+            yield create_message_end_dict(
+                code=str(err.code),
+                message=err.message,
+                session_id=client_msg.session_id,
+                query_msg_id=client_msg.local_msg_id,
+                log_id=ctx.logid,
+                time_cost_ms=int((time.time() - start_time) * 1000),
+                reply_id="",
+                sequence_id=last_seq + 1,
+            )
+        finally:
+            await server_msgs_iter.aclose()
+
+    async def _astream_thread(self, client_msg, stream_input: Dict[str, Any], graph: CompiledStateGraph,
+                              run_config: RunnableConfig, ctx=Context) -> AsyncIterable[Any]:
+        # 使用后台线程拉取同步流，通过有界队列推送给事件循环；消费者落后时合并回答增量或阻塞生产者
+        loop = asyncio.get_running_loop()
+        q = BackpressureQueue(loop, run_id=ctx.run_id, merge=merge_delta_message_dicts)
         context = contextvars.copy_context()
         start_time = time.time()
         # 取消标志，用于通知 producer 线程停止
@@ -292,7 +366,7 @@ class GraphService:
                             reply_id=getattr(sm, 'reply_id', ''),
                             sequence_id=last_seq + 1,
                         )
-                        loop.call_soon_threadsafe(q.put_nowait, cancel_msg)
+                        q.put(cancel_msg)
                         return
 
                     # 主动检查执行时间，及时中断
@@ -308,9 +382,12 @@ class GraphService:
                             reply_id=getattr(sm, 'reply_id', ''),
                             sequence_id=last_seq + 1,
                         )
-                        loop.call_soon_threadsafe(q.put_nowait, timeout_msg)
+                        q.put(timeout_msg)
+                        return
+                    if not q.put(sm.dict()):
+                        # 队列已关闭，消费者已经离开
+                        logger.info(f"Producer stopped, consumer gone for run_id: {ctx.run_id}")
                         return
-                    loop.call_soon_threadsafe(q.put_nowait, sm.dict())
                     last_seq = sm.sequence_id
             except Exception as ex:
                 # 如果已取消，不再发送错误消息
@@ -329,9 +406,9 @@ class GraphService:
                     reply_id="",
                     sequence_id=last_seq + 1,
                 )
-                loop.call_soon_threadsafe(q.put_nowait, end_msg)
+                q.put(end_msg)
             finally:
-                loop.call_soon_threadsafe(q.put_nowait, None)
+                q.put_end()
 
         threading.Thread(target=lambda: context.run(producer), daemon=True).start()
 
@@ -346,13 +423,16 @@ class GraphService:
             # 设置取消标志，通知 producer 线程停止
             cancelled.set()
             raise
+        finally:
+            # 关闭队列会唤醒阻塞中的 producer，并记录本次运行的队列统计
+            q.close()
 
 
 service = GraphService()
 app = FastAPI()
 
 # OpenAI 兼容接口处理器
-openai_handler = OpenAIChatHandler(service)
+openai_handler = OpenAIChatHandler(service, timeout_seconds=TIMEOUT_SECONDS)
 
 
 @app.post("/run")
@@ -599,6 +679,18 @@ async def health_check():
         raise HTTPException(status_code=503, detail=str(e))
 
 
+@app.get("/metrics")
+async def runtime_metrics():
+    """运行时指标：缓存命中/淘汰、工具超时、流式队列深度"""
+    return collect_runtime_metrics()
+
+
+@app.get("/stream_metrics")
+async def stream_metrics():
+    """流式队列深度统计：正在运行和最近结束的运行，用于发现慢客户端"""
+    return get_stream_queue_registry().snapshot()
+
+
 @app.get(path="/graph_parameter")
 async def http_graph_inout_parameter(request: Request):
     return service.graph_inout_schema()
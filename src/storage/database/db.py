@@ -1,8 +1,13 @@
 import os
+import threading
 import time
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.exc import OperationalError
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Iterator, Tuple
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 import logging
 logger = logging.getLogger(__name__)
 
@@ -35,30 +40,131 @@ def get_db_url() -> str:
         if url is None or url == "":
             logger.error("PGDATABASE_URL is not set")
     return url
+# 连接池配置，可通过环境变量调整
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "600"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# 异步路径上每个进程最多占用的连接数：异步引擎与检查点连接池合计不超过该值
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "20"))
+# 检查点（AsyncPostgresSaver）连接池上限，从 DB_MAX_CONNECTIONS 中预留
+DB_CHECKPOINT_POOL_SIZE = int(os.getenv("DB_CHECKPOINT_POOL_SIZE", "5"))
+
 _engine = None
 _SessionLocal = None
+_async_engine = None
+_AsyncSessionLocal = None
+
+
+class PoolMetrics:
+    """连接池指标：等待获取连接的耗时、取出时连接的存活时间"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkout_timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.age_total = 0.0
+        self.age_max = 0.0
+        self.connects = 0
+
+    def record_wait(self, seconds: float, timed_out: bool = False) -> None:
+        with self._lock:
+            if timed_out:
+                self.checkout_timeouts += 1
+                return
+            self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def record_age(self, seconds: float) -> None:
+        with self._lock:
+            self.age_total += seconds
+            self.age_max = max(self.age_max, seconds)
+
+    def record_connect(self) -> None:
+        with self._lock:
+            self.connects += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            n = self.checkouts
+            return {
+                "checkouts": n,
+                "checkout_timeouts": self.checkout_timeouts,
+                "connects": self.connects,
+                "checkout_wait_avg_ms": round(self.wait_total / n * 1000, 3) if n else 0.0,
+                "checkout_wait_max_ms": round(self.wait_max * 1000, 3),
+                "connection_age_avg_s": round(self.age_total / n, 1) if n else 0.0,
+                "connection_age_max_s": round(self.age_max, 1),
+            }
+
+
+_pool_metrics = PoolMetrics()
+_async_pool_metrics = PoolMetrics()
+
+
+def _metrics_for(async_pool: bool) -> PoolMetrics:
+    return _async_pool_metrics if async_pool else _pool_metrics
+
+
+class InstrumentedQueuePool(QueuePool):
+    """记录获取连接等待时间的 QueuePool"""
+
+    _async_pool = False
+
+    def _do_get(self):
+        start = time.monotonic()
+        try:
+            conn = super()._do_get()
+        except PoolTimeoutError:
+            _metrics_for(self._async_pool).record_wait(time.monotonic() - start, timed_out=True)
+            raise
+        _metrics_for(self._async_pool).record_wait(time.monotonic() - start)
+        return conn
+
+
+class InstrumentedAsyncQueuePool(InstrumentedQueuePool, AsyncAdaptedQueuePool):
+    """异步引擎使用的 InstrumentedQueuePool，指标单独统计"""
+
+    _async_pool = True
+
+
+def _instrument_pool(engine, async_pool: bool = False) -> None:
+    """记录每个连接的创建时间，取出时统计连接存活时间；异步引擎传入 engine.sync_engine"""
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        connection_record.info["connected_at"] = time.monotonic()
+        _metrics_for(async_pool).record_connect()
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        connected_at = connection_record.info.get("connected_at")
+        if connected_at is not None:
+            _metrics_for(async_pool).record_age(time.monotonic() - connected_at)
+
 
 def _create_engine_with_retry():
     url = get_db_url()
     if url is None or url == "":
         logger.error("PGDATABASE_URL is not set")
         raise ValueError("PGDATABASE_URL is not set")
-    size = 5
-    overflow = 10
-    recycle = 600
-    timeout = 30
     engine = create_engine(
         url,
-        pool_size=size,
-        max_overflow=overflow,
+        poolclass=InstrumentedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
         pool_pre_ping=True,
-        pool_recycle=recycle,
-        pool_timeout=timeout,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_timeout=DB_POOL_TIMEOUT,
         connect_args={
             "connect_timeout": 10
         },
         echo=False
     )
+    _instrument_pool(engine)
     # 验证连接，带重试
     start_time = time.time()
     last_error = None
@@ -88,16 +194,174 @@ def get_sessionmaker():
     return _SessionLocal
 
 def get_session():
-    """获取数据库会话，每次都创建新会话"""
-    session = get_sessionmaker()()
+    """
+    获取数据库会话，每次都创建新会话
+
+    会话在第一次执行语句时才从连接池取连接，失效连接由连接池的 pre-ping 检测并替换，
+    这里不再额外探测。调用方负责 close()，推荐使用 session_scope()
+    """
+    return get_sessionmaker()()
+
+@contextmanager
+def session_scope() -> Iterator[Session]:
+    """
+    会话上下文：异常时回滚，退出时关闭会话并归还连接
+
+    事务由调用方（如 SupplierManager 的写方法）自行提交
+
+    Example:
+        with session_scope() as db:
+            suppliers = SupplierManager().search_suppliers(db, category="手机壳")
+    """
+    session = get_session()
     try:
-        # 测试连接是否有效
-        session.execute(text("SELECT 1"))
-    except Exception as e:
+        yield session
+    except BaseException:
+        session.rollback()
+        raise
+    finally:
         session.close()
-        # 如果连接失败，重新创建会话
-        session = get_sessionmaker()()
-    return session
+
+def to_async_url(url: str) -> str:
+    """把 PostgreSQL 连接串换成 psycopg3 异步驱动（postgresql+psycopg），其他连接串原样返回"""
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+psycopg://" + url[len(prefix):]
+    return url
+
+def async_pool_limits() -> Tuple[int, int]:
+    """
+    异步引擎的 (pool_size, max_overflow)
+
+    检查点连接池与异步引擎不能共用一个池（前者需要 search_path=memory 和 autocommit 连接），
+    因此按 DB_MAX_CONNECTIONS 分配：先预留检查点连接池，剩余部分给异步引擎
+    """
+    budget = max(DB_MAX_CONNECTIONS - DB_CHECKPOINT_POOL_SIZE, 1)
+    pool_size = min(DB_POOL_SIZE, budget)
+    max_overflow = min(DB_MAX_OVERFLOW, budget - pool_size)
+    return pool_size, max_overflow
+
+def _create_async_engine():
+    url = get_db_url()
+    if url is None or url == "":
+        logger.error("PGDATABASE_URL is not set")
+        raise ValueError("PGDATABASE_URL is not set")
+    pool_size, max_overflow = async_pool_limits()
+    if (pool_size, max_overflow) != (DB_POOL_SIZE, DB_MAX_OVERFLOW):
+        logger.warning(
+            f"Async pool capped to {pool_size}+{max_overflow} to fit DB_MAX_CONNECTIONS={DB_MAX_CONNECTIONS} "
+            f"with {DB_CHECKPOINT_POOL_SIZE} checkpoint connections"
+        )
+    engine = create_async_engine(
+        to_async_url(url),
+        poolclass=InstrumentedAsyncQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_pre_ping=True,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_timeout=DB_POOL_TIMEOUT,
+        connect_args={
+            "connect_timeout": 10
+        },
+        echo=False
+    )
+    _instrument_pool(engine.sync_engine, async_pool=True)
+    return engine
+
+def get_async_engine():
+    """
+    获取异步引擎（psycopg3 异步驱动），首次调用时创建，不在创建时探测连接
+
+    连接绑定创建它的事件循环，只应在服务的主事件循环中使用
+    """
+    global _async_engine
+    if _async_engine is None:
+        _async_engine = _create_async_engine()
+    return _async_engine
+
+def get_async_sessionmaker():
+    global _AsyncSessionLocal
+    if _AsyncSessionLocal is None:
+        # 提交后不过期实体，避免在协程里访问属性时触发隐式的同步加载
+        _AsyncSessionLocal = async_sessionmaker(
+            bind=get_async_engine(), autoflush=False, expire_on_commit=False
+        )
+    return _AsyncSessionLocal
+
+@asynccontextmanager
+async def async_session_scope() -> AsyncIterator[AsyncSession]:
+    """
+    session_scope 的异步版本：异常时回滚，退出时关闭会话并归还连接
+
+    Example:
+        async with async_session_scope() as db:
+            suppliers = await AsyncSupplierManager().search_suppliers(db, category="手机壳")
+    """
+    session = get_async_sessionmaker()()
+    try:
+        yield session
+    except BaseException:
+        await session.rollback()
+        raise
+    finally:
+        await session.close()
+
+async def dispose_async_engine() -> None:
+    """关闭异步引擎的连接池（服务退出时调用）"""
+    global _async_engine, _AsyncSessionLocal
+    if _async_engine is not None:
+        await _async_engine.dispose()
+    _async_engine = None
+    _AsyncSessionLocal = None
+
+def get_pool_stats() -> dict:
+    """
+    获取连接池状态和指标；引擎尚未创建时只返回配置
+
+    异步引擎的连接池单独统计在 "async" 下
+    """
+    stats = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "initialized": _engine is not None,
+    }
+    if _engine is not None:
+        pool = _engine.pool
+        stats.update({
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+        })
+    stats.update(_pool_metrics.snapshot())
+
+    pool_size, max_overflow = async_pool_limits()
+    async_stats = {
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "checkpoint_pool_size": DB_CHECKPOINT_POOL_SIZE,
+        "max_connections": DB_MAX_CONNECTIONS,
+        "initialized": _async_engine is not None,
+    }
+    if _async_engine is not None:
+        pool = _async_engine.pool
+        async_stats.update({
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+        })
+    async_stats.update(_async_pool_metrics.snapshot())
+    stats["async"] = async_stats
+    return stats
+
+_RETRYABLE_CONNECTION_ERRORS = (
+    'terminating connection',
+    'server closed the connection',
+    'connection already closed',
+    'could not connect',
+    'connection refused',
+)
 
 def execute_with_retry(func, max_retries=3, retry_delay=1):
     """
@@ -112,6 +376,7 @@ def execute_with_retry(func, max_retries=3, retry_delay=1):
         函数执行结果（字典或简单值）
     """
     from sqlalchemy.exc import OperationalError, DisconnectionError, InterfaceError, DatabaseError
+    from utils.rate_limiter import get_rate_limiter
     import logging
     logger = logging.getLogger(__name__)
 
@@ -119,6 +384,8 @@ def execute_with_retry(func, max_retries=3, retry_delay=1):
     for attempt in range(max_retries + 1):
         db = None
         try:
+            # 共享的 db 配额，避免突发写入打满连接池
+            get_rate_limiter("db").acquire()
             db = get_session()
             result = func(db)
 
@@ -135,13 +402,7 @@ def execute_with_retry(func, max_retries=3, retry_delay=1):
             error_msg = str(e).lower()
 
             # 检查是否是连接错误
-            if any(keyword in error_msg for keyword in [
-                'terminating connection',
-                'server closed the connection',
-                'connection already closed',
-                'could not connect',
-                'connection refused'
-            ]):
+            if any(keyword in error_msg for keyword in _RETRYABLE_CONNECTION_ERRORS):
                 logger.warning(f"Database connection error on attempt {attempt + 1}: {e}")
 
                 # 关闭失败的会话
@@ -189,10 +450,48 @@ def execute_with_retry(func, max_retries=3, retry_delay=1):
         raise last_error
     raise Exception("Database operation failed after retries")
 
+async def aexecute_with_retry(func, max_retries=3, retry_delay=1):
+    """
+    execute_with_retry 的异步版本
+
+    func 仍是接受同步 Session 的函数，通过 AsyncSession.run_sync 在异步连接上执行，
+    SupplierManager 的方法可以直接复用；等待连接和重试期间不阻塞事件循环
+
+    Args:
+        func: 要执行的函数，接受 db 参数，返回一个字典或简单值
+        max_retries: 最大重试次数
+        retry_delay: 重试延迟（秒）
+    """
+    import asyncio
+    from sqlalchemy.exc import DisconnectionError, InterfaceError
+    from utils.rate_limiter import get_rate_limiter
+
+    for attempt in range(max_retries + 1):
+        try:
+            await get_rate_limiter("db").aacquire()
+            async with async_session_scope() as db:
+                return await db.run_sync(func)
+        except (OperationalError, DisconnectionError, InterfaceError) as e:
+            error_msg = str(e).lower()
+            if attempt < max_retries and any(keyword in error_msg for keyword in _RETRYABLE_CONNECTION_ERRORS):
+                logger.warning(f"Database connection error on attempt {attempt + 1}: {e}")
+                await asyncio.sleep(retry_delay * (attempt + 1))
+                continue
+            raise
+
 __all__ = [
     "get_db_url",
     "get_engine",
     "get_sessionmaker",
     "get_session",
+    "session_scope",
+    "to_async_url",
+    "async_pool_limits",
+    "get_async_engine",
+    "get_async_sessionmaker",
+    "async_session_scope",
+    "dispose_async_engine",
+    "get_pool_stats",
     "execute_with_retry",
+    "aexecute_with_retry",
 ]
@@ -0,0 +1,99 @@
+"""
+游标分页（keyset pagination）
+按 (排序列, id) 倒序翻页，下一页从上一页最后一行之后继续，不使用 OFFSET，
+翻到多深每页的查询代价都相同。游标对调用方不透明（base64 编码）
+"""
+import base64
+import json
+from datetime import date, datetime
+from typing import Any, List, Optional, Tuple
+
+from sqlalchemy import and_, or_, tuple_
+
+
+class InvalidCursorError(ValueError):
+    """游标无法解析"""
+
+
+def encode_cursor(sort_value: Any, row_id: int) -> str:
+    """把排序值和 id 编码为不透明游标"""
+    if isinstance(sort_value, datetime):
+        value = {"dt": sort_value.isoformat()}
+    elif isinstance(sort_value, date):
+        value = {"d": sort_value.isoformat()}
+    else:
+        value = sort_value
+    raw = json.dumps([value, row_id], ensure_ascii=False, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, int]:
+    """
+    解析游标
+
+    Raises:
+        InvalidCursorError: 游标格式错误
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if isinstance(value, dict):
+            if "dt" in value:
+                value = datetime.fromisoformat(value["dt"])
+            elif "d" in value:
+                value = date.fromisoformat(value["d"])
+            else:
+                raise ValueError("unknown cursor value")
+        return value, int(row_id)
+    except Exception as e:
+        raise InvalidCursorError(f"invalid cursor: {cursor!r}") from e
+
+
+def keyset_page(query, sort_col, id_col, cursor: Optional[str], limit: int, skip: int = 0):
+    """
+    给查询加上按 (sort_col, id_col) 倒序的排序、游标条件和 limit
+
+    sort_col 可为空时，空值排在最后
+
+    Args:
+        query: SQLAlchemy 查询
+        sort_col: 排序列，如 Supplier.created_at
+        id_col: 主键列，用于排序值相同时定序
+        cursor: 上一页返回的游标，为 None 时取第一页
+        limit: 每页数量
+        skip: 兼容旧的偏移量分页，仅在未传游标时生效
+    """
+    nullable = sort_col.expression.nullable
+    if cursor:
+        value, row_id = decode_cursor(cursor)
+        if not nullable:
+            query = query.filter(tuple_(sort_col, id_col) < tuple_(value, row_id))
+        elif value is None:
+            query = query.filter(and_(sort_col.is_(None), id_col < row_id))
+        else:
+            query = query.filter(or_(
+                sort_col < value,
+                and_(sort_col == value, id_col < row_id),
+                sort_col.is_(None),
+            ))
+
+    order = sort_col.desc().nullslast() if nullable else sort_col.desc()
+    query = query.order_by(order, id_col.desc()).limit(limit)
+    if skip and not cursor:
+        query = query.offset(skip)
+    return query
+
+
+def next_cursor(items: List[Any], sort_col, limit: int) -> Optional[str]:
+    """
+    根据本页结果生成下一页游标
+
+    Args:
+        items: 本页结果（ORM 实体或带同名字段的行）
+        sort_col: 与 keyset_page 相同的排序列
+        limit: 每页数量；本页不满时表示没有下一页，返回 None
+    """
+    if not items or len(items) < limit:
+        return None
+    last = items[-1]
+    return encode_cursor(getattr(last, sort_col.key), last.id)
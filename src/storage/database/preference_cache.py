@@ -0,0 +1,121 @@
+"""
+用户偏好缓存
+按 user_id 缓存解析后的偏好快照（读穿透），create_or_update_preference 提交后写入新快照（写穿透），
+推荐等高频读取不必每次查询 user_preferences 表
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from storage.database.shared.model import json_value
+
+# 缓存有效期（秒）：多个 worker 各自缓存，其他进程的更新最多延迟这么久可见
+PREFERENCE_CACHE_TTL = float(os.getenv("PREFERENCE_CACHE_TTL", "120"))
+# 最多缓存的用户数
+PREFERENCE_CACHE_SIZE = int(os.getenv("PREFERENCE_CACHE_SIZE", "2048"))
+
+
+@dataclass(frozen=True, slots=True)
+class PreferenceSnapshot:
+    """用户偏好的只读快照，列表字段转为元组，字段名与 UserPreference 一致"""
+
+    user_id: str
+    preferred_categories: Tuple[str, ...] = ()
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    preferred_platforms: Tuple[str, ...] = ()
+    preferred_regions: Tuple[str, ...] = ()
+    min_roi: Optional[float] = None
+    min_profit_margin: Optional[float] = None
+    keywords: Tuple[str, ...] = ()
+    exclude_keywords: Tuple[str, ...] = ()
+    notification_enabled: bool = True
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+    @classmethod
+    def from_model(cls, pref) -> "PreferenceSnapshot":
+        """从 UserPreference 实体构造快照"""
+        return cls(
+            user_id=pref.user_id,
+            preferred_categories=tuple(json_value(pref.preferred_categories, ())),
+            min_price=pref.min_price,
+            max_price=pref.max_price,
+            preferred_platforms=tuple(json_value(pref.preferred_platforms, ())),
+            preferred_regions=tuple(json_value(pref.preferred_regions, ())),
+            min_roi=pref.min_roi,
+            min_profit_margin=pref.min_profit_margin,
+            keywords=tuple(json_value(pref.keywords, ())),
+            exclude_keywords=tuple(json_value(pref.exclude_keywords, ())),
+            notification_enabled=pref.notification_enabled if pref.notification_enabled is not None else True,
+            created_at=pref.created_at,
+            updated_at=pref.updated_at,
+        )
+
+
+class PreferenceCache:
+    """进程内 LRU 偏好缓存，带过期时间；只缓存已存在的偏好"""
+
+    def __init__(self, max_size: int = PREFERENCE_CACHE_SIZE, ttl: float = PREFERENCE_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[str, Tuple[PreferenceSnapshot, float]]" = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0, "writes": 0, "invalidations": 0}
+
+    def get(self, user_id: str) -> Optional[PreferenceSnapshot]:
+        """获取未过期的快照，未命中返回 None"""
+        now = time.monotonic()
+        with self._lock:
+            item = self._items.get(user_id)
+            if item is None or item[1] <= now:
+                if item is not None:
+                    del self._items[user_id]
+                self._stats["misses"] += 1
+                return None
+            self._items.move_to_end(user_id)
+            self._stats["hits"] += 1
+            return item[0]
+
+    def set(self, snapshot: PreferenceSnapshot) -> None:
+        """写入快照"""
+        with self._lock:
+            self._items[snapshot.user_id] = (snapshot, time.monotonic() + self.ttl)
+            self._items.move_to_end(snapshot.user_id)
+            self._stats["writes"] += 1
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def invalidate(self, user_id: str) -> None:
+        """删除某个用户的缓存"""
+        with self._lock:
+            if self._items.pop(user_id, None) is not None:
+                self._stats["invalidations"] += 1
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._items.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取命中统计"""
+        with self._lock:
+            return {**self._stats, "size": len(self._items)}
+
+
+# 全局偏好缓存实例
+_preference_cache = None
+_preference_cache_lock = threading.Lock()
+
+def get_preference_cache() -> PreferenceCache:
+    """获取全局偏好缓存实例"""
+    global _preference_cache
+    if _preference_cache is None:
+        with _preference_cache_lock:
+            if _preference_cache is None:
+                _preference_cache = PreferenceCache()
+    return _preference_cache
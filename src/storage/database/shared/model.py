@@ -1,8 +1,33 @@
 from coze_coding_dev_sdk.database import Base
-from sqlalchemy import BigInteger, Boolean, Column, DateTime, Float, ForeignKey, Index, Integer, String, Text, JSON, func
+from sqlalchemy import BigInteger, Boolean, Column, DateTime, Float, ForeignKey, Index, Integer, String, Text, JSON, event, func, inspect
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Mapped, relationship
-from typing import Optional
+from typing import Any, Optional
 import datetime
+import json
+import logging
+import time
+import weakref
+
+logger = logging.getLogger(__name__)
+
+# PostgreSQL 上使用 JSONB（可建 GIN 索引、支持 @> 包含查询），其他数据库退化为 JSON
+JSONBType = JSON().with_variant(JSONB(), "postgresql")
+
+
+def json_value(value: Any, default: Any = None) -> Any:
+    """
+    读取 JSON 列的值，为 None 时返回 default
+
+    scripts/migrate_json_columns.py 执行前的旧行可能仍是被二次编码的 JSON 字符串，这里解码一层，
+    解码失败同样返回 default
+    """
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return default
+    return default if value is None else value
 
 class Supplier(Base):
     """供应商表，存储供应商基本信息"""
@@ -22,8 +47,8 @@ class Supplier(Base):
     min_order_quantity = Column(Integer, nullable=True, comment="最小起订量")
     is_verified = Column(Boolean, default=False, nullable=False, comment="是否为认证供应商")
     rating = Column(Float, nullable=True, comment="评分（0-5分）")
-    categories = Column(JSON, nullable=True, comment="经营的品类列表")
-    tags = Column(JSON, nullable=True, comment="标签列表")
+    categories = Column(JSONBType, nullable=True, comment="经营的品类列表")
+    tags = Column(JSONBType, nullable=True, comment="标签列表")
     notes = Column(Text, nullable=True, comment="备注信息")
     source = Column(String(100), nullable=True, comment="数据来源")
     status = Column(String(50), default="active", nullable=False, index=True, comment="状态：active/inactive")
@@ -34,8 +59,15 @@ class Supplier(Base):
     products = relationship("Product", back_populates="supplier", cascade="all, delete-orphan")
 
     __table_args__ = (
+        # 自然键（名称 + 平台），批量导入按它做 upsert；platform 为空视为同一平台
+        Index("uq_suppliers_name_platform", name, func.coalesce(platform, ""), unique=True),
         Index("ix_suppliers_platform_region", "platform", "region"),
         Index("ix_suppliers_region_status", "region", "status"),
+        Index("ix_suppliers_created_id", "created_at", "id"),
+        Index("ix_suppliers_categories_gin", "categories",
+              postgresql_using="gin", postgresql_ops={"categories": "jsonb_path_ops"}),
+        Index("ix_suppliers_tags_gin", "tags",
+              postgresql_using="gin", postgresql_ops={"tags": "jsonb_path_ops"}),
     )
 
 
@@ -55,10 +87,10 @@ class Product(Base):
     profit_margin = Column(Float, nullable=True, comment="利润率（%）")
     roi = Column(Float, nullable=True, comment="投资回报率（%）")
     potential_score = Column(Integer, nullable=True, comment="潜力分数（1-10分）")
-    image_urls = Column(JSON, nullable=True, comment="产品图片URL列表")
+    image_urls = Column(JSONBType, nullable=True, comment="产品图片URL列表")
     product_url = Column(Text, nullable=True, comment="产品链接")
-    specifications = Column(JSON, nullable=True, comment="规格参数")
-    tags = Column(JSON, nullable=True, comment="标签")
+    specifications = Column(JSONBType, nullable=True, comment="规格参数")
+    tags = Column(JSONBType, nullable=True, comment="标签")
     notes = Column(Text, nullable=True, comment="备注")
     status = Column(String(50), default="active", nullable=False, index=True, comment="状态：active/inactive")
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, comment="创建时间")
@@ -70,9 +102,107 @@ class Product(Base):
     __table_args__ = (
         Index("ix_products_category_status", "category", "status"),
         Index("ix_products_supplier_status", "supplier_id", "status"),
+        Index("ix_products_created_id", "created_at", "id"),
+    )
+
+
+class ProductRanking(Base):
+    """
+    产品推荐排名表，每个产品一行，只冗余推荐过滤和排序用到的列
+
+    覆盖索引按 (品类, 状态, 潜力分, ROI) 排序并 INCLUDE 价格、利润率，推荐查询沿索引顺序
+    读取前 N 条即可结束（index-only scan），不必在 products 上过滤后整体排序。
+    通过 Product 的 ORM 事件增量维护；批量 INSERT 等绕过 ORM 的写入后需调用
+    SupplierManager.refresh_product_rankings 重建
+    """
+    __tablename__ = "product_rankings"
+
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True, comment="产品ID")
+    supplier_id = Column(Integer, nullable=False, comment="供应商ID")
+    category = Column(String(100), nullable=True, comment="产品品类")
+    status = Column(String(50), nullable=False, comment="状态：active/inactive")
+    potential_score = Column(Integer, nullable=True, comment="潜力分数（1-10分）")
+    roi = Column(Float, nullable=True, comment="投资回报率（%）")
+    purchase_price = Column(Float, nullable=True, comment="进货价（元）")
+    profit_margin = Column(Float, nullable=True, comment="利润率（%）")
+
+    __table_args__ = (
+        Index("ix_product_rankings_category_rank", category, status, potential_score.desc(), roi.desc(),
+              postgresql_include=["purchase_price", "profit_margin", "product_id"]),
+        Index("ix_product_rankings_status_rank", status, potential_score.desc(), roi.desc(),
+              postgresql_include=["purchase_price", "profit_margin", "product_id"]),
     )
 
 
+# 排名表从产品表冗余的列
+PRODUCT_RANKING_COLUMNS = ("supplier_id", "category", "status", "potential_score",
+                           "roi", "purchase_price", "profit_margin")
+
+
+# 排名表不存在时，隔多久（秒）再检查一次；执行迁移后无需重启即可恢复增量维护
+RANKING_TABLE_RECHECK_SECONDS = 60
+# engine -> (排名表是否存在, 下次检查时间)
+_ranking_table_state: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def _ranking_table_ready(connection) -> bool:
+    """
+    排名表是否已创建
+
+    尚未执行 scripts/init_db.py 的旧库上没有 product_rankings 表，此时跳过排名维护并记录警告，
+    不让产品写入失败；表存在的结果一直缓存，不存在的结果定期重新检查
+    """
+    engine = connection.engine
+    now = time.monotonic()
+    state = _ranking_table_state.get(engine)
+    if state is not None and (state[0] or state[1] > now):
+        return state[0]
+    exists = inspect(connection).has_table(ProductRanking.__tablename__)
+    if not exists:
+        logger.warning(
+            "product_rankings table is missing, skipping ranking maintenance; "
+            "run scripts/init_db.py to create and backfill it"
+        )
+    _ranking_table_state[engine] = (exists, now + RANKING_TABLE_RECHECK_SECONDS)
+    return exists
+
+
+def _ranking_values(product: "Product") -> dict:
+    return {column: getattr(product, column) for column in PRODUCT_RANKING_COLUMNS}
+
+
+@event.listens_for(Product, "after_insert")
+def _insert_product_ranking(mapper, connection, target):
+    """产品写入时在同一事务内写入排名行"""
+    if not _ranking_table_ready(connection):
+        return
+    connection.execute(ProductRanking.__table__.insert().values(
+        product_id=target.id, **_ranking_values(target)
+    ))
+
+
+@event.listens_for(Product, "after_update")
+def _update_product_ranking(mapper, connection, target):
+    """产品更新时同步排名行；排名行缺失（如历史数据未回填）时补写"""
+    if not _ranking_table_ready(connection):
+        return
+    table = ProductRanking.__table__
+    result = connection.execute(
+        table.update().where(table.c.product_id == target.id).values(**_ranking_values(target))
+    )
+    if result.rowcount == 0:
+        connection.execute(table.insert().values(product_id=target.id, **_ranking_values(target)))
+
+
+@event.listens_for(Product, "after_delete")
+def _delete_product_ranking(mapper, connection, target):
+    """产品删除时删除排名行（PostgreSQL 上外键级联也会删除）"""
+    if not _ranking_table_ready(connection):
+        return
+    table = ProductRanking.__table__
+    connection.execute(table.delete().where(table.c.product_id == target.id))
+
+
 class MarketTrend(Base):
     """市场趋势表，存储市场趋势数据"""
     __tablename__ = "market_trends"
@@ -80,9 +210,9 @@ class MarketTrend(Base):
     id = Column(Integer, primary_key=True, autoincrement=True, comment="趋势ID")
     category = Column(String(100), nullable=False, index=True, comment="品类")
     platform = Column(String(50), nullable=True, index=True, comment="平台")
-    trend_data = Column(JSON, nullable=True, comment="趋势数据")
+    trend_data = Column(JSONBType, nullable=True, comment="趋势数据")
     growth_rate = Column(Float, nullable=True, comment="增长率（%）")
-    hot_keywords = Column(JSON, nullable=True, comment="热门关键词列表")
+    hot_keywords = Column(JSONBType, nullable=True, comment="热门关键词列表")
     summary = Column(Text, nullable=True, comment="趋势摘要")
     trend_type = Column(String(50), nullable=True, comment="趋势类型：monthly/weekly/daily")
     data_date = Column(DateTime(timezone=True), nullable=True, comment="数据日期")
@@ -91,6 +221,7 @@ class MarketTrend(Base):
     __table_args__ = (
         Index("ix_market_trends_category_platform", "category", "platform"),
         Index("ix_market_trends_category_date", "category", "data_date"),
+        Index("ix_market_trends_date_id", "data_date", "id"),
     )
 
 
@@ -100,15 +231,15 @@ class UserPreference(Base):
 
     id = Column(Integer, primary_key=True, autoincrement=True, comment="偏好ID")
     user_id = Column(String(100), nullable=False, index=True, comment="用户ID")
-    preferred_categories = Column(JSON, nullable=True, comment="偏好品类列表")
+    preferred_categories = Column(JSONBType, nullable=True, comment="偏好品类列表")
     min_price = Column(Float, nullable=True, comment="最低进货价")
     max_price = Column(Float, nullable=True, comment="最高进货价")
-    preferred_platforms = Column(JSON, nullable=True, comment="偏好平台列表")
-    preferred_regions = Column(JSON, nullable=True, comment="偏好地区列表")
+    preferred_platforms = Column(JSONBType, nullable=True, comment="偏好平台列表")
+    preferred_regions = Column(JSONBType, nullable=True, comment="偏好地区列表")
     min_roi = Column(Float, nullable=True, comment="最低ROI要求（%）")
     min_profit_margin = Column(Float, nullable=True, comment="最低利润率要求（%）")
-    keywords = Column(JSON, nullable=True, comment="关注关键词列表")
-    exclude_keywords = Column(JSON, nullable=True, comment="排除关键词列表")
+    keywords = Column(JSONBType, nullable=True, comment="关注关键词列表")
+    exclude_keywords = Column(JSONBType, nullable=True, comment="排除关键词列表")
     notification_enabled = Column(Boolean, default=True, nullable=False, comment="是否启用通知")
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, comment="创建时间")
     updated_at = Column(DateTime(timezone=True), onupdate=func.now(), nullable=True, comment="更新时间")
@@ -127,7 +258,7 @@ class Notification(Base):
     notification_type = Column(String(50), nullable=False, comment="通知类型：trend_alert/supplier_alert/recommendation")
     title = Column(String(255), nullable=False, comment="通知标题")
     content = Column(Text, nullable=False, comment="通知内容")
-    data = Column(JSON, nullable=True, comment="附加数据")
+    data = Column(JSONBType, nullable=True, comment="附加数据")
     priority = Column(String(20), default="normal", nullable=False, comment="优先级：low/normal/high/urgent")
     is_read = Column(Boolean, default=False, nullable=False, comment="是否已读")
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, comment="创建时间")
@@ -153,12 +284,12 @@ class ProductLinkAnalysis(Base):
     sales_count = Column(Integer, nullable=True, comment="销量")
     rating = Column(Float, nullable=True, comment="评分")
     review_count = Column(Integer, nullable=True, comment="评价数")
-    image_urls = Column(JSON, nullable=True, comment="产品图片URL列表")
+    image_urls = Column(JSONBType, nullable=True, comment="产品图片URL列表")
     shop_name = Column(String(255), nullable=True, comment="店铺名称")
     shop_url = Column(Text, nullable=True, comment="店铺链接")
-    market_analysis = Column(JSON, nullable=True, comment="市场分析数据")
-    competitor_info = Column(JSON, nullable=True, comment="竞品信息")
-    sourcing_suggestions = Column(JSON, nullable=True, comment="货源建议")
+    market_analysis = Column(JSONBType, nullable=True, comment="市场分析数据")
+    competitor_info = Column(JSONBType, nullable=True, comment="竞品信息")
+    sourcing_suggestions = Column(JSONBType, nullable=True, comment="货源建议")
     analysis_summary = Column(Text, nullable=True, comment="分析摘要")
     potential_score = Column(Integer, nullable=True, comment="潜力分数（1-10分）")
     status = Column(String(50), default="analyzed", nullable=False, comment="状态：analyzed/failed/pending")
@@ -189,10 +320,10 @@ class ShopLinkAnalysis(Base):
     total_sales = Column(BigInteger, nullable=True, comment="总销量")
     follower_count = Column(Integer, nullable=True, comment="粉丝数")
     founded_date = Column(DateTime(timezone=True), nullable=True, comment="开店时间")
-    top_products = Column(JSON, nullable=True, comment="热销产品列表")
-    pricing_analysis = Column(JSON, nullable=True, comment="定价分析")
-    market_position = Column(JSON, nullable=True, comment="市场定位分析")
-    sourcing_opportunities = Column(JSON, nullable=True, comment="货源机会")
+    top_products = Column(JSONBType, nullable=True, comment="热销产品列表")
+    pricing_analysis = Column(JSONBType, nullable=True, comment="定价分析")
+    market_position = Column(JSONBType, nullable=True, comment="市场定位分析")
+    sourcing_opportunities = Column(JSONBType, nullable=True, comment="货源机会")
     analysis_summary = Column(Text, nullable=True, comment="分析摘要")
     status = Column(String(50), default="analyzed", nullable=False, comment="状态：analyzed/failed/pending")
     error_message = Column(Text, nullable=True, comment="错误信息")
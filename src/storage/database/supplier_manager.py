@@ -2,27 +2,44 @@
 供应商数据库管理器
 提供供应商相关的CRUD操作
 """
-from typing import List, Optional, Dict, Any
-from pydantic import BaseModel, Field
+from typing import List, Optional, Dict, Any, Set, Tuple
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
+from sqlalchemy import delete, func, insert, inspect, literal_column, select, tuple_, type_coerce, union_all, update
+from sqlalchemy.dialects.postgresql import JSONB, insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Row
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
+import os
 
-from storage.database.shared.model import Supplier, Product, MarketTrend, UserPreference, Notification
+from storage.database.shared.model import (
+    Supplier, Product, ProductRanking, PRODUCT_RANKING_COLUMNS, MarketTrend, UserPreference, Notification
+)
+from storage.database.pagination import keyset_page
+from storage.database.preference_cache import PreferenceSnapshot, get_preference_cache
+
+# 批量导入时每批的行数
+BATCH_IMPORT_CHUNK_SIZE = int(os.getenv("BATCH_IMPORT_CHUNK_SIZE", "1000"))
+
+# 支持 INSERT ... ON CONFLICT 的方言
+_CONFLICT_INSERTS = {"postgresql": pg_insert, "sqlite": sqlite_insert}
 
 
 # --- Pydantic Models ---
 class SupplierCreate(BaseModel):
     """创建供应商的模型"""
-    name: str = Field(..., description="供应商名称")
-    company_name: Optional[str] = Field(None, description="公司全称")
-    contact_person: Optional[str] = Field(None, description="联系人")
-    contact_phone: Optional[str] = Field(None, description="联系电话")
-    contact_email: Optional[str] = Field(None, description="联系邮箱")
-    wechat_id: Optional[str] = Field(None, description="微信ID")
-    region: Optional[str] = Field(None, description="所在地区")
-    address: Optional[str] = Field(None, description="详细地址")
-    platform: Optional[str] = Field(None, description="主要平台")
+    name: str = Field(..., max_length=255, description="供应商名称")
+    company_name: Optional[str] = Field(None, max_length=255, description="公司全称")
+    contact_person: Optional[str] = Field(None, max_length=128, description="联系人")
+    contact_phone: Optional[str] = Field(None, max_length=50, description="联系电话")
+    contact_email: Optional[str] = Field(None, max_length=255, description="联系邮箱")
+    wechat_id: Optional[str] = Field(None, max_length=100, description="微信ID")
+    region: Optional[str] = Field(None, max_length=100, description="所在地区")
+    address: Optional[str] = Field(None, max_length=500, description="详细地址")
+    platform: Optional[str] = Field(None, max_length=50, description="主要平台")
     platform_url: Optional[str] = Field(None, description="平台店铺URL")
     min_order_quantity: Optional[int] = Field(None, description="最小起订量")
     is_verified: Optional[bool] = Field(False, description="是否为认证供应商")
@@ -30,7 +47,10 @@ class SupplierCreate(BaseModel):
     categories: Optional[List[str]] = Field(None, description="经营的品类列表")
     tags: Optional[List[str]] = Field(None, description="标签列表")
     notes: Optional[str] = Field(None, description="备注信息")
-    source: Optional[str] = Field(None, description="数据来源")
+    source: Optional[str] = Field(None, max_length=100, description="数据来源")
+
+
+_SUPPLIER_LIST_ADAPTER = TypeAdapter(List[SupplierCreate])
 
 
 class SupplierUpdate(BaseModel):
@@ -110,31 +130,57 @@ class SupplierManager:
 
     # ========== Supplier Operations ==========
     def create_supplier(self, db: Session, supplier_in: SupplierCreate) -> Supplier:
-        """创建新供应商"""
+        """创建新供应商；名称 + 平台已存在时抛出 ValueError"""
         supplier_data = supplier_in.model_dump(exclude_none=True)
-        # 处理JSON字段
-        if supplier_data.get('categories'):
-            supplier_data['categories'] = json.dumps(supplier_data['categories'], ensure_ascii=False)
-        if supplier_data.get('tags'):
-            supplier_data['tags'] = json.dumps(supplier_data['tags'], ensure_ascii=False)
-
         db_supplier = Supplier(**supplier_data)
         db.add(db_supplier)
         try:
             db.commit()
             db.refresh(db_supplier)
             return db_supplier
+        except IntegrityError as e:
+            db.rollback()
+            raise ValueError(f"供应商已存在: {supplier_in.name}（平台: {supplier_in.platform or '未指定'}）") from e
         except Exception as e:
             db.rollback()
             raise
 
-    def get_suppliers(self, db: Session, skip: int = 0, limit: int = 100, **filters) -> List[Supplier]:
-        """获取供应商列表，支持过滤"""
+    def get_suppliers(self, db: Session, skip: int = 0, limit: int = 100,
+                      cursor: Optional[str] = None, **filters) -> List[Supplier]:
+        """获取供应商列表，支持过滤；按创建时间倒序，传入 cursor 时从游标处继续"""
         query = db.query(Supplier)
         for attr, value in filters.items():
             if hasattr(Supplier, attr):
                 query = query.filter(getattr(Supplier, attr) == value)
-        return query.order_by(Supplier.created_at.desc()).offset(skip).limit(limit).all()
+        return keyset_page(query, Supplier.created_at, Supplier.id, cursor, limit, skip).all()
+
+    def get_supplier_by_natural_key(self, db: Session, name: str, platform: Optional[str]) -> Optional[Supplier]:
+        """按自然键（名称 + 平台）获取供应商，平台为空视为同一平台"""
+        return db.query(Supplier).filter(
+            Supplier.name == name, func.coalesce(Supplier.platform, '') == (platform or '')
+        ).order_by(Supplier.id).first()
+
+    def upsert_supplier(self, db: Session, supplier_in: SupplierCreate) -> Tuple[Supplier, bool]:
+        """
+        按自然键创建或更新供应商；更新时只覆盖 supplier_in 中显式提供的非空字段，来源保持不变
+
+        Returns:
+            (供应商, 是否新建)
+        """
+        existing = self.get_supplier_by_natural_key(db, supplier_in.name, supplier_in.platform)
+        if existing is None:
+            defaults = {field: [] for field in ('categories', 'tags') if getattr(supplier_in, field) is None}
+            try:
+                return self.create_supplier(db, supplier_in.model_copy(update=defaults)), True
+            except ValueError:
+                # 查询之后被并发请求抢先创建
+                existing = self.get_supplier_by_natural_key(db, supplier_in.name, supplier_in.platform)
+                if existing is None:
+                    raise
+        updates = SupplierUpdate(**supplier_in.model_dump(
+            exclude_unset=True, exclude_none=True, exclude={'source'}
+        ))
+        return self.update_supplier(db, existing.id, updates), False
 
     def get_supplier_by_id(self, db: Session, supplier_id: int) -> Optional[Supplier]:
         """根据ID获取供应商"""
@@ -143,13 +189,14 @@ class SupplierManager:
     def search_suppliers(self, db: Session, category: Optional[str] = None,
                          region: Optional[str] = None, platform: Optional[str] = None,
                          min_price: Optional[float] = None, max_price: Optional[float] = None,
-                         skip: int = 0, limit: int = 100) -> List[Supplier]:
-        """搜索供应商，支持多条件查询"""
+                         skip: int = 0, limit: int = 100,
+                         cursor: Optional[str] = None) -> List[Supplier]:
+        """搜索供应商，支持多条件查询；按创建时间倒序，传入 cursor 时从游标处继续"""
         query = db.query(Supplier)
 
         if category:
-            # 搜索包含该品类的供应商
-            query = query.filter(Supplier.categories.op('->>')('0').contains(category))
+            # 品类列表包含该品类（JSONB @>，走 GIN 索引）
+            query = query.filter(type_coerce(Supplier.categories, JSONB).contains([category]))
         if region:
             query = query.filter(Supplier.region == region)
         if platform:
@@ -162,7 +209,7 @@ class SupplierManager:
             if max_price:
                 query = query.filter(Product.purchase_price <= max_price)
 
-        return query.distinct().order_by(Supplier.created_at.desc()).offset(skip).limit(limit).all()
+        return keyset_page(query.distinct(), Supplier.created_at, Supplier.id, cursor, limit, skip).all()
 
     def update_supplier(self, db: Session, supplier_id: int, supplier_in: SupplierUpdate) -> Optional[Supplier]:
         """更新供应商信息"""
@@ -171,12 +218,6 @@ class SupplierManager:
             return None
 
         update_data = supplier_in.model_dump(exclude_none=True, exclude_unset=True)
-        # 处理JSON字段
-        if 'categories' in update_data:
-            update_data['categories'] = json.dumps(update_data['categories'], ensure_ascii=False)
-        if 'tags' in update_data:
-            update_data['tags'] = json.dumps(update_data['tags'], ensure_ascii=False)
-
         for field, value in update_data.items():
             if hasattr(db_supplier, field):
                 setattr(db_supplier, field, value)
@@ -214,14 +255,6 @@ class SupplierManager:
             product_data['profit_margin'] = (profit / total_cost * 100) if total_cost > 0 else 0
             product_data['roi'] = (profit / total_cost * 100) if total_cost > 0 else 0
 
-        # 处理JSON字段
-        if product_data.get('image_urls'):
-            product_data['image_urls'] = json.dumps(product_data['image_urls'], ensure_ascii=False)
-        if product_data.get('specifications'):
-            product_data['specifications'] = json.dumps(product_data['specifications'], ensure_ascii=False)
-        if product_data.get('tags'):
-            product_data['tags'] = json.dumps(product_data['tags'], ensure_ascii=False)
-
         db_product = Product(**product_data)
         db.add(db_product)
         try:
@@ -232,31 +265,35 @@ class SupplierManager:
             db.rollback()
             raise
 
-    def get_products(self, db: Session, skip: int = 0, limit: int = 100, **filters) -> List[Product]:
-        """获取产品列表，支持过滤"""
+    def get_products(self, db: Session, skip: int = 0, limit: int = 100,
+                     cursor: Optional[str] = None, **filters) -> List[Product]:
+        """获取产品列表，支持过滤；按创建时间倒序，传入 cursor 时从游标处继续"""
         query = db.query(Product)
         for attr, value in filters.items():
             if hasattr(Product, attr):
                 query = query.filter(getattr(Product, attr) == value)
-        return query.order_by(Product.created_at.desc()).offset(skip).limit(limit).all()
+        return keyset_page(query, Product.created_at, Product.id, cursor, limit, skip).all()
 
     def get_product_by_id(self, db: Session, product_id: int) -> Optional[Product]:
         """根据ID获取产品"""
         return db.query(Product).filter(Product.id == product_id).first()
 
     def get_products_by_supplier(self, db: Session, supplier_id: int,
-                                  skip: int = 0, limit: int = 100) -> List[Product]:
-        """获取指定供应商的产品列表"""
-        return db.query(Product).filter(
+                                  skip: int = 0, limit: int = 100,
+                                  cursor: Optional[str] = None) -> List[Product]:
+        """获取指定供应商的产品列表；按创建时间倒序，传入 cursor 时从游标处继续"""
+        query = db.query(Product).filter(
             Product.supplier_id == supplier_id,
             Product.status == 'active'
-        ).order_by(Product.created_at.desc()).offset(skip).limit(limit).all()
+        )
+        return keyset_page(query, Product.created_at, Product.id, cursor, limit, skip).all()
 
     def search_products(self, db: Session, category: Optional[str] = None,
                         min_price: Optional[float] = None, max_price: Optional[float] = None,
                         min_potential_score: Optional[int] = None,
-                        skip: int = 0, limit: int = 100) -> List[Product]:
-        """搜索产品，支持多条件查询"""
+                        skip: int = 0, limit: int = 100,
+                        cursor: Optional[str] = None) -> List[Product]:
+        """搜索产品，支持多条件查询；按潜力分数倒序，传入 cursor 时从游标处继续"""
         query = db.query(Product).filter(Product.status == 'active')
 
         if category:
@@ -268,7 +305,7 @@ class SupplierManager:
         if min_potential_score:
             query = query.filter(Product.potential_score >= min_potential_score)
 
-        return query.order_by(Product.potential_score.desc()).offset(skip).limit(limit).all()
+        return keyset_page(query, Product.potential_score, Product.id, cursor, limit, skip).all()
 
     def update_product(self, db: Session, product_id: int, product_in: ProductUpdate) -> Optional[Product]:
         """更新产品信息"""
@@ -290,14 +327,6 @@ class SupplierManager:
                 update_data['profit_margin'] = (profit / total_cost * 100) if total_cost > 0 else 0
                 update_data['roi'] = (profit / total_cost * 100) if total_cost > 0 else 0
 
-        # 处理JSON字段
-        if 'image_urls' in update_data:
-            update_data['image_urls'] = json.dumps(update_data['image_urls'], ensure_ascii=False)
-        if 'specifications' in update_data:
-            update_data['specifications'] = json.dumps(update_data['specifications'], ensure_ascii=False)
-        if 'tags' in update_data:
-            update_data['tags'] = json.dumps(update_data['tags'], ensure_ascii=False)
-
         for field, value in update_data.items():
             if hasattr(db_product, field):
                 setattr(db_product, field, value)
@@ -324,12 +353,6 @@ class SupplierManager:
     def create_market_trend(self, db: Session, trend_in: MarketTrendCreate) -> MarketTrend:
         """创建市场趋势记录"""
         trend_data = trend_in.model_dump(exclude_none=True)
-        
-        # 处理JSON字段
-        if trend_data.get('trend_data'):
-            trend_data['trend_data'] = json.dumps(trend_data['trend_data'], ensure_ascii=False)
-        if trend_data.get('hot_keywords'):
-            trend_data['hot_keywords'] = json.dumps(trend_data['hot_keywords'], ensure_ascii=False)
 
         db_trend = MarketTrend(**trend_data)
         db.add(db_trend)
@@ -343,14 +366,50 @@ class SupplierManager:
 
     def get_market_trends(self, db: Session, category: Optional[str] = None,
                           platform: Optional[str] = None,
-                          skip: int = 0, limit: int = 100) -> List[MarketTrend]:
-        """获取市场趋势列表"""
+                          skip: int = 0, limit: int = 100,
+                          cursor: Optional[str] = None) -> List[MarketTrend]:
+        """获取市场趋势列表；按数据日期倒序，传入 cursor 时从游标处继续"""
         query = db.query(MarketTrend)
         if category:
             query = query.filter(MarketTrend.category == category)
         if platform:
             query = query.filter(MarketTrend.platform == platform)
-        return query.order_by(MarketTrend.data_date.desc()).offset(skip).limit(limit).all()
+        return keyset_page(query, MarketTrend.data_date, MarketTrend.id, cursor, limit, skip).all()
+
+    @staticmethod
+    def _day_bucket(db: Session, column):
+        """按天截断的时间表达式：PostgreSQL 用 date_trunc，其他数据库（如测试用的 SQLite）用 date()"""
+        if db.get_bind().dialect.name == "postgresql":
+            return func.date_trunc("day", column)
+        return func.date(column)
+
+    def get_trend_series(self, db: Session, category: Optional[str] = None,
+                         platform: Optional[str] = None, days: int = 30,
+                         now: Optional[datetime] = None) -> List[Row]:
+        """
+        按天聚合最近 days 天的趋势数据，在数据库中完成分组和统计
+
+        只读取 data_date 和 growth_rate，不加载摘要、关键词等大字段；返回的行数最多为 days + 1
+
+        Returns:
+            按日期升序的行，字段：day、avg_growth_rate、min_growth_rate、max_growth_rate、
+            growth_samples（有增长率的记录数）、trend_count（记录数）
+        """
+        since = (now or datetime.now()) - timedelta(days=days)
+        day = self._day_bucket(db, MarketTrend.data_date).label("day")
+        query = db.query(
+            day,
+            func.avg(MarketTrend.growth_rate).label("avg_growth_rate"),
+            func.min(MarketTrend.growth_rate).label("min_growth_rate"),
+            func.max(MarketTrend.growth_rate).label("max_growth_rate"),
+            func.count(MarketTrend.growth_rate).label("growth_samples"),
+            func.count().label("trend_count"),
+        ).filter(MarketTrend.data_date >= since)
+        if category:
+            query = query.filter(MarketTrend.category == category)
+        if platform:
+            query = query.filter(MarketTrend.platform == platform)
+        return query.group_by(day).order_by(day).all()
 
     def get_latest_trend(self, db: Session, category: str,
                          platform: Optional[str] = None) -> Optional[MarketTrend]:
@@ -370,8 +429,26 @@ class SupplierManager:
         return True
 
     # ========== User Preference Operations ==========
-    def get_user_preference(self, db: Session, user_id: str) -> Optional[UserPreference]:
-        """获取用户偏好设置"""
+    def get_user_preference(self, db: Session, user_id: str) -> Optional[PreferenceSnapshot]:
+        """
+        获取用户偏好设置（只读快照）
+
+        优先读进程内缓存，未命中时查询数据库并回填；不存在时返回 None。
+        需要修改偏好请使用 create_or_update_preference
+        """
+        cache = get_preference_cache()
+        snapshot = cache.get(user_id)
+        if snapshot is not None:
+            return snapshot
+        pref = self._get_preference_row(db, user_id)
+        if pref is None:
+            return None
+        snapshot = PreferenceSnapshot.from_model(pref)
+        cache.set(snapshot)
+        return snapshot
+
+    @staticmethod
+    def _get_preference_row(db: Session, user_id: str) -> Optional[UserPreference]:
         return db.query(UserPreference).filter(UserPreference.user_id == user_id).first()
 
     def create_or_update_preference(self, db: Session, user_id: str,
@@ -385,50 +462,57 @@ class SupplierManager:
                                     keywords: Optional[List[str]] = None,
                                     exclude_keywords: Optional[List[str]] = None,
                                     notification_enabled: Optional[bool] = None) -> UserPreference:
-        """创建或更新用户偏好设置"""
-        pref = self.get_user_preference(db, user_id)
+        """创建或更新用户偏好设置，提交后刷新偏好缓存"""
+        cache = get_preference_cache()
+        pref = self._get_preference_row(db, user_id)
         
         if pref:
             # 更新现有偏好
             if preferred_categories is not None:
-                pref.categories = json.dumps(preferred_categories, ensure_ascii=False)
+                pref.preferred_categories = preferred_categories
             if min_price is not None:
                 pref.min_price = min_price
             if max_price is not None:
                 pref.max_price = max_price
             if preferred_platforms is not None:
-                pref.platforms = json.dumps(preferred_platforms, ensure_ascii=False)
+                pref.preferred_platforms = preferred_platforms
             if preferred_regions is not None:
-                pref.regions = json.dumps(preferred_regions, ensure_ascii=False)
+                pref.preferred_regions = preferred_regions
             if min_roi is not None:
                 pref.min_roi = min_roi
             if min_profit_margin is not None:
                 pref.min_profit_margin = min_profit_margin
             if keywords is not None:
-                pref.keywords = json.dumps(keywords, ensure_ascii=False)
+                pref.keywords = keywords
             if exclude_keywords is not None:
-                pref.exclude_keywords = json.dumps(exclude_keywords, ensure_ascii=False)
+                pref.exclude_keywords = exclude_keywords
             if notification_enabled is not None:
                 pref.notification_enabled = notification_enabled
         else:
             # 创建新偏好
             pref = UserPreference(
                 user_id=user_id,
-                preferred_categories=json.dumps(preferred_categories or [], ensure_ascii=False),
+                preferred_categories=preferred_categories or [],
                 min_price=min_price,
                 max_price=max_price,
-                preferred_platforms=json.dumps(preferred_platforms or [], ensure_ascii=False),
-                preferred_regions=json.dumps(preferred_regions or [], ensure_ascii=False),
+                preferred_platforms=preferred_platforms or [],
+                preferred_regions=preferred_regions or [],
                 min_roi=min_roi,
                 min_profit_margin=min_profit_margin,
-                keywords=json.dumps(keywords or [], ensure_ascii=False),
-                exclude_keywords=json.dumps(exclude_keywords or [], ensure_ascii=False),
+                keywords=keywords or [],
+                exclude_keywords=exclude_keywords or [],
                 notification_enabled=notification_enabled if notification_enabled is not None else True
             )
             db.add(pref)
         
-        db.commit()
-        db.refresh(pref)
+        try:
+            db.commit()
+            db.refresh(pref)
+        except Exception:
+            db.rollback()
+            cache.invalidate(user_id)
+            raise
+        cache.set(PreferenceSnapshot.from_model(pref))
         return pref
 
     # ========== Notification Operations ==========
@@ -441,7 +525,7 @@ class SupplierManager:
             notification_type=notification_type,
             title=title,
             content=content,
-            data=json.dumps(data or {}, ensure_ascii=False),
+            data=data or {},
             priority=priority
         )
         db.add(notification)
@@ -450,12 +534,13 @@ class SupplierManager:
         return notification
 
     def get_notifications(self, db: Session, user_id: str, is_read: Optional[bool] = None,
-                          skip: int = 0, limit: int = 20) -> List[Notification]:
-        """获取用户通知列表"""
+                          skip: int = 0, limit: int = 20,
+                          cursor: Optional[str] = None) -> List[Notification]:
+        """获取用户通知列表；按创建时间倒序，传入 cursor 时从游标处继续"""
         query = db.query(Notification).filter(Notification.user_id == user_id)
         if is_read is not None:
             query = query.filter(Notification.is_read == is_read)
-        return query.order_by(Notification.created_at.desc()).offset(skip).limit(limit).all()
+        return keyset_page(query, Notification.created_at, Notification.id, cursor, limit, skip).all()
 
     def mark_notification_read(self, db: Session, notification_id: int) -> bool:
         """标记通知为已读"""
@@ -484,89 +569,388 @@ class SupplierManager:
         return self.create_notification(db, user_id, "trend_alert", title, content, data, priority)
 
     # ========== Smart Recommendation Operations ==========
-    def recommend_products(self, db: Session, user_id: str, limit: int = 10) -> List[Product]:
-        """基于用户偏好推荐产品"""
-        pref = self.get_user_preference(db, user_id)
+    # 推荐列表需要的字段（不加载 description、specifications 等大字段）
+    RECOMMENDATION_COLUMNS = (
+        Product.id, Product.name, Product.category, Product.supplier_id,
+        Product.purchase_price, Product.estimated_price, Product.profit_margin,
+        Product.roi, Product.potential_score, Product.image_urls, Product.tags, Product.notes,
+    )
+
+    def _ranked_products(self, pref: Optional[PreferenceSnapshot], limit: int):
+        """
+        在排名表上按偏好过滤，返回排名前 limit 的 (product_id, potential_score, roi) 子查询
+
+        有偏好品类时每个品类各取前 limit 条再合并：每个分支都能沿
+        ix_product_rankings_category_rank 的顺序读取并提前结束，避免取出偏好品类下的全部产品再排序
+        """
+        R = ProductRanking
+        conditions = [R.status == 'active']
         if not pref:
             # 无偏好设置，返回潜力分最高的产品
-            return db.query(Product).filter(
-                Product.status == 'active',
-                Product.potential_score >= 7
-            ).order_by(Product.potential_score.desc()).limit(limit).all()
-        
-        query = db.query(Product).filter(Product.status == 'active')
-        
-        # 解析偏好
-        categories = []
-        if pref.preferred_categories is not None:
-            try:
-                categories = json.loads(pref.preferred_categories)
-            except:
-                pass
-        
-        if categories:
-            query = query.filter(Product.category.in_(categories))
-        
-        if pref.min_price:
-            query = query.filter(Product.purchase_price >= pref.min_price)
-        
-        if pref.max_price:
-            query = query.filter(Product.purchase_price <= pref.max_price)
-        
-        if pref.min_roi:
-            query = query.filter(Product.roi >= pref.min_roi)
-        
-        if pref.min_profit_margin:
-            query = query.filter(Product.profit_margin >= pref.min_profit_margin)
-        
+            conditions.append(R.potential_score >= 7)
+        else:
+            if pref.min_price:
+                conditions.append(R.purchase_price >= pref.min_price)
+            if pref.max_price:
+                conditions.append(R.purchase_price <= pref.max_price)
+            if pref.min_roi:
+                conditions.append(R.roi >= pref.min_roi)
+            if pref.min_profit_margin:
+                conditions.append(R.profit_margin >= pref.min_profit_margin)
+
+        columns = (R.product_id, R.potential_score, R.roi)
         # 按潜力分数和ROI排序
-        return query.order_by(
-            Product.potential_score.desc(),
-            Product.roi.desc()
-        ).limit(limit).all()
+        order = (R.potential_score.desc(), R.roi.desc())
+        categories = list(dict.fromkeys(pref.preferred_categories)) if pref else []
+        if not categories:
+            return select(*columns).where(*conditions).order_by(*order).limit(limit).subquery()
+
+        branches = [
+            select(*columns).where(R.category == category, *conditions).order_by(*order).limit(limit).subquery()
+            for category in categories
+        ]
+        if len(branches) == 1:
+            return branches[0]
+        return union_all(*[select(branch) for branch in branches]).subquery()
+
+    def _recommendation_query(self, db: Session, user_id: str, limit: int, *entities):
+        """构建推荐查询，entities 为查询的实体或列；偏好从缓存读取，排名从排名表读取"""
+        ranked = self._ranked_products(self.get_user_preference(db, user_id), limit)
+        return db.query(*entities).join(ranked, Product.id == ranked.c.product_id).order_by(
+            ranked.c.potential_score.desc(),
+            ranked.c.roi.desc()
+        )
+
+    def recommend_products(self, db: Session, user_id: str, limit: int = 10) -> List[Product]:
+        """基于用户偏好推荐产品"""
+        return self._recommendation_query(db, user_id, limit, Product).limit(limit).all()
+
+    def recommend_product_rows(self, db: Session, user_id: str, limit: int = 10) -> List[Row]:
+        """
+        基于用户偏好推荐产品，连同供应商名称和平台一次查询返回
+
+        通过 LEFT JOIN 取供应商字段，避免逐个产品查询供应商；返回轻量的行元组
+        （字段同 RECOMMENDATION_COLUMNS，另含 supplier_name、supplier_platform），不构造 ORM 实体
+        """
+        return self._recommendation_query(
+            db, user_id, limit,
+            *self.RECOMMENDATION_COLUMNS,
+            Supplier.name.label("supplier_name"),
+            Supplier.platform.label("supplier_platform"),
+        ).outerjoin(Supplier, Product.supplier_id == Supplier.id).limit(limit).all()
+
+    def refresh_product_rankings(self, db: Session) -> int:
+        """
+        按产品表全量重建排名表
+
+        用于首次上线回填，以及批量 INSERT 等绕过 ORM 事件的写入之后
+
+        Returns:
+            排名行数
+        """
+        db.execute(delete(ProductRanking))
+        columns = ("product_id",) + PRODUCT_RANKING_COLUMNS
+        db.execute(insert(ProductRanking).from_select(
+            columns,
+            select(Product.id, *[getattr(Product, column) for column in PRODUCT_RANKING_COLUMNS])
+        ))
+        db.commit()
+        return db.query(func.count(ProductRanking.product_id)).scalar()
 
     # ========== Batch Import Operations ==========
     def batch_import_suppliers(self, db: Session, suppliers_data: List[Dict[str, Any]],
-                                source: str = "batch_import") -> Dict[str, Any]:
-        """批量导入供应商数据"""
-        success_count = 0
-        failed_count = 0
+                                source: str = "batch_import",
+                                chunk_size: int = BATCH_IMPORT_CHUNK_SIZE) -> Dict[str, Any]:
+        """
+        批量导入供应商数据
+
+        按 chunk_size 分批：每批整体做一次 Pydantic 校验，按自然键（名称 + 平台）一次查询已存在的供应商，
+        新供应商批量插入，已存在的批量更新非空字段。整个导入在一个事务中提交，
+        每批使用保存点，某批写入失败只回滚该批并把其中的行记为失败。
+
+        自然键上有唯一索引（uq_suppliers_name_platform，由 scripts/init_db.py 在没有重复数据时创建），
+        并发导入同一供应商时不会插入重复行：查询之后被其他导入抢先插入的行改为更新
+        """
+        inserted = 0
+        updated = 0
         failed_items = []
-        
-        for idx, item in enumerate(suppliers_data):
+
+        for offset in range(0, len(suppliers_data), chunk_size):
+            chunk = suppliers_data[offset:offset + chunk_size]
+            valid, errors = self._validate_supplier_chunk(chunk, offset, source)
+            failed_items.extend(errors)
+            if not valid:
+                continue
             try:
-                supplier_in = SupplierCreate(
-                    name=item.get('name', f'供应商_{idx}'),
-                    company_name=item.get('company_name'),
-                    contact_person=item.get('contact_person'),
-                    contact_phone=item.get('contact_phone'),
-                    contact_email=item.get('contact_email'),
-                    wechat_id=item.get('wechat_id'),
-                    region=item.get('region'),
-                    address=item.get('address'),
-                    platform=item.get('platform'),
-                    platform_url=item.get('platform_url'),
-                    min_order_quantity=item.get('min_order_quantity'),
-                    is_verified=item.get('is_verified', False),
-                    rating=item.get('rating'),
-                    categories=item.get('categories', []),
-                    tags=item.get('tags', []),
-                    notes=item.get('notes'),
-                    source=source
-                )
-                self.create_supplier(db, supplier_in)
-                success_count += 1
+                with db.begin_nested():
+                    chunk_inserted, chunk_updated = self._upsert_supplier_chunk(db, valid)
+                inserted += chunk_inserted
+                updated += chunk_updated
             except Exception as e:
-                failed_count += 1
-                failed_items.append({
-                    "index": idx,
-                    "data": item,
-                    "error": str(e)
-                })
-        
+                failed_items.extend(
+                    {"index": idx, "data": suppliers_data[idx], "error": str(e)} for idx, _, _ in valid
+                )
+
+        try:
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+        failed_items.sort(key=lambda item: item["index"])
         return {
             "total": len(suppliers_data),
-            "success": success_count,
-            "failed": failed_count,
+            "success": inserted + updated,
+            "inserted": inserted,
+            "updated": updated,
+            "failed": len(failed_items),
             "failed_items": failed_items
         }
+
+    @staticmethod
+    def _validate_supplier_chunk(chunk: List[Dict[str, Any]], offset: int, source: str
+                                 ) -> Tuple[List[Tuple[int, Dict[str, Any], Dict[str, Any]]], List[Dict[str, Any]]]:
+        """整批校验，返回 (有效行 [(原始下标, 完整数据, 提供的字段)], 失败行)"""
+        rows = []
+        for i, item in enumerate(chunk):
+            row = {field: item.get(field) for field in SupplierCreate.model_fields if field in item}
+            row.setdefault('name', f'供应商_{offset + i}')
+            row['source'] = source
+            rows.append(row)
+
+        errors: Dict[int, List[str]] = {}
+        try:
+            models = _SUPPLIER_LIST_ADAPTER.validate_python(rows)
+        except ValidationError as e:
+            for err in e.errors():
+                loc = err.get('loc') or (None,)
+                field = ".".join(str(part) for part in loc[1:])
+                errors.setdefault(loc[0], []).append(f"{field}: {err.get('msg')}" if field else err.get('msg'))
+            ok_rows = [row for i, row in enumerate(rows) if i not in errors]
+            models = _SUPPLIER_LIST_ADAPTER.validate_python(ok_rows)
+
+        ok_indexes = [i for i in range(len(chunk)) if i not in errors]
+        valid = []
+        for i, model in zip(ok_indexes, models):
+            data = model.model_dump()
+            if data['is_verified'] is None:
+                data['is_verified'] = False
+            # 导入数据中实际提供的非空字段，更新已存在的供应商时只覆盖这些字段
+            provided = model.model_dump(exclude_unset=True, exclude_none=True)
+            for field in ('categories', 'tags'):
+                if data[field] is None:
+                    data[field] = []
+            valid.append((offset + i, data, provided))
+        failed = [
+            {"index": offset + i, "data": chunk[i], "error": "; ".join(msgs)}
+            for i, msgs in sorted(errors.items())
+        ]
+        return valid, failed
+
+    @staticmethod
+    def _upsert_supplier_chunk(db: Session,
+                               valid: List[Tuple[int, Dict[str, Any], Dict[str, Any]]]) -> Tuple[int, int]:
+        """按自然键（名称 + 平台）插入或更新一批供应商，返回 (插入数, 更新数)"""
+        # 批内重复的自然键合并为一行，后出现的行提供的字段覆盖前面的
+        latest: Dict[Tuple[str, str], Tuple[Dict[str, Any], Dict[str, Any]]] = {}
+        for _, data, provided in valid:
+            key = (data['name'], data['platform'] or '')
+            if key in latest:
+                prev_data, prev_provided = latest[key]
+                data, provided = {**prev_data, **provided}, {**prev_provided, **provided}
+            latest[key] = (data, provided)
+        duplicates = len(valid) - len(latest)
+
+        existing = SupplierManager._supplier_ids(db, list(latest))
+        to_insert = [data for key, (data, _) in latest.items() if key not in existing]
+        raced = SupplierManager._insert_suppliers(db, to_insert)
+        if raced:
+            existing.update(SupplierManager._supplier_ids(db, list(raced)))
+
+        now = datetime.now()
+        to_update = [
+            {**provided, 'id': existing[key], 'updated_at': now}
+            for key, (_, provided) in latest.items() if key in existing
+        ]
+        if to_update:
+            db.execute(update(Supplier), to_update)
+        return len(to_insert) - len(raced), len(to_update) + duplicates
+
+    @staticmethod
+    def _supplier_ids(db: Session, keys: List[Tuple[str, str]]) -> Dict[Tuple[str, str], int]:
+        """按自然键（名称, 平台或空串）查询供应商 ID"""
+        platform_key = func.coalesce(Supplier.platform, '')
+        return {
+            (name, platform): supplier_id
+            for supplier_id, name, platform in db.query(
+                Supplier.id, Supplier.name, platform_key
+            ).filter(tuple_(Supplier.name, platform_key).in_(keys)).all()
+        }
+
+    @staticmethod
+    def _insert_suppliers(db: Session, rows: List[Dict[str, Any]]) -> Set[Tuple[str, str]]:
+        """
+        批量插入新供应商，返回因自然键冲突而跳过的键
+
+        查询之后、插入之前其他导入可能已插入同一供应商；支持 ON CONFLICT 的数据库上
+        这些行被跳过而不是让整批失败，由调用方改为更新
+        """
+        if not rows:
+            return set()
+        dialect_insert = _CONFLICT_INSERTS.get(db.get_bind().dialect.name)
+        if dialect_insert is None:
+            db.execute(insert(Supplier), rows)
+            return set()
+        # 不指定冲突目标：唯一索引因历史重复数据尚未创建时语句仍可执行（只是没有并发保护）
+        platform_key = func.coalesce(Supplier.platform, literal_column("''"))
+        stmt = dialect_insert(Supplier).values(rows).on_conflict_do_nothing().returning(
+            Supplier.name, platform_key
+        )
+        inserted = {tuple(row) for row in db.execute(stmt)}
+        return {(row['name'], row['platform'] or '') for row in rows} - inserted
+
+    def find_duplicate_suppliers(self, db: Session) -> List[Dict[str, Any]]:
+        """
+        找出自然键（名称 + 平台）重复的供应商，并给出合并方案，不修改数据
+
+        每组保留 ID 最小的一行：保留行为空的字段用重复行的值补齐，品类/标签取并集，
+        备注拼接；保留行已有而重复行不同的值不会被丢弃，以 "[合并自 #id] 字段: 值" 追加到备注
+
+        Returns:
+            每组一项: {name, platform, keep_id, duplicate_ids, updates, conflicts}
+        """
+        platform_key = func.coalesce(Supplier.platform, '')
+        groups = db.query(Supplier.name, platform_key).group_by(
+            Supplier.name, platform_key
+        ).having(func.count() > 1).all()
+        if not groups:
+            return []
+
+        suppliers = db.query(Supplier).filter(
+            tuple_(Supplier.name, platform_key).in_([tuple(group) for group in groups])
+        ).order_by(Supplier.id).all()
+        grouped: Dict[Tuple[str, str], List[Supplier]] = {}
+        for supplier in suppliers:
+            grouped.setdefault((supplier.name, supplier.platform or ''), []).append(supplier)
+        return [_plan_supplier_merge(rows) for rows in grouped.values()]
+
+    def merge_duplicate_suppliers(self, db: Session) -> List[Dict[str, Any]]:
+        """
+        按 find_duplicate_suppliers 的方案合并重复供应商，以便创建唯一索引
+
+        保留行写入补齐的字段，重复行的产品（及排名表中的行）改挂到保留行，然后删除重复行
+
+        Returns:
+            已执行的合并方案
+        """
+        plans = self.find_duplicate_suppliers(db)
+        if not plans:
+            return plans
+        has_rankings = inspect(db.get_bind()).has_table(ProductRanking.__tablename__)
+        for plan in plans:
+            keep_id, ids = plan["keep_id"], plan["duplicate_ids"]
+            if plan["updates"]:
+                db.execute(update(Supplier).where(Supplier.id == keep_id).values(**plan["updates"]))
+            db.execute(update(Product).where(Product.supplier_id.in_(ids)).values(supplier_id=keep_id))
+            if has_rankings:
+                db.execute(update(ProductRanking).where(ProductRanking.supplier_id.in_(ids))
+                           .values(supplier_id=keep_id))
+            db.execute(delete(Supplier).where(Supplier.id.in_(ids)))
+        db.commit()
+        return plans
+
+
+# 合并重复供应商时，保留行为空才补齐的字段
+_SUPPLIER_FILL_FIELDS = (
+    'company_name', 'contact_person', 'contact_phone', 'contact_email', 'wechat_id',
+    'region', 'address', 'platform_url', 'min_order_quantity', 'rating',
+)
+
+
+def _as_list(value: Any) -> List[Any]:
+    """列表字段的值；迁移前的行可能是二次编码的 JSON 字符串"""
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return [value]
+    return list(value) if isinstance(value, list) else []
+
+
+def _plan_supplier_merge(rows: List[Supplier]) -> Dict[str, Any]:
+    """为同一自然键下按 ID 排序的一组供应商生成合并方案"""
+    keep, duplicates = rows[0], rows[1:]
+    updates: Dict[str, Any] = {}
+    conflicts: Dict[str, List[Any]] = {}
+    notes = [keep.notes] if keep.notes else []
+
+    for field in _SUPPLIER_FILL_FIELDS:
+        current = getattr(keep, field)
+        for row in duplicates:
+            value = getattr(row, field)
+            if value is None or value == '' or value == current:
+                continue
+            if current is None or current == '':
+                current = updates[field] = value
+            else:
+                conflicts.setdefault(field, []).append(value)
+                notes.append(f"[合并自 #{row.id}] {field}: {value}")
+
+    for field in ('categories', 'tags'):
+        merged = _as_list(getattr(keep, field))
+        for row in duplicates:
+            merged.extend(item for item in _as_list(getattr(row, field)) if item not in merged)
+        if merged != _as_list(getattr(keep, field)) or isinstance(getattr(keep, field), str):
+            updates[field] = merged
+
+    for row in duplicates:
+        if row.notes and row.notes not in notes:
+            notes.append(row.notes)
+    if notes and "\n".join(notes) != (keep.notes or ''):
+        updates['notes'] = "\n".join(notes)
+    if not keep.is_verified and any(row.is_verified for row in duplicates):
+        updates['is_verified'] = True
+
+    return {
+        "name": keep.name,
+        "platform": keep.platform,
+        "keep_id": keep.id,
+        "duplicate_ids": [row.id for row in duplicates],
+        "updates": updates,
+        "conflicts": conflicts,
+    }
+
+
+class AsyncSupplierManager:
+    """
+    SupplierManager 的异步版本：方法与 SupplierManager 同名同参，第一个参数换成 AsyncSession
+
+    查询逻辑不重复实现，每个方法通过 AsyncSession.run_sync 在异步连接上执行同名的同步方法，
+    SQL 经异步驱动发出，等待数据库期间不占用线程
+
+    Example:
+        async with async_session_scope() as db:
+            rows = await AsyncSupplierManager().recommend_product_rows(db, "user_1", 10)
+    """
+
+    def __init__(self, manager: Optional[SupplierManager] = None):
+        self._manager = manager or SupplierManager()
+
+
+def _async_method(name: str):
+    sync_method = getattr(SupplierManager, name)
+
+    async def method(self, db: AsyncSession, *args, **kwargs):
+        bound = getattr(self._manager, name)
+        return await db.run_sync(lambda session: bound(session, *args, **kwargs))
+
+    method.__name__ = name
+    method.__qualname__ = f"AsyncSupplierManager.{name}"
+    method.__doc__ = sync_method.__doc__
+    return method
+
+
+for _name, _member in list(vars(SupplierManager).items()):
+    if not _name.startswith("_") and callable(_member):
+        setattr(AsyncSupplierManager, _name, _async_method(_name))
+del _name, _member
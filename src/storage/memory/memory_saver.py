@@ -109,10 +109,14 @@ class MemoryManager:
 
         # 4. 尝试创建连接池和 checkpointer
         try:
+            from storage.database.db import DB_CHECKPOINT_POOL_SIZE
             self._pool = AsyncConnectionPool(
                 conninfo=db_url,
                 timeout=DB_CONNECTION_TIMEOUT,
                 min_size=1,
+                # 检查点连接需要 search_path=memory 和 autocommit，不与业务库的异步引擎共用连接池；
+                # 两者合计不超过 DB_MAX_CONNECTIONS（见 storage.database.db.async_pool_limits）
+                max_size=DB_CHECKPOINT_POOL_SIZE,
                 max_idle=300,
             )
             self._checkpointer = AsyncPostgresSaver(self._pool)
@@ -139,12 +139,13 @@ class S3SyncStorage:
             example = bad[0] if bad else "非法字符"
             raise ValueError(msg + f"（原因：包含非法字符，例如：{example}）")
 
-    def upload_file(self, *, file_content: bytes, file_name: str, content_type: str = "application/octet-stream", bucket: Optional[str] = None) -> str:
+    def upload_file(self, *, file_content: bytes, file_name: str, content_type: str = "application/octet-stream", bucket: Optional[str] = None, unique: bool = True) -> str:
+        """上传文件，返回对象 key；unique=False 时直接以 file_name 为 key（内容寻址存储等需要固定 key 的场景）"""
         # 先对输入文件名做规范校验，避免生成无效对象 key
         self._validate_file_name(file_name)
         try:
             client = self._get_client()
-            object_key = self._generate_object_key(original_name=file_name)
+            object_key = self._generate_object_key(original_name=file_name) if unique else file_name
             target_bucket = self._resolve_bucket(bucket)
             client.put_object(Bucket=target_bucket, Key=object_key, Body=file_content, ContentType=content_type)
             return object_key
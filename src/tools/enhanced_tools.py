@@ -4,10 +4,9 @@
 """
 import json
 from langchain.tools import tool, ToolRuntime
-from coze_coding_utils.runtime_ctx.context import new_context
-from coze_coding_dev_sdk import SearchClient, get_session
+from utils.search_client_pool import get_search_client
 from utils.cache_manager import get_cache_manager, cache_key
-from utils.rate_limiter import check_service_available, handle_service_error, retry_with_backoff
+from utils.rate_limiter import check_service_available, retry_with_backoff
 from utils.fallback_service import get_fallback_service, save_search_result_cache
 
 
@@ -36,8 +35,8 @@ def web_search_tool_with_cache(query: str, count: int = 10, need_summary: bool =
         result_data["message"] = "从缓存返回数据（服务可能限流，使用缓存避免重复请求）"
         return json.dumps(result_data, ensure_ascii=False, indent=2)
     
-    # 检查服务可用性
-    if not check_service_available("search"):
+    # 检查服务可用性（search.web 熔断器）
+    if not check_service_available("search.web"):
         # 服务不可用，使用降级数据
         fallback = get_fallback_service()
         fallback_result = fallback.get_fallback_search_results(query, "通用")
@@ -45,8 +44,7 @@ def web_search_tool_with_cache(query: str, count: int = 10, need_summary: bool =
     
     try:
         # 执行搜索
-        ctx = new_context(method="search.web")
-        client = SearchClient(ctx=ctx)
+        client = get_search_client("search.web")
         
         response = client.web_search(
             query=query,
@@ -84,10 +82,7 @@ def web_search_tool_with_cache(query: str, count: int = 10, need_summary: bool =
         return json.dumps(output, ensure_ascii=False, indent=2)
         
     except Exception as e:
-        # 服务错误，标记服务不可用
-        handle_service_error("search", cooldown=300)
-        
-        # 使用降级数据
+        # 失败已由 search.web 熔断器记录，这里直接使用降级数据
         fallback = get_fallback_service()
         fallback_result = fallback.get_fallback_search_results(query, "通用")
         fallback_result["error"] = str(e)
@@ -95,20 +90,17 @@ def web_search_tool_with_cache(query: str, count: int = 10, need_summary: bool =
 
 
 @tool
-def batch_search_with_rate_limit(queries: list, delay: float = 2.0) -> str:
+def batch_search_with_rate_limit(queries: list) -> str:
     """
     批量搜索，带限流保护。
-    在多个搜索之间自动添加延迟，避免触发限流。
+    搜索请求统一经过共享的 search 配额（令牌桶），配额充足时连续执行，不足时按需等待。
     
     Args:
         queries: 搜索关键词列表
-        delay: 搜索之间的延迟（秒）
     
     Returns:
         批量搜索结果
     """
-    import time
-    
     results = []
     cache = get_cache_manager()
     
@@ -124,13 +116,8 @@ def batch_search_with_rate_limit(queries: list, delay: float = 2.0) -> str:
             results.append(result_data)
             continue
         
-        # 不是第一个查询，添加延迟
-        if idx > 0:
-            time.sleep(delay)
-        
         try:
-            ctx = new_context(method="search.batch")
-            client = SearchClient(ctx=ctx)
+            client = get_search_client("search.batch")
             
             response = client.web_search(
                 query=query,
@@ -190,17 +177,25 @@ def get_service_status() -> str:
     from utils.rate_limiter import get_service_availability
     from utils.cache_manager import get_cache_manager
     from utils.fallback_service import get_fallback_service
+    from utils.deadline_executor import get_deadline_executor
+    from utils.search_cache import get_search_cache
+    from utils.rate_limiter import get_rate_limit_stats
+    from utils.circuit_breaker import get_circuit_breaker_status
     
     availability = get_service_availability()
     cache = get_cache_manager()
     fallback = get_fallback_service()
     
-    services = ["search", "database", "trend"]
+    # 默认服务之外，列出已创建的所有熔断器（按工具划分的搜索、llm、vision 等）
+    services = sorted(set(["search.web", "llm", "vision"]) | set(get_circuit_breaker_status()))
     
     status_info = {
         "timestamp": "当前时间",
         "services": {},
         "cache_stats": cache.get_stats(),
+        "tool_call_stats": get_deadline_executor().get_stats(),
+        "search_cache_stats": get_search_cache().get_stats(),
+        "rate_limit_stats": get_rate_limit_stats(),
         "fallback_data_dir": fallback.fallback_data_dir
     }
     
@@ -211,6 +206,8 @@ def get_service_status() -> str:
         status_info["services"][service] = {
             "available": is_available,
             "status": "可用" if is_available else "限流/不可用",
+            "state": status.get("state"),
+            "retry_after": status.get("retry_after"),
             "last_checked": status.get("last_checked", "未知")
         }
     
@@ -2,51 +2,101 @@
 缓存管理器
 用于减少重复的数据库查询和搜索请求
 """
+import os
+import threading
 import time
-import json
+from collections import OrderedDict
 from typing import Any, Optional
-from datetime import datetime, timedelta
+
+# 默认最多保留的条目数
+CACHE_MAX_SIZE = int(os.getenv("CACHE_MAX_SIZE", "1024"))
+# 后台清理过期条目的间隔（秒）
+CACHE_SWEEP_INTERVAL = float(os.getenv("CACHE_SWEEP_INTERVAL", "60"))
 
 
 class CacheManager:
-    """简单的内存缓存管理器"""
-    
-    def __init__(self, default_ttl: int = 3600):
+    """有容量上限、线程安全的内存 LRU/TTL 缓存"""
+
+    def __init__(self, default_ttl: int = 3600, max_size: int = CACHE_MAX_SIZE,
+                 sweep_interval: float = CACHE_SWEEP_INTERVAL):
         """
         初始化缓存管理器
-        
+
         Args:
             default_ttl: 默认缓存过期时间（秒），默认1小时
+            max_size: 最多保留的条目数，超出时淘汰最久未使用的条目
+            sweep_interval: 后台清理过期条目的间隔（秒），小于等于 0 时不启动后台清理
         """
-        self.cache = {}
+        # key -> (value, expires_at)，expires_at 基于 time.monotonic()
+        self.cache: "OrderedDict[str, tuple]" = OrderedDict()
         self.default_ttl = default_ttl
-    
+        self.max_size = max_size
+        self.sweep_interval = sweep_interval
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._stop_event = threading.Event()
+        self._sweeper: Optional[threading.Thread] = None
+
+    def _ensure_sweeper(self) -> None:
+        """首次写入时启动后台清理线程"""
+        if self.sweep_interval <= 0 or self._sweeper is not None:
+            return
+        self._sweeper = threading.Thread(target=self._sweep_loop, name="cache-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def _sweep_loop(self) -> None:
+        while not self._stop_event.wait(self.sweep_interval):
+            self.sweep()
+
+    def sweep(self) -> int:
+        """
+        清理所有过期条目
+
+        Returns:
+            清理的条目数
+        """
+        now = time.monotonic()
+        with self._lock:
+            expired = [k for k, (_, expires_at) in self.cache.items() if expires_at <= now]
+            for k in expired:
+                del self.cache[k]
+            self._expirations += len(expired)
+        return len(expired)
+
     def get(self, key: str) -> Optional[Any]:
         """
         获取缓存值
-        
+
         Args:
             key: 缓存键
-        
+
         Returns:
             缓存值，如果不存在或已过期则返回 None
         """
-        if key not in self.cache:
-            return None
-        
-        item = self.cache[key]
-        
-        # 检查是否过期
-        if item['expires_at'] < datetime.now():
-            del self.cache[key]
-            return None
-        
-        return item['value']
-    
+        with self._lock:
+            item = self.cache.get(key)
+            if item is None:
+                self._misses += 1
+                return None
+
+            # 检查是否过期
+            if item[1] <= time.monotonic():
+                del self.cache[key]
+                self._expirations += 1
+                self._misses += 1
+                return None
+
+            self.cache.move_to_end(key)
+            self._hits += 1
+            return item[0]
+
     def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
         """
         设置缓存值
-        
+
         Args:
             key: 缓存键
             value: 缓存值
@@ -54,71 +104,90 @@ class CacheManager:
         """
         if ttl is None:
             ttl = self.default_ttl
-        
-        expires_at = datetime.now() + timedelta(seconds=ttl)
-        
-        self.cache[key] = {
-            'value': value,
-            'expires_at': expires_at,
-            'created_at': datetime.now()
-        }
-    
+
+        expires_at = time.monotonic() + ttl
+
+        with self._lock:
+            self.cache[key] = (value, expires_at)
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.max_size:
+                self.cache.popitem(last=False)
+                self._evictions += 1
+            self._ensure_sweeper()
+
     def delete(self, key: str) -> bool:
         """
         删除缓存值
-        
+
         Args:
             key: 缓存键
-        
+
         Returns:
             是否删除成功
         """
-        if key in self.cache:
-            del self.cache[key]
-            return True
-        return False
-    
+        with self._lock:
+            if key in self.cache:
+                del self.cache[key]
+                return True
+            return False
+
     def clear(self) -> None:
         """清空所有缓存"""
-        self.cache.clear()
-    
+        with self._lock:
+            self.cache.clear()
+
+    def close(self) -> None:
+        """停止后台清理线程"""
+        self._stop_event.set()
+
     def get_stats(self) -> dict:
         """
         获取缓存统计信息
-        
+
         Returns:
             统计信息字典
         """
-        now = datetime.now()
-        active_count = sum(1 for item in self.cache.values() if item['expires_at'] >= now)
-        expired_count = len(self.cache) - active_count
-        
-        return {
-            'total_keys': len(self.cache),
-            'active_keys': active_count,
-            'expired_keys': expired_count
-        }
+        now = time.monotonic()
+        with self._lock:
+            active_count = sum(1 for _, expires_at in self.cache.values() if expires_at > now)
+            expired_count = len(self.cache) - active_count
+            lookups = self._hits + self._misses
+
+            return {
+                'total_keys': len(self.cache),
+                'active_keys': active_count,
+                'expired_keys': expired_count,
+                'max_size': self.max_size,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': round(self._hits / lookups, 4) if lookups else 0.0,
+                'evictions': self._evictions,
+                'expirations': self._expirations,
+            }
 
 
 # 全局缓存管理器实例
 _cache_manager = None
+_cache_manager_lock = threading.Lock()
 
 def get_cache_manager() -> CacheManager:
     """获取全局缓存管理器实例"""
     global _cache_manager
     if _cache_manager is None:
-        _cache_manager = CacheManager()
+        with _cache_manager_lock:
+            if _cache_manager is None:
+                _cache_manager = CacheManager()
     return _cache_manager
 
 
 def cache_key(prefix: str, **kwargs) -> str:
     """
     生成缓存键
-    
+
     Args:
         prefix: 键前缀
         **kwargs: 键参数
-    
+
     Returns:
         缓存键字符串
     """
@@ -0,0 +1,278 @@
+"""
+熔断器
+按工具/服务统计滚动窗口内的失败率和慢调用率，超过阈值时熔断；熔断期结束后进入半开状态，
+只放行少量探测请求，探测成功才恢复，避免上游未恢复时被积压请求同时打满
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+# 默认阈值，可通过环境变量调整
+CIRCUIT_WINDOW_SIZE = int(os.getenv("CIRCUIT_WINDOW_SIZE", "20"))
+CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", "5"))
+CIRCUIT_FAILURE_RATE = float(os.getenv("CIRCUIT_FAILURE_RATE", "0.5"))
+CIRCUIT_SLOW_CALL_SECONDS = float(os.getenv("CIRCUIT_SLOW_CALL_SECONDS", "8"))
+CIRCUIT_SLOW_CALL_RATE = float(os.getenv("CIRCUIT_SLOW_CALL_RATE", "0.8"))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+CIRCUIT_HALF_OPEN_PROBES = int(os.getenv("CIRCUIT_HALF_OPEN_PROBES", "2"))
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，调用被直接拒绝"""
+
+    def __init__(self, name: str, retry_after: float):
+        self.name = name
+        self.retry_after = retry_after
+        super().__init__(f"Circuit '{name}' is open, retry after {retry_after:.1f}s")
+
+
+class CircuitBreaker:
+    """
+    单个工具/服务的熔断器
+
+    - closed: 正常放行，记录最近 window_size 次调用的结果；调用数达到 min_calls 后，
+      失败率或慢调用率超过阈值即熔断
+    - open: 直接拒绝，open_seconds 后进入半开
+    - half_open: 最多同时放行 half_open_probes 个探测请求；全部成功则关闭，任一失败重新熔断。
+      只有本轮半开放行的探测请求的结果参与判断，熔断前已放行、此时才返回的调用不计入
+    """
+
+    def __init__(self, name: str,
+                 window_size: int = CIRCUIT_WINDOW_SIZE,
+                 min_calls: int = CIRCUIT_MIN_CALLS,
+                 failure_rate: float = CIRCUIT_FAILURE_RATE,
+                 slow_call_seconds: float = CIRCUIT_SLOW_CALL_SECONDS,
+                 slow_call_rate: float = CIRCUIT_SLOW_CALL_RATE,
+                 open_seconds: float = CIRCUIT_OPEN_SECONDS,
+                 half_open_probes: int = CIRCUIT_HALF_OPEN_PROBES):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+
+        self._lock = threading.Lock()
+        self._state = STATE_CLOSED
+        # (是否失败, 是否慢调用)
+        self._window: Deque[Tuple[bool, bool]] = deque(maxlen=window_size)
+        self._open_until = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        # 每次进入半开加一，用于识别本轮放行的探测请求
+        self._generation = 0
+        self._stats = {"calls": 0, "failures": 0, "slow_calls": 0, "rejected": 0, "opened": 0}
+        self._last_changed = time.time()
+
+    def _transition(self, state: str) -> None:
+        if state == self._state:
+            return
+        logger.warning(f"Circuit '{self.name}' {self._state} -> {state}")
+        self._state = state
+        self._last_changed = time.time()
+        if state == STATE_OPEN:
+            self._stats["opened"] += 1
+        elif state == STATE_HALF_OPEN:
+            self._generation += 1
+            self._probes_in_flight = 0
+            self._probe_successes = 0
+        elif state == STATE_CLOSED:
+            self._window.clear()
+
+    def _open(self, duration: Optional[float] = None) -> None:
+        self._open_until = time.monotonic() + (self.open_seconds if duration is None else duration)
+        self._transition(STATE_OPEN)
+
+    def _refresh(self) -> None:
+        """熔断期结束后进入半开"""
+        if self._state == STATE_OPEN and time.monotonic() >= self._open_until:
+            self._transition(STATE_HALF_OPEN)
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._refresh()
+            return self._state
+
+    def is_available(self) -> bool:
+        """是否会放行请求（不占用半开探测名额）"""
+        with self._lock:
+            self._refresh()
+            if self._state == STATE_OPEN:
+                return False
+            if self._state == STATE_HALF_OPEN:
+                return self._probes_in_flight < self.half_open_probes
+            return True
+
+    def before_call(self) -> Optional[int]:
+        """
+        调用前检查
+
+        Returns:
+            作为半开探测放行时返回本轮半开的编号，需原样传给 record/release；正常放行时返回 None
+
+        Raises:
+            CircuitOpenError: 熔断中，或半开状态下探测名额已满
+        """
+        with self._lock:
+            self._refresh()
+            if self._state == STATE_OPEN:
+                self._stats["rejected"] += 1
+                raise CircuitOpenError(self.name, self._open_until - time.monotonic())
+            if self._state == STATE_HALF_OPEN:
+                if self._probes_in_flight >= self.half_open_probes:
+                    self._stats["rejected"] += 1
+                    raise CircuitOpenError(self.name, 0.0)
+                self._probes_in_flight += 1
+                return self._generation
+            return None
+
+    def _is_current_probe(self, probe: Optional[int]) -> bool:
+        return self._state == STATE_HALF_OPEN and probe is not None and probe == self._generation
+
+    def release(self, probe: Optional[int]) -> None:
+        """归还未实际发出调用的探测名额，不计入结果"""
+        with self._lock:
+            if self._is_current_probe(probe):
+                self._probes_in_flight = max(self._probes_in_flight - 1, 0)
+
+    def record(self, success: bool, duration: float, probe: Optional[int] = None) -> None:
+        """
+        记录一次调用结果
+
+        Args:
+            success: 是否成功
+            duration: 耗时（秒）
+            probe: before_call 的返回值；半开状态下只有本轮探测的结果参与恢复/重新熔断的判断
+        """
+        slow = duration >= self.slow_call_seconds
+        with self._lock:
+            self._stats["calls"] += 1
+            if not success:
+                self._stats["failures"] += 1
+            if slow:
+                self._stats["slow_calls"] += 1
+
+            if self._state == STATE_HALF_OPEN:
+                if not self._is_current_probe(probe):
+                    return
+                self._probes_in_flight = max(self._probes_in_flight - 1, 0)
+                if not success or slow:
+                    self._open()
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_probes:
+                    self._transition(STATE_CLOSED)
+                return
+
+            if self._state == STATE_OPEN:
+                return
+
+            self._window.append((not success, slow))
+            if len(self._window) < self.min_calls:
+                return
+            total = len(self._window)
+            failures = sum(1 for failed, _ in self._window if failed)
+            slow_calls = sum(1 for _, s in self._window if s)
+            if failures / total >= self.failure_rate or slow_calls / total >= self.slow_call_rate:
+                self._open()
+
+    def call(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """在熔断器保护下执行函数"""
+        probe = self.before_call()
+        start = time.monotonic()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self.record(False, time.monotonic() - start, probe)
+            raise
+        except BaseException:
+            # 取消/中断不计入结果，只归还探测名额
+            self.release(probe)
+            raise
+        self.record(True, time.monotonic() - start, probe)
+        return result
+
+    async def acall(self, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """在熔断器保护下执行协程函数"""
+        probe = self.before_call()
+        start = time.monotonic()
+        try:
+            result = await fn(*args, **kwargs)
+        except Exception:
+            self.record(False, time.monotonic() - start, probe)
+            raise
+        except BaseException:
+            # 取消/中断不计入结果，只归还探测名额
+            self.release(probe)
+            raise
+        self.record(True, time.monotonic() - start, probe)
+        return result
+
+    def trip(self, duration: Optional[float] = None) -> None:
+        """手动熔断"""
+        with self._lock:
+            self._open(duration)
+
+    def reset(self) -> None:
+        """手动恢复"""
+        with self._lock:
+            self._transition(STATE_CLOSED)
+
+    def get_status(self) -> Dict[str, Any]:
+        """获取状态与统计"""
+        with self._lock:
+            self._refresh()
+            status = {
+                "state": self._state,
+                "available": self._state != STATE_OPEN,
+                "last_changed": self._last_changed,
+                **self._stats,
+            }
+            if self._state == STATE_OPEN:
+                status["retry_after"] = round(max(self._open_until - time.monotonic(), 0), 1)
+            return status
+
+
+# 各服务的默认阈值覆盖：模型调用本身较慢，慢调用阈值放宽
+DEFAULT_BREAKER_OVERRIDES: Dict[str, Dict[str, Any]] = {
+    "llm": {"slow_call_seconds": 120},
+    "vision": {"slow_call_seconds": 90},
+}
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+def get_circuit_breaker(name: str, **overrides: Any) -> CircuitBreaker:
+    """
+    获取全局熔断器，首次获取时创建
+
+    Args:
+        name: 工具/服务名，如 "search.1688"、"llm"
+        **overrides: 首次创建时使用的阈值参数
+    """
+    breaker = _breakers.get(name)
+    if breaker is not None:
+        return breaker
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            params = {**DEFAULT_BREAKER_OVERRIDES.get(name, {}), **overrides}
+            breaker = CircuitBreaker(name, **params)
+            _breakers[name] = breaker
+        return breaker
+
+
+def get_circuit_breaker_status() -> Dict[str, Dict[str, Any]]:
+    """获取所有熔断器的状态"""
+    return {name: breaker.get_status() for name, breaker in list(_breakers.items())}
@@ -0,0 +1,197 @@
+"""
+带截止时间的共享执行器
+替代各工具内部临时创建的 ThreadPoolExecutor(max_workers=1)：
+超时立即返回调用方，不等待挂起的线程；截止时间通过 contextvar 传给下游，
+支持截止时间的客户端（如共享搜索客户端）会据此缩短请求超时并停止重试
+"""
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 共享执行器的线程数上限
+TOOL_EXECUTOR_MAX_WORKERS = int(os.getenv("TOOL_EXECUTOR_MAX_WORKERS", "16"))
+# 默认超时预算（秒）
+TOOL_DEFAULT_TIMEOUT = float(os.getenv("TOOL_DEFAULT_TIMEOUT", "12"))
+
+# 各工具的超时预算（秒），可通过环境变量 TOOL_TIMEOUT_<NAME> 覆盖，如 TOOL_TIMEOUT_SEARCH_1688=15
+TOOL_TIMEOUTS: Dict[str, float] = {
+    "competitor_analysis": 12,
+    "trend_analysis": 12,
+    "supplier_evaluation": 12,
+    "search_1688": 12,
+    "search_alibaba": 12,
+    # 多视角图片分析并发调用视觉模型，单次调用可能较慢
+    "image_analysis": 120,
+}
+
+# 当前调用的截止时间（time.monotonic()），不在截止时间约束内时为 None
+_current_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "tool_deadline", default=None
+)
+
+
+class DeadlineExceeded(TimeoutError):
+    """调用超出截止时间"""
+
+
+def get_tool_timeout(name: str) -> float:
+    """获取工具的超时预算（秒）"""
+    env_value = os.getenv(f"TOOL_TIMEOUT_{name.upper()}")
+    if env_value:
+        return float(env_value)
+    return TOOL_TIMEOUTS.get(name, TOOL_DEFAULT_TIMEOUT)
+
+
+def remaining_time() -> Optional[float]:
+    """
+    当前截止时间的剩余秒数
+
+    Returns:
+        剩余秒数（可能小于等于 0）；不在截止时间约束内时返回 None
+    """
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def _run_with_deadline(deadline: float, fn: Callable[..., Any], args: tuple, kwargs: dict) -> Any:
+    # 排队期间已经超时的任务直接放弃，不再占用线程
+    if time.monotonic() >= deadline:
+        raise DeadlineExceeded("deadline exceeded before start")
+    token = _current_deadline.set(deadline)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        _current_deadline.reset(token)
+
+
+class DeadlineExecutor:
+    """
+    进程级有界执行器
+
+    run() 在超时预算内等待结果，超时即抛出 DeadlineExceeded 并返回调用方。
+    后台线程无法被强制终止，但截止时间会传给下游请求，使其在预算耗尽后尽快结束。
+    """
+
+    def __init__(self, max_workers: int = TOOL_EXECUTOR_MAX_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool-deadline")
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def _record(self, name: str, field: str) -> None:
+        with self._lock:
+            stats = self._stats.setdefault(name, {"calls": 0, "timeouts": 0, "errors": 0})
+            stats[field] += 1
+
+    def run(self, name: str, fn: Callable[..., Any], *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """
+        在截止时间内执行函数
+
+        Args:
+            name: 工具名，用于查找超时预算和统计
+            fn: 要执行的函数
+            timeout: 超时预算（秒），为 None 时使用该工具的配置
+
+        Returns:
+            函数返回值
+
+        Raises:
+            DeadlineExceeded: 超出超时预算
+        """
+        budget = timeout if timeout is not None else get_tool_timeout(name)
+        deadline = time.monotonic() + budget
+        # 嵌套调用时不超过外层截止时间
+        outer = _current_deadline.get()
+        if outer is not None:
+            deadline = min(deadline, outer)
+
+        self._record(name, "calls")
+        context = contextvars.copy_context()
+        future = self._executor.submit(context.run, _run_with_deadline, deadline, fn, args, kwargs)
+        try:
+            return future.result(timeout=max(deadline - time.monotonic(), 0))
+        except (FutureTimeoutError, DeadlineExceeded):
+            # 仍在排队的任务直接取消；已在执行的任务由下游根据截止时间自行结束
+            future.cancel()
+            self._record(name, "timeouts")
+            logger.warning(f"Tool call timed out after {budget}s: {name}")
+            raise DeadlineExceeded(f"{name} exceeded {budget}s budget")
+        except Exception:
+            self._record(name, "errors")
+            raise
+
+    def run_all(self, name: str, fn: Callable[..., Any], items: Iterable[Any],
+                timeout: Optional[float] = None) -> List[Any]:
+        """
+        并发执行 fn(item)，所有调用共享同一个截止时间
+
+        Args:
+            name: 工具名，用于查找超时预算和统计
+            fn: 要执行的函数，每个 item 调用一次
+            items: 参数列表
+            timeout: 超时预算（秒），为 None 时使用该工具的配置
+
+        Returns:
+            与 items 顺序一致的结果列表；失败的调用位置为其异常，超时的为 DeadlineExceeded
+        """
+        budget = timeout if timeout is not None else get_tool_timeout(name)
+        deadline = time.monotonic() + budget
+        outer = _current_deadline.get()
+        if outer is not None:
+            deadline = min(deadline, outer)
+
+        futures = []
+        for item in items:
+            self._record(name, "calls")
+            context = contextvars.copy_context()
+            futures.append(self._executor.submit(context.run, _run_with_deadline, deadline, fn, (item,), {}))
+
+        results: List[Any] = []
+        for future in futures:
+            try:
+                results.append(future.result(timeout=max(deadline - time.monotonic(), 0)))
+            except (FutureTimeoutError, DeadlineExceeded):
+                future.cancel()
+                self._record(name, "timeouts")
+                results.append(DeadlineExceeded(f"{name} exceeded {budget}s budget"))
+            except Exception as e:
+                self._record(name, "errors")
+                results.append(e)
+        return results
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        """获取各工具的调用、超时和错误次数"""
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._stats.items()}
+
+
+# 全局执行器实例
+_deadline_executor = None
+_deadline_executor_lock = threading.Lock()
+
+def get_deadline_executor() -> DeadlineExecutor:
+    """获取全局带截止时间的执行器实例"""
+    global _deadline_executor
+    if _deadline_executor is None:
+        with _deadline_executor_lock:
+            if _deadline_executor is None:
+                _deadline_executor = DeadlineExecutor()
+    return _deadline_executor
+
+
+def run_with_deadline(name: str, fn: Callable[..., Any], *args, timeout: Optional[float] = None, **kwargs) -> Any:
+    """在全局执行器上按工具的超时预算执行函数"""
+    return get_deadline_executor().run(name, fn, *args, timeout=timeout, **kwargs)
+
+
+def run_all_with_deadline(name: str, fn: Callable[..., Any], items: Iterable[Any],
+                          timeout: Optional[float] = None) -> List[Any]:
+    """在全局执行器上并发执行 fn(item)，共享工具的超时预算"""
+    return get_deadline_executor().run_all(name, fn, items, timeout=timeout)
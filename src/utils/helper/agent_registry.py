@@ -0,0 +1,147 @@
+"""
+Agent 注册表
+缓存编译后的 Agent，避免每个请求都重新读取配置、获取凭证、创建模型并编译图
+"""
+import hashlib
+import importlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from coze_coding_utils.runtime_ctx.context import Context, default_headers
+
+logger = logging.getLogger(__name__)
+
+# run config 中存放当前请求 LLM 请求头的键
+REQUEST_HEADERS_KEY = "request_headers"
+# 编译结果的有效期（秒）：构建时获取的模型凭证会轮换，到期后重新构建以取得新凭证
+AGENT_REGISTRY_TTL = float(os.getenv("AGENT_REGISTRY_TTL", "1800"))
+# 到期重建失败时继续使用旧的编译结果，间隔这么久再重试
+AGENT_REBUILD_RETRY_SECONDS = float(os.getenv("AGENT_REBUILD_RETRY_SECONDS", "60"))
+
+
+def agent_configurable(thread_id: str, ctx: Optional[Context] = None) -> Dict[str, Any]:
+    """
+    构建 run config 的 configurable 部分
+
+    Args:
+        thread_id: 会话线程ID
+        ctx: 请求上下文，其 default_headers 会随 run config 传给模型
+
+    Returns:
+        configurable 字典
+    """
+    return {
+        "thread_id": thread_id,
+        REQUEST_HEADERS_KEY: default_headers(ctx),
+    }
+
+
+class AgentRegistry:
+    """
+    编译后的 Agent 缓存
+
+    每个 Agent 模块需要提供:
+        - resolve_llm_config_path(): 返回 LLM 配置文件路径
+        - build_agent(cfg=...): 根据已解析的配置构建 Agent
+
+    按 (配置哈希, 模型) 复用编译结果。每次获取时只对配置文件做一次 stat，
+    文件的 mtime/大小发生变化时才重新读取并计算哈希，哈希变化则重新构建。
+    编译结果超过 ttl 秒后也会重新构建，使 build_agent 中获取的凭证随之刷新；
+    到期重建失败时继续使用旧结果，retry_seconds 后再试。
+    """
+
+    def __init__(self, ttl: float = AGENT_REGISTRY_TTL, retry_seconds: float = AGENT_REBUILD_RETRY_SECONDS):
+        self.ttl = ttl
+        self.retry_seconds = retry_seconds
+        self._lock = threading.Lock()
+        # module_name -> (文件签名, 缓存键)
+        self._file_state: Dict[str, Tuple[Tuple[int, int], Tuple[str, str]]] = {}
+        # module_name -> (缓存键, Agent, 到期时间)，每个模块只保留最新的一份编译结果
+        self._agents: Dict[str, Tuple[Tuple[str, str], Any, float]] = {}
+
+    @staticmethod
+    def _file_signature(path: str) -> Tuple[int, int]:
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size
+
+    def _current_key(self, module, module_name: str) -> Tuple[Tuple[str, str], Optional[dict]]:
+        """返回当前配置对应的缓存键；配置文件有变化时同时返回新解析的配置"""
+        config_path = module.resolve_llm_config_path()
+        signature = self._file_signature(config_path)
+
+        state = self._file_state.get(module_name)
+        if state is not None and state[0] == signature:
+            return state[1], None
+
+        with open(config_path, 'rb') as f:
+            raw = f.read()
+        cfg = json.loads(raw)
+        key = (hashlib.sha256(raw).hexdigest(), cfg.get('config', {}).get('model') or "")
+        self._file_state[module_name] = (signature, key)
+        return key, cfg
+
+    def get(self, module_name: str) -> Any:
+        """
+        获取编译后的 Agent
+
+        Args:
+            module_name: Agent 模块名，如 "agents.agent"
+
+        Returns:
+            编译后的 Agent
+        """
+        module = importlib.import_module(module_name)
+
+        with self._lock:
+            key, cfg = self._current_key(module, module_name)
+            cached = self._agents.get(module_name)
+            if cached is not None and cached[0] == key and time.monotonic() < cached[2]:
+                return cached[1]
+
+            if cfg is None:
+                # 签名未变但没有缓存（例如上次构建失败），重新读取配置
+                with open(module.resolve_llm_config_path(), 'r', encoding='utf-8') as f:
+                    cfg = json.load(f)
+
+            logger.info(f"Building agent for {module_name}, model={key[1]}, config_hash={key[0][:12]}")
+            try:
+                agent = module.build_agent(cfg=cfg)
+            except Exception as e:
+                if cached is None or cached[0] != key:
+                    raise
+                # 配置未变、只是到期：凭证服务暂时不可用时不影响请求
+                logger.warning(f"Rebuilding agent for {module_name} failed, keep using the previous one: {e}")
+                self._agents[module_name] = (key, cached[1], time.monotonic() + self.retry_seconds)
+                return cached[1]
+            self._agents[module_name] = (key, agent, time.monotonic() + self.ttl)
+            return agent
+
+    def invalidate(self, module_name: Optional[str] = None) -> None:
+        """
+        清除缓存，下次获取时重新构建
+
+        Args:
+            module_name: 模块名，为 None 时清除全部
+        """
+        with self._lock:
+            if module_name is None:
+                self._file_state.clear()
+                self._agents.clear()
+            else:
+                self._file_state.pop(module_name, None)
+                self._agents.pop(module_name, None)
+
+
+# 全局 Agent 注册表实例
+_agent_registry = None
+
+def get_agent_registry() -> AgentRegistry:
+    """获取全局 Agent 注册表实例"""
+    global _agent_registry
+    if _agent_registry is None:
+        _agent_registry = AgentRegistry()
+    return _agent_registry
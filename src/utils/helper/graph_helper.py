@@ -16,9 +16,15 @@ def get_graph_instance(module_name):
             return obj
     return None
 
-def get_agent_instance(module_name, ctx):
-    module = importlib.import_module(module_name)
-    return module.build_agent(ctx)
+def get_agent_instance(module_name, ctx=None):
+    """
+    获取编译后的 Agent（进程内复用，配置文件变化时自动重建）
+
+    ctx 仅为兼容旧调用方式保留，请求头通过 run config 的 configurable 传递，
+    见 agent_registry.agent_configurable
+    """
+    from utils.helper.agent_registry import get_agent_registry
+    return get_agent_registry().get(module_name)
 
 # return: func, input_class, output_class
 def get_graph_node_func_with_inout(graph, node_name):
@@ -51,6 +57,14 @@ def is_agent_proj() -> bool:
 def is_dev_env() -> bool:
     return os.getenv("COZE_PROJECT_ENV", "") == "DEV"
 
+def is_async_stream_mode() -> bool:
+    """
+    流式执行模式
+    async: 在事件循环内用 graph.astream 驱动（默认）
+    thread: 每个请求启动一个后台线程驱动同步 graph.stream
+    """
+    return os.getenv("STREAM_EXECUTION_MODE", "async") != "thread"
+
 
 class ParamExtractHelper:
     @classmethod
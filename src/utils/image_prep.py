@@ -0,0 +1,237 @@
+"""
+视觉模型图片预处理
+图片只解码一次：按字节预算预估缩放比例，JPEG 借助 draft 在解码阶段按 1/2、1/4、1/8 缩小，
+再用 thumbnail 缩放到目标尺寸；质量和尺寸用二分查找，过程中只比较 JPEG 字节数，
+最终结果才做一次 base64 编码
+"""
+import base64
+import hashlib
+import logging
+import math
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Optional, Tuple
+
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# 视觉模型接口对 data URL 中 base64 字符数的限制
+MAX_BASE64_SIZE = 500000
+# JPEG 质量搜索范围
+JPEG_QUALITY_MIN = 40
+JPEG_QUALITY_MAX = 90
+# 按像素预估 JPEG 体积时使用的每像素字节数（照片在质量 85 左右的典型值，宁大勿小）
+JPEG_BYTES_PER_PIXEL = 0.35
+# 最小质量仍超出预算时，再缩小尺寸的最多次数
+MAX_RESIZE_ROUNDS = 4
+# 颜色缩略图的边长（像素），用于区分形状相同、颜色不同的图片
+COLOR_SIGNATURE_SIZE = 4
+
+_FORMAT_MIME = {"JPEG": "jpeg", "PNG": "png", "GIF": "gif", "WEBP": "webp", "BMP": "bmp"}
+
+
+@dataclass(frozen=True, slots=True)
+class PreparedImage:
+    """预处理后的图片"""
+
+    data: bytes
+    mime_subtype: str
+    width: int
+    height: int
+    original_size: int
+
+    @property
+    def base64_size(self) -> int:
+        """base64 编码后的字符数（不实际编码）"""
+        return 4 * math.ceil(len(self.data) / 3)
+
+    def to_data_url(self) -> str:
+        """编码为 data URL"""
+        encoded = base64.b64encode(self.data).decode("ascii")
+        return f"data:image/{self.mime_subtype};base64,{encoded}"
+
+
+def _base64_budget(max_base64_size: int) -> int:
+    """base64 字符数上限对应的原始字节数上限"""
+    return max_base64_size // 4 * 3
+
+
+def _to_rgb(img: Image.Image) -> Image.Image:
+    """转换为 JPEG 可保存的模式，透明背景铺白"""
+    if img.mode in ("RGB", "L"):
+        return img
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        rgba = img.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    return img.convert("RGB")
+
+
+def _encode_jpeg(img: Image.Image, quality: int) -> bytes:
+    buffer = BytesIO()
+    img.save(buffer, format="JPEG", quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def _search_quality(img: Image.Image, budget: int) -> Tuple[Optional[bytes], bytes]:
+    """
+    二分查找预算内的最高 JPEG 质量
+
+    Returns:
+        (预算内质量最高的编码结果或 None, 最低质量的编码结果)
+    """
+    lowest = _encode_jpeg(img, JPEG_QUALITY_MIN)
+    if len(lowest) > budget:
+        return None, lowest
+    best = lowest
+    low, high = JPEG_QUALITY_MIN + 1, JPEG_QUALITY_MAX
+    while low <= high:
+        quality = (low + high) // 2
+        data = _encode_jpeg(img, quality)
+        if len(data) <= budget:
+            best = data
+            low = quality + 1
+        else:
+            high = quality - 1
+    return best, lowest
+
+
+def _fit_size(width: int, height: int, max_pixels: float, max_side: Optional[int]) -> Tuple[int, int]:
+    """在像素数和最长边限制内，按原比例计算目标尺寸"""
+    scale = min(1.0, math.sqrt(max_pixels / (width * height)))
+    if max_side:
+        scale = min(scale, max_side / max(width, height))
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def prepare_image(data: bytes, max_base64_size: int = MAX_BASE64_SIZE,
+                  max_side: Optional[int] = None) -> PreparedImage:
+    """
+    把图片处理到 base64 后不超过 max_base64_size 个字符
+
+    未超出预算且无需限制边长的图片原样返回，不解码；否则只解码一次并输出 JPEG
+
+    Args:
+        data: 原始图片字节
+        max_base64_size: base64 字符数上限
+        max_side: 最长边上限（像素），为 None 时不限制
+
+    Raises:
+        ValueError: 无法识别的图片，或缩到最小仍超出预算
+    """
+    budget = _base64_budget(max_base64_size)
+    try:
+        img = Image.open(BytesIO(data))
+    except Exception as e:
+        raise ValueError(f"无法识别的图片: {e}") from e
+
+    # Image.open 只读取文件头，此时尚未解码像素
+    source_format = img.format or "JPEG"
+    width, height = img.size
+    if len(data) <= budget and (not max_side or max(width, height) <= max_side):
+        return PreparedImage(data, _FORMAT_MIME.get(source_format, "jpeg"), width, height, len(data))
+
+    # 按字节预算预估目标像素数；JPEG 源图直接用其实际的每像素字节数
+    bytes_per_pixel = JPEG_BYTES_PER_PIXEL
+    if source_format == "JPEG":
+        bytes_per_pixel = max(min(len(data) / (width * height), 1.0), 0.05)
+    target = _fit_size(width, height, budget / bytes_per_pixel, max_side)
+
+    orientation = img.getexif().get(0x0112, 1)
+    if source_format == "JPEG":
+        # 解码时按 DCT 缩放直接得到不小于目标尺寸的图，大幅减少解码量
+        img.draft("RGB", target)
+    # 手机照片按 EXIF 方向摆正；旋转 90/270 度时目标宽高互换
+    img = ImageOps.exif_transpose(img)
+    if orientation in (5, 6, 7, 8):
+        target = (target[1], target[0])
+    img = _to_rgb(img)
+
+    for _ in range(MAX_RESIZE_ROUNDS + 1):
+        if img.width > target[0] or img.height > target[1]:
+            img.thumbnail(target, Image.LANCZOS, reducing_gap=2.0)
+        encoded, lowest = _search_quality(img, budget)
+        if encoded is not None:
+            logger.info(
+                f"prepared image {width}x{height} ({len(data)} bytes) -> "
+                f"{img.width}x{img.height} ({len(encoded)} bytes)"
+            )
+            return PreparedImage(encoded, "jpeg", img.width, img.height, len(data))
+        # 最低质量仍超出预算：按超出比例缩小尺寸（留 10% 余量）
+        shrink = math.sqrt(budget / len(lowest)) * 0.9
+        target = (max(1, int(img.width * shrink)), max(1, int(img.height * shrink)))
+
+    raise ValueError(
+        f"图片太大，无法处理（原始: {len(data)} 字节）。请使用较小的图片（建议小于 400KB）或提供图片 URL。"
+    )
+
+
+def perceptual_hash(data: bytes, hash_size: int = 8) -> int:
+    """
+    计算图片的差值哈希（dHash），64 位整数
+
+    图片缩成 (hash_size+1) x hash_size 的灰度图后比较相邻像素亮度，缩放、重新压缩后
+    哈希基本不变，汉明距离很小；JPEG 借助 draft 只解码缩小后的图
+
+    Raises:
+        ValueError: 无法识别的图片
+    """
+    try:
+        img = Image.open(BytesIO(data))
+        img.draft("L", (hash_size * 8, hash_size * 8))
+        img = ImageOps.exif_transpose(img).convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    except Exception as e:
+        raise ValueError(f"无法识别的图片: {e}") from e
+    pixels = img.tobytes()
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] < pixels[offset + col + 1])
+    return value
+
+
+def color_signature(data: bytes, size: int = COLOR_SIGNATURE_SIZE) -> bytes:
+    """
+    计算图片的颜色缩略图：缩成 size x size 的 RGB 图，返回 size*size*3 字节
+
+    感知哈希只看灰度明暗关系，同款不同色的商品图哈希相同；颜色缩略图用来区分它们
+
+    Raises:
+        ValueError: 无法识别的图片
+    """
+    try:
+        img = Image.open(BytesIO(data))
+        img.draft("RGB", (size * 8, size * 8))
+        img = _to_rgb(ImageOps.exif_transpose(img)).convert("RGB").resize((size, size), Image.BOX)
+    except Exception as e:
+        raise ValueError(f"无法识别的图片: {e}") from e
+    return img.tobytes()
+
+
+def color_distance(a: bytes, b: bytes) -> int:
+    """两个颜色缩略图对应像素各通道差值的最大值；尺寸不同时视为完全不同"""
+    if len(a) != len(b):
+        return 255
+    return max((abs(x - y) for x, y in zip(a, b)), default=0)
+
+
+@dataclass(frozen=True, slots=True)
+class ImageFingerprint:
+    """图片指纹：内容摘要用于精确匹配，感知哈希和颜色缩略图用于近似匹配"""
+
+    digest: str
+    phash: int
+    color: bytes
+
+
+def fingerprint(data: bytes) -> ImageFingerprint:
+    """
+    计算图片指纹
+
+    Raises:
+        ValueError: 无法识别的图片
+    """
+    return ImageFingerprint(hashlib.sha256(data).hexdigest(), perceptual_hash(data), color_signature(data))
@@ -0,0 +1,307 @@
+"""
+对话图片存储
+用户上传的图片按内容只存一次，对话消息中只保存 image://<key> 引用，
+不再把整张图片的 base64 写进消息：检查点每轮只多几十个字节，
+调用模型前再把引用解析为签名 URL（S3）或缩放后的 data URL（本地存储）
+"""
+import base64
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.image_prep import MAX_BASE64_SIZE, prepare_image
+
+logger = logging.getLogger(__name__)
+
+# 存储后端: local（仅本机）或 s3（多实例共享，模型通过签名 URL 读取）
+IMAGE_STORE_BACKEND = os.getenv("IMAGE_STORE_BACKEND", "local")
+# 本地存储目录；s3 后端下作为本机缓存
+IMAGE_STORE_DIR = os.getenv("IMAGE_STORE_DIR", "/tmp/image_store")
+# 对象存储中的 key 前缀
+IMAGE_STORE_S3_PREFIX = os.getenv("IMAGE_STORE_S3_PREFIX", "chat-images")
+# 签名 URL 有效期（秒）
+IMAGE_STORE_URL_EXPIRE = int(os.getenv("IMAGE_STORE_URL_EXPIRE", "1800"))
+# 视觉模型输入的最长边（像素），更大的图片在存储前缩小
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "1280"))
+# 本地文件有效期（秒），默认 7 天；按最后一次使用时间计算，过期后引用解析为“图片已过期”
+IMAGE_STORE_TTL = int(os.getenv("IMAGE_STORE_TTL", str(7 * 24 * 3600)))
+# 本地目录的容量上限（字节），超出时先删除最久未使用的图片
+IMAGE_STORE_MAX_BYTES = int(os.getenv("IMAGE_STORE_MAX_BYTES", str(512 * 1024 * 1024)))
+# 每保存多少张新图片清理一次本地目录
+_TRIM_EVERY = 50
+
+IMAGE_REF_SCHEME = "image://"
+
+_SUBTYPES = ("jpeg", "png", "gif", "webp", "bmp")
+
+
+def is_image_ref(url: Any) -> bool:
+    """是否为图片存储的引用"""
+    return isinstance(url, str) and url.startswith(IMAGE_REF_SCHEME)
+
+
+def _part_ref(part: Any) -> Optional[str]:
+    """消息内容块中的图片引用，不是引用时返回 None"""
+    if not isinstance(part, dict) or not isinstance(part.get("image_url"), dict):
+        return None
+    url = part["image_url"].get("url")
+    return url if is_image_ref(url) else None
+
+
+def _parse_ref(ref: str) -> Tuple[str, str]:
+    """解析引用为 (内容键, 图片格式)"""
+    name = ref[len(IMAGE_REF_SCHEME):]
+    key, _, subtype = name.partition(".")
+    if not key or not key.isalnum() or subtype not in _SUBTYPES:
+        raise ValueError(f"无效的图片引用: {ref}")
+    return key, subtype
+
+
+class ImageStore:
+    """
+    按内容寻址的图片存储
+
+    put() 把图片缩放到视觉模型的输入尺寸和字节预算后保存，返回引用；
+    相同内容重复上传只处理和保存一次
+    """
+
+    def __init__(self, backend: str = IMAGE_STORE_BACKEND, directory: str = IMAGE_STORE_DIR,
+                 max_side: int = IMAGE_MAX_SIDE, max_base64_size: int = MAX_BASE64_SIZE,
+                 url_expire: int = IMAGE_STORE_URL_EXPIRE, ttl: int = IMAGE_STORE_TTL,
+                 max_bytes: int = IMAGE_STORE_MAX_BYTES, s3_storage=None):
+        self.backend = backend
+        self.directory = directory
+        self.max_side = max_side
+        self.max_base64_size = max_base64_size
+        self.url_expire = url_expire
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._s3 = s3_storage
+        self._lock = threading.Lock()
+        # 引用 -> (签名 URL, 过期时间)；提前到有效期一半时重新签名
+        self._urls: Dict[str, Tuple[str, float]] = {}
+        self._stats = {"puts": 0, "dedup_hits": 0, "resolves": 0, "missing": 0, "trimmed": 0}
+        self._puts_since_trim = 0
+        os.makedirs(directory, exist_ok=True)
+        self.trim()
+
+    def _s3_storage(self):
+        if self._s3 is None:
+            from storage.s3.s3_storage import S3SyncStorage
+            self._s3 = S3SyncStorage(
+                endpoint_url=os.getenv("COZE_BUCKET_ENDPOINT_URL"),
+                access_key="",
+                secret_key="",
+                bucket_name=os.getenv("COZE_BUCKET_NAME", ""),
+            )
+        return self._s3
+
+    def _path(self, key: str, subtype: str) -> str:
+        return os.path.join(self.directory, f"{key}.{subtype}")
+
+    def _object_key(self, key: str, subtype: str) -> str:
+        return f"{IMAGE_STORE_S3_PREFIX}/{key}.{subtype}"
+
+    def _find_local(self, key: str) -> Optional[str]:
+        for subtype in _SUBTYPES:
+            if os.path.exists(self._path(key, subtype)):
+                return subtype
+        return None
+
+    def _record(self, field: str, count: int = 1) -> None:
+        with self._lock:
+            self._stats[field] += count
+
+    @staticmethod
+    def _touch(path: str) -> None:
+        """刷新最后使用时间，清理按修改时间判断新旧"""
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def trim(self) -> int:
+        """
+        清理本地目录：删除超过有效期未使用的图片（含残留的临时文件），
+        总大小仍超过容量上限时按最后使用时间从旧到新删除
+
+        s3 后端下只清理本机缓存，对象存储中的图片由桶的生命周期规则管理
+
+        Returns:
+            删除的文件数
+        """
+        with self._lock:
+            self._puts_since_trim = 0
+        files = []
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_file():
+                            stat = entry.stat()
+                            files.append((stat.st_mtime, stat.st_size, entry.path))
+                    except OSError:
+                        continue
+        except OSError as e:
+            logger.warning(f"Image store trim failed: {e}")
+            return 0
+
+        expire_before = time.time() - self.ttl
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for mtime, size, path in files:
+            if mtime > expire_before and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        if removed:
+            self._record("trimmed", removed)
+            logger.info(f"Image store trimmed {removed} files, {total} bytes left")
+        return removed
+
+    def put(self, data: bytes) -> str:
+        """
+        保存图片，返回 image://<key>.<格式> 引用
+
+        Raises:
+            ValueError: 无法识别的图片
+        """
+        key = hashlib.sha256(data).hexdigest()[:32]
+        subtype = self._find_local(key)
+        if subtype is not None:
+            self._touch(self._path(key, subtype))
+            self._record("dedup_hits")
+            return f"{IMAGE_REF_SCHEME}{key}.{subtype}"
+
+        prepared = prepare_image(data, max_base64_size=self.max_base64_size, max_side=self.max_side)
+        subtype = prepared.mime_subtype
+        if self.backend == "s3":
+            self._s3_storage().upload_file(
+                file_content=prepared.data,
+                file_name=self._object_key(key, subtype),
+                content_type=f"image/{subtype}",
+                unique=False,
+            )
+        # 先写临时文件再改名，并发读取不会读到半个文件
+        path = self._path(key, subtype)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(prepared.data)
+        os.replace(tmp_path, path)
+
+        self._record("puts")
+        logger.info(
+            f"Stored image {key}: {len(data)} -> {len(prepared.data)} bytes "
+            f"({prepared.width}x{prepared.height})"
+        )
+        with self._lock:
+            self._puts_since_trim += 1
+            should_trim = self._puts_since_trim >= _TRIM_EVERY
+        if should_trim:
+            self.trim()
+        return f"{IMAGE_REF_SCHEME}{key}.{subtype}"
+
+    def read(self, ref: str) -> bytes:
+        """
+        读取引用对应的图片字节（已缩放）
+
+        Raises:
+            ValueError: 无效的引用
+            FileNotFoundError: 图片不存在
+        """
+        key, subtype = _parse_ref(ref)
+        path = self._path(key, subtype)
+        if os.path.exists(path):
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                # 刚被清理掉，s3 后端下回源读取
+                if self.backend != "s3":
+                    raise
+            else:
+                self._touch(path)
+                return data
+        if self.backend == "s3":
+            return self._s3_storage().read_file(file_key=self._object_key(key, subtype))
+        raise FileNotFoundError(f"图片不存在: {ref}")
+
+    def resolve(self, ref: str) -> str:
+        """
+        把引用解析为模型可读取的 URL：s3 后端为签名 URL，本地后端为 data URL
+
+        Raises:
+            ValueError: 无效的引用
+            FileNotFoundError: 图片不存在
+        """
+        key, subtype = _parse_ref(ref)
+        self._record("resolves")
+        if self.backend == "s3":
+            now = time.monotonic()
+            with self._lock:
+                cached = self._urls.get(ref)
+            if cached is not None and cached[1] > now:
+                return cached[0]
+            url = self._s3_storage().generate_presigned_url(
+                key=self._object_key(key, subtype), expire_time=self.url_expire
+            )
+            with self._lock:
+                self._urls[ref] = (url, now + self.url_expire / 2)
+            return url
+        encoded = base64.b64encode(self.read(ref)).decode("ascii")
+        return f"data:image/{subtype};base64,{encoded}"
+
+    def resolve_messages(self, messages: List[Any]) -> List[Any]:
+        """
+        返回把消息中的图片引用替换为可读取 URL 后的消息列表，不修改原消息
+
+        图片已不存在时替换为文字说明，不让整个模型调用失败
+        """
+        resolved = []
+        for message in messages:
+            content = getattr(message, "content", None)
+            if not isinstance(content, list) or not any(_part_ref(part) for part in content):
+                resolved.append(message)
+                continue
+
+            parts = []
+            for part in content:
+                url = _part_ref(part)
+                if url is None:
+                    parts.append(part)
+                    continue
+                try:
+                    parts.append({**part, "image_url": {**part["image_url"], "url": self.resolve(url)}})
+                except Exception as e:
+                    logger.warning(f"Image reference unavailable: {url}: {e}")
+                    self._record("missing")
+                    parts.append({"type": "text", "text": "[图片已过期或不存在]"})
+            resolved.append(message.model_copy(update={"content": parts}))
+        return resolved
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取存储统计"""
+        with self._lock:
+            return {**self._stats, "backend": self.backend}
+
+
+# 全局图片存储实例
+_image_store = None
+_image_store_lock = threading.Lock()
+
+def get_image_store() -> ImageStore:
+    """获取全局图片存储实例"""
+    global _image_store
+    if _image_store is None:
+        with _image_store_lock:
+            if _image_store is None:
+                _image_store = ImageStore()
+    return _image_store
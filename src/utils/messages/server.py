@@ -114,6 +114,30 @@ class ServerMessage:
 
 
 
+def merge_delta_message_dicts(prev: Dict[str, Any], item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    合并同一条流式消息的相邻增量（answer/thinking），用于消费者落后时压缩队列
+
+    合并后保留后一条的 sequence_id，保证序号单调递增。无法合并时返回 None
+    """
+    msg_type = item.get("type")
+    if msg_type not in (MESSAGE_TYPE_ANSWER, MESSAGE_TYPE_THINKING):
+        return None
+    if prev.get("type") != msg_type or prev.get("msg_id") != item.get("msg_id"):
+        return None
+    if prev.get("finish") or item.get("finish"):
+        return None
+    prev_text = prev["content"].get(msg_type)
+    item_text = item["content"].get(msg_type)
+    if prev_text is None or item_text is None:
+        return None
+
+    merged = dict(item)
+    merged["content"] = dict(item["content"])
+    merged["content"][msg_type] = prev_text + item_text
+    return merged
+
+
 def create_message_end_dict(
     code: str,
     message: str,
@@ -0,0 +1,39 @@
+"""
+运行时指标汇总
+供 /metrics 接口和服务状态工具统一读取各组件的统计
+"""
+from typing import Any, Dict
+
+from storage.database.db import get_pool_stats
+from storage.database.preference_cache import get_preference_cache
+from utils.cache_manager import get_cache_manager
+from utils.circuit_breaker import get_circuit_breaker_status
+from utils.deadline_executor import get_deadline_executor
+from utils.image_store import get_image_store
+from utils.rate_limiter import get_rate_limit_stats
+from utils.search_cache import get_search_cache
+from utils.single_flight import get_single_flight
+from utils.stream_queue import get_stream_queue_registry
+from utils.vision_cache import get_vision_cache
+
+
+def collect_runtime_metrics() -> Dict[str, Any]:
+    """
+    汇总缓存、搜索缓存、图片存储、工具调用、请求合并、限流、熔断器、数据库连接池和流式队列的统计
+
+    Returns:
+        指标字典
+    """
+    return {
+        "cache": get_cache_manager().get_stats(),
+        "search_cache": get_search_cache().get_stats(),
+        "preference_cache": get_preference_cache().get_stats(),
+        "vision_cache": get_vision_cache().get_stats(),
+        "image_store": get_image_store().get_stats(),
+        "tool_calls": get_deadline_executor().get_stats(),
+        "single_flight": get_single_flight().get_stats(),
+        "rate_limits": get_rate_limit_stats(),
+        "circuit_breakers": get_circuit_breaker_status(),
+        "db_pool": get_pool_stats(),
+        "stream_queues": get_stream_queue_registry().snapshot(),
+    }
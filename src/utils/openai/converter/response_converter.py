@@ -2,7 +2,7 @@
 
 import json
 import time
-from typing import Iterator, Optional, List, Dict, Any
+from typing import AsyncIterator, Iterator, Optional, List, Dict, Any
 
 from utils.openai.types.response import (
     ChatCompletionChunk,
@@ -27,6 +27,8 @@ class ResponseConverter:
         self._sent_role = False  # 是否已发送 assistant role
         # 工具调用流式状态
         self._current_tool_calls: Dict[int, Dict[str, Any]] = {}  # index -> {id, name, args}
+        # 是否已发送过 finish_reason（tool_calls 或 stop）
+        self._sent_finish_reason = False
 
     def _create_chunk(
         self,
@@ -61,36 +63,58 @@ class ResponseConverter:
         Yields:
             SSE 格式字符串
         """
-        # 跟踪是否已发送过 finish_reason（tool_calls 或 stop）
-        sent_finish_reason = False
-
         for item in items:
-            chunk, meta = item
-            chunk_type = chunk.__class__.__name__
+            yield from self._process_stream_item(item)
 
-            # 过滤 tools 节点的消息
-            if (meta or {}).get("langgraph_node") == "tools":
-                # 但是 ToolMessage 需要处理
-                if chunk_type != "ToolMessage":
-                    continue
+        yield from self._finish_stream()
+
+    async def aiter_langgraph_stream(
+        self, items: AsyncIterator[Any]
+    ) -> AsyncIterator[str]:
+        """
+        iter_langgraph_stream 的异步版本
 
-            # 处理前检查是否有工具调用（用于判断是否会发送 tool_calls finish_reason）
-            had_tool_calls_before = bool(self._current_tool_calls)
+        Args:
+            items: graph.astream(stream_mode="messages") 返回的异步迭代器
 
-            for sse_chunk in self._process_langgraph_chunk(chunk, meta):
+        Yields:
+            SSE 格式字符串
+        """
+        async for item in items:
+            for sse_chunk in self._process_stream_item(item):
                 yield sse_chunk
 
-            # 检查是否在处理过程中发送了 tool_calls finish_reason
-            is_last = (meta or {}).get("chunk_position") == "last"
-            if chunk_type == "AIMessageChunk" and is_last and had_tool_calls_before:
-                # 处理过程中发送了 tool_calls finish_reason，重置标记
-                sent_finish_reason = True
-            elif chunk_type == "ToolMessage":
-                # ToolMessage 后面还会有 assistant 消息，重置标记
-                sent_finish_reason = False
+        for sse_chunk in self._finish_stream():
+            yield sse_chunk
+
+    def _process_stream_item(self, item: Any) -> Iterator[str]:
+        """处理流中的单个 (chunk, metadata)，并跟踪 finish_reason 状态"""
+        chunk, meta = item
+        chunk_type = chunk.__class__.__name__
+
+        # 过滤 tools 节点的消息
+        if (meta or {}).get("langgraph_node") == "tools":
+            # 但是 ToolMessage 需要处理
+            if chunk_type != "ToolMessage":
+                return
 
-        # 流结束时，如果发送过 role 但没有发送过 finish_reason，发送 stop
-        if self._sent_role and not sent_finish_reason:
+        # 处理前检查是否有工具调用（用于判断是否会发送 tool_calls finish_reason）
+        had_tool_calls_before = bool(self._current_tool_calls)
+
+        yield from self._process_langgraph_chunk(chunk, meta)
+
+        # 检查是否在处理过程中发送了 tool_calls finish_reason
+        is_last = (meta or {}).get("chunk_position") == "last"
+        if chunk_type == "AIMessageChunk" and is_last and had_tool_calls_before:
+            # 处理过程中发送了 tool_calls finish_reason，重置标记
+            self._sent_finish_reason = True
+        elif chunk_type == "ToolMessage":
+            # ToolMessage 后面还会有 assistant 消息，重置标记
+            self._sent_finish_reason = False
+
+    def _finish_stream(self) -> Iterator[str]:
+        """流结束时，如果发送过 role 但没有发送过 finish_reason，发送 stop"""
+        if self._sent_role and not self._sent_finish_reason:
             yield self._chunk_to_sse(self._create_chunk(Delta(), finish_reason="stop"))
 
         yield "data: [DONE]\n\n"
@@ -266,6 +290,50 @@ class ResponseConverter:
         """将 chunk 转换为 SSE 格式"""
         return f"data: {json.dumps(chunk.to_dict(), ensure_ascii=False)}\n\n"
 
+    @staticmethod
+    def merge_content_sse(prev: str, item: str) -> Optional[str]:
+        """
+        合并两个相邻的纯文本增量 SSE chunk，用于消费者落后时压缩队列
+
+        只合并 delta 仅含 content 且 finish_reason 为空的 chunk，无法合并时返回 None
+        """
+        prefix = "data: "
+        if not (prev.startswith(prefix) and item.startswith(prefix)):
+            return None
+        try:
+            prev_data = json.loads(prev[len(prefix):])
+            item_data = json.loads(item[len(prefix):])
+        except (ValueError, TypeError):
+            return None
+
+        def _content_delta(data: Dict[str, Any]) -> Optional[str]:
+            choices = data.get("choices") or []
+            if len(choices) != 1 or choices[0].get("finish_reason") is not None:
+                return None
+            delta = choices[0].get("delta") or {}
+            if set(delta) != {"content"}:
+                return None
+            return delta["content"]
+
+        prev_content = _content_delta(prev_data)
+        item_content = _content_delta(item_data)
+        if prev_content is None or item_content is None:
+            return None
+
+        prev_data["choices"][0]["delta"]["content"] = prev_content + item_content
+        return f"data: {json.dumps(prev_data, ensure_ascii=False)}\n\n"
+
+    async def acollect_langgraph_to_response(
+        self, items: AsyncIterator[Any]
+    ) -> ChatCompletionResponse:
+        """
+        collect_langgraph_to_response 的异步版本
+
+        Args:
+            items: graph.astream(stream_mode="messages") 返回的异步迭代器
+        """
+        return self.collect_langgraph_to_response([item async for item in items])
+
     def collect_langgraph_to_response(
         self, items: Iterator[Any]
     ) -> ChatCompletionResponse:
@@ -4,7 +4,7 @@ import asyncio
 import logging
 import threading
 import contextvars
-from typing import Dict, Any, Union, AsyncGenerator
+from typing import Dict, Any, Union, AsyncGenerator, Tuple
 
 from fastapi.responses import StreamingResponse, JSONResponse
 
@@ -12,7 +12,11 @@ from coze_coding_utils.runtime_ctx.context import Context
 from utils.openai.types.response import OpenAIError, OpenAIErrorResponse
 from utils.openai.converter.request_converter import RequestConverter
 from utils.openai.converter.response_converter import ResponseConverter
-from utils.error import classify_error
+from utils.error import ErrorCode, classify_error
+from utils.helper import graph_helper
+from utils.helper.agent_registry import agent_configurable
+from utils.log.loop_trace import init_agent_config, init_run_config
+from utils.stream_queue import BackpressureQueue
 
 logger = logging.getLogger(__name__)
 
@@ -20,14 +24,16 @@ logger = logging.getLogger(__name__)
 class OpenAIChatHandler:
     """OpenAI Chat Completions 处理器"""
 
-    def __init__(self, graph_service: Any):
+    def __init__(self, graph_service: Any, timeout_seconds: float = 900):
         """
         初始化处理器
 
         Args:
             graph_service: GraphService 实例
+            timeout_seconds: 单次图执行的超时时间（秒）
         """
         self.graph_service = graph_service
+        self.timeout_seconds = timeout_seconds
         self.request_converter = RequestConverter()
 
     async def handle(
@@ -104,28 +110,66 @@ class OpenAIChatHandler:
     ) -> StreamingResponse:
         """流式响应处理"""
 
+        async def native_stream_generator() -> AsyncGenerator[str, None]:
+            """在事件循环内用 graph.astream 驱动的流式生成器"""
+            deadline = asyncio.get_running_loop().time() + self.timeout_seconds
+            sse_iter = None
+            try:
+                graph, run_config = await self._aprepare_graph(session_id, ctx)
+                items = graph.astream(
+                    stream_input,
+                    stream_mode="messages",
+                    config=run_config,
+                    context=ctx,
+                )
+                sse_iter = response_converter.aiter_langgraph_stream(items)
+                while True:
+                    try:
+                        # 超时只约束图执行，不包含下游消费 yield 的时间
+                        async with asyncio.timeout_at(deadline):
+                            sse_data = await anext(sse_iter)
+                    except StopAsyncIteration:
+                        break
+                    if sse_data != "data: [DONE]\n\n":  # 不在这里发送 DONE
+                        yield sse_data
+            except asyncio.CancelledError:
+                logger.info(f"Stream cancelled for run_id: {ctx.run_id}")
+                raise
+            except TimeoutError:
+                logger.error(f"Agent execution timeout after {self.timeout_seconds}s for run_id: {ctx.run_id}")
+                yield self._create_error_sse_chunk(
+                    str(ErrorCode.RUNTIME_TIMEOUT),
+                    self._timeout_message(),
+                    response_converter.request_id,
+                )
+            except Exception as ex:
+                logger.error(f"Stream error: {ex}", exc_info=True)
+                err = classify_error(ex, {"node_name": "openai_stream"})
+                yield self._create_error_sse_chunk(
+                    str(err.code),
+                    str(ex),
+                    response_converter.request_id,
+                )
+            finally:
+                if sse_iter is not None:
+                    await sse_iter.aclose()
+            yield "data: [DONE]\n\n"
+
         async def stream_generator() -> AsyncGenerator[str, None]:
             """异步流式生成器"""
             loop = asyncio.get_running_loop()
-            queue: asyncio.Queue = asyncio.Queue()
+            # 有界队列：消费者落后时合并文本增量或阻塞生产者线程
+            queue = BackpressureQueue(
+                loop,
+                run_id=ctx.run_id,
+                merge=ResponseConverter.merge_content_sse,
+            )
             context = contextvars.copy_context()
 
             def producer():
                 """后台线程生产者"""
                 try:
-                    # 获取 graph 并配置
-                    from utils.helper import graph_helper
-                    graph = self.graph_service._get_graph(ctx)
-
-                    if graph_helper.is_agent_proj():
-                        from utils.log.loop_trace import init_agent_config
-                        run_config = init_agent_config(graph, ctx)
-                    else:
-                        from utils.log.loop_trace import init_run_config
-                        run_config = init_run_config(graph, ctx)
-
-                    run_config["recursion_limit"] = 100
-                    run_config["configurable"] = {"thread_id": session_id}
+                    graph, run_config = self._prepare_graph(session_id, ctx)
 
                     # 流式执行 - 直接使用 LangGraph 原始流
                     items = graph.stream(
@@ -138,7 +182,10 @@ class OpenAIChatHandler:
                     # 使用 iter_langgraph_stream 方法，支持工具参数流式输出
                     for sse_data in response_converter.iter_langgraph_stream(items):
                         if sse_data != "data: [DONE]\n\n":  # 不在这里发送 DONE
-                            loop.call_soon_threadsafe(queue.put_nowait, sse_data)
+                            if not queue.put(sse_data):
+                                # 队列已关闭，客户端已断开
+                                logger.info(f"Stream producer stopped, consumer gone for run_id: {ctx.run_id}")
+                                return
 
                 except Exception as ex:
                     logger.error(f"Stream producer error: {ex}", exc_info=True)
@@ -148,10 +195,10 @@ class OpenAIChatHandler:
                         str(ex),
                         response_converter.request_id,
                     )
-                    loop.call_soon_threadsafe(queue.put_nowait, error_chunk)
+                    queue.put(error_chunk)
                 finally:
-                    loop.call_soon_threadsafe(queue.put_nowait, "data: [DONE]\n\n")
-                    loop.call_soon_threadsafe(queue.put_nowait, None)
+                    queue.put("data: [DONE]\n\n")
+                    queue.put_end()
 
             # 启动后台线程
             threading.Thread(target=lambda: context.run(producer), daemon=True).start()
@@ -166,9 +213,17 @@ class OpenAIChatHandler:
             except asyncio.CancelledError:
                 logger.info(f"Stream cancelled for run_id: {ctx.run_id}")
                 raise
+            finally:
+                # 关闭队列会唤醒阻塞中的生产者，并记录本次运行的队列统计
+                queue.close()
+
+        if graph_helper.is_async_stream_mode():
+            generator = native_stream_generator()
+        else:
+            generator = stream_generator()
 
         return StreamingResponse(
-            stream_generator(),
+            generator,
             media_type="text/event-stream",
         )
 
@@ -180,6 +235,31 @@ class OpenAIChatHandler:
         ctx: Context,
     ) -> JSONResponse:
         """非流式响应处理"""
+        if graph_helper.is_async_stream_mode():
+            deadline = asyncio.get_running_loop().time() + self.timeout_seconds
+            try:
+                graph, run_config = await self._aprepare_graph(session_id, ctx)
+                items = graph.astream(
+                    stream_input,
+                    stream_mode="messages",
+                    config=run_config,
+                    context=ctx,
+                )
+                async with asyncio.timeout_at(deadline):
+                    response = await response_converter.acollect_langgraph_to_response(items)
+                return JSONResponse(content=response.to_dict())
+            except TimeoutError:
+                logger.error(f"Agent execution timeout after {self.timeout_seconds}s for run_id: {ctx.run_id}")
+                return self._error_response(
+                    message=self._timeout_message(),
+                    error_type="timeout_error",
+                    code=str(ErrorCode.RUNTIME_TIMEOUT),
+                    status_code=408,
+                )
+            except Exception as e:
+                logger.error(f"Non-stream error: {e}", exc_info=True)
+                return self._handle_error(e)
+
         loop = asyncio.get_running_loop()
         context = contextvars.copy_context()
         result_future: asyncio.Future = loop.create_future()
@@ -187,19 +267,7 @@ class OpenAIChatHandler:
         def producer():
             """后台线程生产者"""
             try:
-                # 获取 graph 并配置
-                from utils.helper import graph_helper
-                graph = self.graph_service._get_graph(ctx)
-
-                if graph_helper.is_agent_proj():
-                    from utils.log.loop_trace import init_agent_config
-                    run_config = init_agent_config(graph, ctx)
-                else:
-                    from utils.log.loop_trace import init_run_config
-                    run_config = init_run_config(graph, ctx)
-
-                run_config["recursion_limit"] = 100
-                run_config["configurable"] = {"thread_id": session_id}
+                graph, run_config = self._prepare_graph(session_id, ctx)
 
                 # 流式执行 - 直接使用 LangGraph 原始流
                 items = graph.stream(
@@ -232,6 +300,27 @@ class OpenAIChatHandler:
         except Exception as e:
             return self._handle_error(e)
 
+    async def _aprepare_graph(self, session_id: str, ctx: Context) -> Tuple[Any, Dict[str, Any]]:
+        """在线程中获取 graph 并构建 run config，首次构建 agent 时不阻塞事件循环"""
+        return await asyncio.to_thread(self._prepare_graph, session_id, ctx)
+
+    def _timeout_message(self) -> str:
+        """与 /stream_run 一致的执行超时说明"""
+        return f"Execution timeout: exceeded {self.timeout_seconds} seconds"
+
+    def _prepare_graph(self, session_id: str, ctx: Context) -> Tuple[Any, Dict[str, Any]]:
+        """获取 graph 并构建 run config"""
+        graph = self.graph_service._get_graph(ctx)
+
+        if graph_helper.is_agent_proj():
+            run_config = init_agent_config(graph, ctx)
+        else:
+            run_config = init_run_config(graph, ctx)
+
+        run_config["recursion_limit"] = 100
+        run_config["configurable"] = agent_configurable(session_id, ctx)
+        return graph, run_config
+
     def _handle_error(self, error: Exception) -> JSONResponse:
         """错误处理，返回 OpenAI 标准错误格式"""
         err = classify_error(error, {"node_name": "openai_handler"})
@@ -0,0 +1,15 @@
+"""
+项目路径
+数据文件的默认路径按项目根目录解析，不依赖进程的工作目录（例如从 src/ 启动时不会在 src/ 下生成缓存文件）
+"""
+import os
+
+# 项目根目录（src 的上一级）
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+
+def project_path(path: str) -> str:
+    """相对路径按项目根目录解析；绝对路径和空字符串（表示关闭）原样返回"""
+    if not path or os.path.isabs(path):
+        return path
+    return os.path.join(PROJECT_ROOT, path)
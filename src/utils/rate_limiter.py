@@ -2,58 +2,299 @@
 请求限流和重试机制
 用于防止 API 限流和处理临时错误
 """
+import asyncio
+import json
+import os
+import threading
 import time
 import random
-from typing import Callable, Any, Optional
+from typing import Callable, Any, Dict, Optional, Tuple
 from functools import wraps
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from utils.circuit_breaker import get_circuit_breaker
+
+
+class _MemoryBackend:
+    """进程内限流状态，基于单调时钟"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tat: Dict[str, float] = {}
+
+    def transact(self, key: str, fn: Callable[[float, float], Tuple[Optional[float], Any]]) -> Any:
+        """
+        原子地读取并更新某个桶的理论到达时间（TAT）
+
+        Args:
+            key: 桶名
+            fn: 接收 (tat, now)，返回 (新 tat 或 None 表示不更新, 结果)
+        """
+        with self._lock:
+            now = time.monotonic()
+            new_tat, result = fn(self._tat.get(key, now), now)
+            if new_tat is not None:
+                self._tat[key] = new_tat
+            return result
+
+
+class FileLockBackend:
+    """
+    基于文件锁的共享限流状态，同一台机器上的多个 uvicorn worker 共用一份配额
+
+    状态以 JSON 保存在文件中，使用墙钟时间以便跨进程比较；依赖 fcntl，仅支持类 Unix 系统
+    """
+
+    def __init__(self, path: str):
+        if fcntl is None:
+            raise RuntimeError("FileLockBackend requires fcntl (Unix only)")
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def transact(self, key: str, fn: Callable[[float, float], Tuple[Optional[float], Any]]) -> Any:
+        with self._lock, open(self.path, "a+", encoding="utf-8") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                raw = f.read()
+                try:
+                    state = json.loads(raw) if raw else {}
+                except ValueError:
+                    state = {}
+                now = time.time()
+                new_tat, result = fn(state.get(key, now), now)
+                if new_tat is not None:
+                    state[key] = new_tat
+                    f.seek(0)
+                    f.truncate()
+                    json.dump(state, f)
+                    f.flush()
+                return result
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class GCRALimiter:
+    """
+    GCRA（通用信元速率算法）限流器，等价于容量为 burst 的令牌桶
+
+    每个桶只保存一个理论到达时间，检查与更新都是 O(1)。
+    状态存放在 backend 中：默认进程内，可换成 FileLockBackend 让多个进程共享配额。
+    """
+
+    def __init__(self, name: str, max_calls: int, time_window: float,
+                 burst: Optional[int] = None, backend=None):
+        """
+        Args:
+            name: 桶名，如 "search"
+            max_calls: 时间窗口内允许的调用次数
+            time_window: 时间窗口（秒）
+            burst: 允许的突发调用数，默认等于 max_calls
+            backend: 状态存储，默认进程内存
+        """
+        self.name = name
+        self.max_calls = max_calls
+        self.time_window = time_window
+        self.burst = burst or max_calls
+        self.interval = time_window / max_calls
+        self.backend = backend or _MemoryBackend()
+        self._stats_lock = threading.Lock()
+        self._acquired = 0
+        self._throttled = 0
+
+    def try_acquire(self) -> float:
+        """
+        尝试获取一个配额
+
+        Returns:
+            0 表示已获取；否则返回需要等待的秒数（未获取）
+        """
+        def step(tat: float, now: float):
+            new_tat = max(tat, now) + self.interval
+            allow_at = new_tat - self.interval * self.burst
+            if now < allow_at:
+                return None, allow_at - now
+            return new_tat, 0.0
+
+        wait = self.backend.transact(self.name, step)
+        with self._stats_lock:
+            if wait == 0:
+                self._acquired += 1
+            else:
+                self._throttled += 1
+        return wait
+
+    def peek_wait(self) -> float:
+        """不消耗配额，返回获取下一个配额需要等待的秒数"""
+        def step(tat: float, now: float):
+            allow_at = max(tat, now) + self.interval - self.interval * self.burst
+            return None, max(allow_at - now, 0.0)
+
+        return self.backend.transact(self.name, step)
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """
+        阻塞直到获取配额
+
+        Args:
+            timeout: 最长等待秒数，为 None 时一直等待
+
+        Returns:
+            是否获取成功
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire()
+            if wait == 0:
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or remaining < wait:
+                    return False
+            time.sleep(wait)
+
+    async def aacquire(self, timeout: Optional[float] = None) -> bool:
+        """acquire 的异步版本，等待期间不阻塞事件循环"""
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        # 文件锁后端在多进程竞争时 flock 可能阻塞，放到线程中执行
+        in_memory = isinstance(self.backend, _MemoryBackend)
+        while True:
+            wait = self.try_acquire() if in_memory else await asyncio.to_thread(self.try_acquire)
+            if wait == 0:
+                return True
+            if deadline is not None:
+                remaining = deadline - loop.time()
+                if remaining <= 0 or remaining < wait:
+                    return False
+            await asyncio.sleep(wait)
+
+    def get_stats(self) -> dict:
+        """获取配置与获取/被限流次数"""
+        with self._stats_lock:
+            return {
+                "max_calls": self.max_calls,
+                "time_window": self.time_window,
+                "burst": self.burst,
+                "acquired": self._acquired,
+                "throttled": self._throttled,
+            }
+
 
 class RateLimiter:
-    """请求限流器"""
-    
+    """
+    请求限流器
+
+    保留原有的 can_make_call/record_call/wait_time 接口，内部使用 GCRA，线程安全且每次检查 O(1)
+    """
+
     def __init__(self, max_calls: int = 10, time_window: int = 60):
         """
         初始化限流器
-        
+
         Args:
             max_calls: 时间窗口内最大调用次数
             time_window: 时间窗口（秒）
         """
         self.max_calls = max_calls
         self.time_window = time_window
-        self.calls = []
-    
+        self._limiter = GCRALimiter("default", max_calls, time_window)
+
     def can_make_call(self) -> bool:
         """
         检查是否可以进行调用
-        
+
         Returns:
             是否可以调用
         """
-        now = time.time()
-        
-        # 清除过期记录
-        self.calls = [call_time for call_time in self.calls if now - call_time < self.time_window]
-        
-        return len(self.calls) < self.max_calls
-    
+        return self._limiter.peek_wait() == 0
+
     def record_call(self) -> None:
         """记录一次调用"""
-        self.calls.append(time.time())
-    
+        def step(tat: float, now: float):
+            return max(tat, now) + self._limiter.interval, None
+
+        self._limiter.backend.transact(self._limiter.name, step)
+
     def wait_time(self) -> float:
         """
         获取需要等待的时间
-        
+
         Returns:
             需要等待的秒数，如果可以立即调用则返回 0
         """
-        if self.can_make_call():
-            return 0.0
-        
-        now = time.time()
-        oldest_call = self.calls[0]
-        return oldest_call + self.time_window - now
+        return self._limiter.peek_wait()
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """阻塞直到获取配额"""
+        return self._limiter.acquire(timeout)
+
+    async def aacquire(self, timeout: Optional[float] = None) -> bool:
+        """异步等待直到获取配额"""
+        return await self._limiter.aacquire(timeout)
+
+
+# 各服务的默认配额：(时间窗口内调用次数, 时间窗口秒数)
+# 可通过环境变量覆盖，如 RATE_LIMIT_SEARCH="10/2" 表示每 2 秒 10 次
+DEFAULT_RATE_LIMITS: Dict[str, Tuple[int, float]] = {
+    "search": (5, 1),
+    "llm": (10, 1),
+    "vision": (2, 1),
+    "db": (50, 1),
+}
+
+# 限流状态存储: memory（进程内）或 file（同机多进程共享）
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_FILE = os.getenv("RATE_LIMIT_FILE", "/tmp/ecommerce_scout_rate_limit.json")
+
+
+def _service_limit(service_name: str) -> Tuple[int, float]:
+    env_value = os.getenv(f"RATE_LIMIT_{service_name.upper()}")
+    if env_value:
+        calls, _, window = env_value.partition("/")
+        return int(calls), float(window or 1)
+    return DEFAULT_RATE_LIMITS.get(service_name, (10, 1))
+
+
+_rate_limiters: Dict[str, GCRALimiter] = {}
+_rate_limiters_lock = threading.Lock()
+_shared_backend = None
+
+def get_rate_limiter(service_name: str) -> GCRALimiter:
+    """
+    获取服务对应的全局限流器
+
+    Args:
+        service_name: 服务名称，如 "search"、"llm"、"vision"、"db"
+    """
+    global _shared_backend
+    limiter = _rate_limiters.get(service_name)
+    if limiter is not None:
+        return limiter
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(service_name)
+        if limiter is None:
+            backend = None
+            if RATE_LIMIT_BACKEND == "file":
+                if _shared_backend is None:
+                    _shared_backend = FileLockBackend(RATE_LIMIT_FILE)
+                backend = _shared_backend
+            max_calls, time_window = _service_limit(service_name)
+            limiter = GCRALimiter(service_name, max_calls, time_window, backend=backend)
+            _rate_limiters[service_name] = limiter
+        return limiter
+
+
+def get_rate_limit_stats() -> Dict[str, dict]:
+    """获取所有已创建限流器的统计"""
+    return {name: limiter.get_stats() for name, limiter in list(_rate_limiters.items())}
 
 
 def retry_with_backoff(
@@ -109,11 +350,12 @@ def retry_with_backoff(
 
 
 class ServiceAvailability:
-    """服务可用性管理器"""
-    
-    def __init__(self):
-        """初始化服务可用性管理器"""
-        self.service_status = {}  # 服务名称 -> {available: bool, last_checked: timestamp}
+    """
+    服务可用性管理器
+
+    基于熔断器实现：mark_unavailable 手动熔断指定时长，冷却结束后进入半开状态，
+    由少量探测请求决定是否恢复，而不是冷却期一过就放开全部流量
+    """
     
     def mark_available(self, service_name: str) -> None:
         """
@@ -122,10 +364,7 @@ class ServiceAvailability:
         Args:
             service_name: 服务名称
         """
-        self.service_status[service_name] = {
-            'available': True,
-            'last_checked': time.time()
-        }
+        get_circuit_breaker(service_name).reset()
     
     def mark_unavailable(self, service_name: str, cooldown: int = 300) -> None:
         """
@@ -135,11 +374,7 @@ class ServiceAvailability:
             service_name: 服务名称
             cooldown: 冷却时间（秒），默认5分钟
         """
-        self.service_status[service_name] = {
-            'available': False,
-            'last_checked': time.time(),
-            'cooldown_until': time.time() + cooldown
-        }
+        get_circuit_breaker(service_name).trip(cooldown)
     
     def is_available(self, service_name: str) -> bool:
         """
@@ -149,19 +384,9 @@ class ServiceAvailability:
             service_name: 服务名称
         
         Returns:
-            是否可用
+            是否可用（半开状态下探测名额未满时也视为可用）
         """
-        if service_name not in self.service_status:
-            return True  # 未知服务，假设可用
-        
-        status = self.service_status[service_name]
-        
-        # 检查冷却期是否已过
-        if not status['available'] and time.time() > status.get('cooldown_until', 0):
-            # 冷却期已过，重置为可用
-            status['available'] = True
-        
-        return status['available']
+        return get_circuit_breaker(service_name).is_available()
     
     def get_status(self, service_name: str) -> dict:
         """
@@ -173,15 +398,9 @@ class ServiceAvailability:
         Returns:
             服务状态字典
         """
-        if service_name not in self.service_status:
-            return {'available': True, 'status': 'unknown'}
-        
-        status = self.service_status[service_name]
-        return {
-            'available': status['available'],
-            'last_checked': status.get('last_checked'),
-            'cooldown_until': status.get('cooldown_until')
-        }
+        status = get_circuit_breaker(service_name).get_status()
+        status['last_checked'] = status['last_changed']
+        return status
 
 
 # 全局服务可用性管理器实例
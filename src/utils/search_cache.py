@@ -0,0 +1,208 @@
+"""
+多级搜索结果缓存
+内存 LRU + SQLite 持久层，所有搜索工具共享；热门品类的重复搜索跨会话、跨进程重启命中缓存，
+减少付费且受限流约束的搜索调用
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from utils.paths import project_path
+
+logger = logging.getLogger(__name__)
+
+# 缓存有效期（秒）
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", "1800"))
+# 内存层最多保留的条目数
+SEARCH_CACHE_MEMORY_SIZE = int(os.getenv("SEARCH_CACHE_MEMORY_SIZE", "512"))
+# 持久层 SQLite 文件路径（相对路径按项目根目录解析），设为空字符串时只使用内存层
+SEARCH_CACHE_DB_PATH = project_path(os.getenv("SEARCH_CACHE_DB_PATH", "assets/cache/search_cache.sqlite3"))
+# 持久层最多保留的条目数
+SEARCH_CACHE_DISK_MAX_ROWS = int(os.getenv("SEARCH_CACHE_DISK_MAX_ROWS", "20000"))
+
+
+def normalize_search_key(tool: str, query: str, count: Optional[int] = None,
+                         sites: Optional[str] = None, time_range: Optional[str] = None,
+                         **extra: Any) -> str:
+    """
+    生成规范化的搜索缓存键
+
+    查询词去除首尾空白、合并连续空白并转小写；站点列表去重排序。
+    extra 用于携带其他影响结果的参数（如 search_type、need_summary）
+
+    Returns:
+        缓存键（sha256 十六进制）
+    """
+    normalized_query = " ".join((query or "").split()).lower()
+    normalized_sites = ""
+    if sites:
+        normalized_sites = ",".join(sorted({s.strip().lower() for s in sites.split(",") if s.strip()}))
+    payload = {
+        "tool": tool,
+        "query": normalized_query,
+        "count": int(count) if count is not None else None,
+        "sites": normalized_sites,
+        "time_range": (time_range or "").strip().lower(),
+    }
+    for k, v in extra.items():
+        payload[k] = v
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class SearchCache:
+    """
+    两级搜索缓存
+
+    - 内存层：有容量上限的 LRU
+    - 持久层：SQLite，进程重启后仍可命中；读到时回填内存层
+    值为字符串（调用方负责序列化），过期时间使用墙钟时间以便跨进程共享
+    """
+
+    def __init__(self, db_path: Optional[str] = SEARCH_CACHE_DB_PATH,
+                 memory_size: int = SEARCH_CACHE_MEMORY_SIZE,
+                 ttl: int = SEARCH_CACHE_TTL,
+                 disk_max_rows: int = SEARCH_CACHE_DISK_MAX_ROWS):
+        self.ttl = ttl
+        self.memory_size = memory_size
+        self.disk_max_rows = disk_max_rows
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0}
+        self._writes_since_trim = 0
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._db = self._open_db(db_path)
+
+    @staticmethod
+    def _open_db(db_path: str) -> Optional[sqlite3.Connection]:
+        try:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(db_path, check_same_thread=False, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS search_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_search_cache_expires ON search_cache (expires_at)")
+            conn.commit()
+            return conn
+        except sqlite3.Error as e:
+            logger.warning(f"Search cache disk tier disabled: {e}")
+            return None
+
+    def _memory_put(self, key: str, value: str, expires_at: float) -> None:
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        获取缓存值
+
+        Returns:
+            缓存值，不存在或已过期时返回 None
+        """
+        now = time.time()
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None:
+                if item[1] > now:
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return item[0]
+                del self._memory[key]
+
+            if self._db is not None:
+                try:
+                    row = self._db.execute(
+                        "SELECT value, expires_at FROM search_cache WHERE key = ?", (key,)
+                    ).fetchone()
+                except sqlite3.Error as e:
+                    logger.warning(f"Search cache disk read failed: {e}")
+                    row = None
+                if row is not None and row[1] > now:
+                    self._memory_put(key, row[0], row[1])
+                    self._stats["disk_hits"] += 1
+                    return row[0]
+
+            self._stats["misses"] += 1
+            return None
+
+    def set(self, key: str, value: str, ttl: Optional[int] = None) -> None:
+        """
+        写入缓存（同时写入内存层和持久层）
+
+        Args:
+            key: 缓存键
+            value: 缓存值
+            ttl: 有效期（秒），为 None 时使用默认值
+        """
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._memory_put(key, value, expires_at)
+            self._stats["writes"] += 1
+            if self._db is None:
+                return
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO search_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, value, expires_at),
+                )
+                self._writes_since_trim += 1
+                if self._writes_since_trim >= 100:
+                    self._trim_disk()
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Search cache disk write failed: {e}")
+
+    def _trim_disk(self) -> None:
+        """删除过期条目，并在超过容量时删除最早过期的条目"""
+        self._writes_since_trim = 0
+        self._db.execute("DELETE FROM search_cache WHERE expires_at <= ?", (time.time(),))
+        (rows,) = self._db.execute("SELECT COUNT(*) FROM search_cache").fetchone()
+        if rows > self.disk_max_rows:
+            self._db.execute(
+                "DELETE FROM search_cache WHERE key IN ("
+                "SELECT key FROM search_cache ORDER BY expires_at LIMIT ?)",
+                (rows - self.disk_max_rows,),
+            )
+
+    def clear(self) -> None:
+        """清空两级缓存"""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM search_cache")
+                self._db.commit()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取命中统计"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_keys"] = len(self._memory)
+            stats["disk_enabled"] = self._db is not None
+            return stats
+
+
+# 全局搜索缓存实例
+_search_cache = None
+_search_cache_lock = threading.Lock()
+
+def get_search_cache() -> SearchCache:
+    """获取全局搜索缓存实例"""
+    global _search_cache
+    if _search_cache is None:
+        with _search_cache_lock:
+            if _search_cache is None:
+                _search_cache = SearchCache()
+    return _search_cache
@@ -0,0 +1,240 @@
+"""
+共享搜索客户端连接池
+所有搜索工具复用同一个 requests.Session，保持 HTTP keep-alive，避免每次调用都重新建立 TCP/TLS 连接
+"""
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from coze_coding_utils.runtime_ctx.context import Context, new_context
+from coze_coding_dev_sdk import SearchClient
+from coze_coding_dev_sdk.core.config import Config
+from coze_coding_dev_sdk.core.exceptions import NetworkError
+from coze_coding_dev_sdk.search.models import SearchResponse
+from utils.deadline_executor import DeadlineExceeded, remaining_time
+from utils.search_cache import SearchCache, get_search_cache, normalize_search_key
+from utils.single_flight import get_single_flight
+from utils.rate_limiter import get_rate_limiter
+from utils.circuit_breaker import get_circuit_breaker
+
+logger = logging.getLogger(__name__)
+
+# 连接池中每个主机保留的最大连接数
+SEARCH_POOL_MAXSIZE = int(os.getenv("SEARCH_POOL_MAXSIZE", "16"))
+# 同时进行中的搜索请求上限
+SEARCH_MAX_IN_FLIGHT = int(os.getenv("SEARCH_MAX_IN_FLIGHT", "8"))
+
+
+class _UpstreamStatusError(Exception):
+    """上游返回 5xx，仅用于让熔断器记录一次失败"""
+
+    def __init__(self, response: requests.Response):
+        self.response = response
+        super().__init__(f"upstream status {response.status_code}")
+
+
+class PooledSearchClient(SearchClient):
+    """
+    使用共享 Session 发请求的 SearchClient
+
+    请求头仍由 SDK 根据本次调用的 ctx 生成，只替换底层发送逻辑：
+    走共享连接池，并受进程级并发信号量约束。重试策略与 SDK 保持一致，
+    在截止时间约束内调用时，请求超时不超过剩余时间，预算耗尽后不再重试。
+    传入 cache 时，search()（以及基于它的 web_search/image_search）先查多级缓存；
+    未命中时相同参数的并发搜索合并为一次上游请求。
+    每次上游 HTTP 请求受按工具划分的熔断器保护，熔断期间直接抛出 CircuitOpenError，不再等待超时；
+    本地配额和并发名额的等待不计入熔断统计。
+    """
+
+    def __init__(
+        self,
+        session: requests.Session,
+        semaphore: threading.BoundedSemaphore,
+        config: Optional[Config] = None,
+        ctx: Optional[Context] = None,
+        custom_headers: Optional[Dict[str, str]] = None,
+        verbose: bool = False,
+        tool: str = "search",
+        cache: Optional[SearchCache] = None,
+    ):
+        super().__init__(config=config, ctx=ctx, custom_headers=custom_headers, verbose=verbose)
+        self._session = session
+        self._semaphore = semaphore
+        self.tool = tool
+        self._cache = cache
+
+    def search(
+        self,
+        query: str,
+        search_type: str = "web",
+        count: Optional[int] = 10,
+        need_content: Optional[bool] = False,
+        need_url: Optional[bool] = False,
+        sites: Optional[str] = None,
+        block_hosts: Optional[str] = None,
+        need_summary: Optional[bool] = True,
+        time_range: Optional[str] = None,
+    ) -> SearchResponse:
+        params = dict(
+            query=query, search_type=search_type, count=count, need_content=need_content,
+            need_url=need_url, sites=sites, block_hosts=block_hosts,
+            need_summary=need_summary, time_range=time_range,
+        )
+        key = normalize_search_key(
+            self.tool, query, count=count, sites=sites, time_range=time_range,
+            search_type=search_type, need_summary=bool(need_summary),
+            need_content=bool(need_content), need_url=bool(need_url),
+            block_hosts=block_hosts or "",
+        )
+        if self._cache is not None:
+            cached = self._cache.get(key)
+            if cached is not None:
+                return SearchResponse.model_validate_json(cached)
+
+        # 相同参数的并发搜索只发一次上游请求
+        return get_single_flight().do(f"search:{key}", lambda: self._fetch(key, params))
+
+    def _fetch(self, key: str, params: Dict[str, Any]) -> SearchResponse:
+        response = super().search(**params)
+        # 空结果可能是上游临时异常，不缓存
+        if self._cache is not None and (response.web_items or response.image_items):
+            self._cache.set(key, response.model_dump_json())
+        return response
+
+    def _make_request(self, method: str, url: str, **kwargs) -> requests.Response:
+        last_error = None
+        is_stream = kwargs.get("stream", False)
+        breaker = get_circuit_breaker(self.tool)
+        # 熔断期间直接拒绝，不再排队等待配额和并发名额
+        if not breaker.is_available():
+            # 名额可能恰好空出，此时只做检查，归还占用的探测名额
+            breaker.release(breaker.before_call())
+
+        for attempt in range(self.config.retry_times):
+            remaining = remaining_time()
+            if remaining is not None and remaining <= 0:
+                raise last_error or DeadlineExceeded(f"deadline exceeded before {method} {url}")
+
+            try:
+                if attempt == 0:
+                    self._log_request(method, url, **kwargs)
+
+                # 共享的 search 配额，跨工具统一限流
+                if not get_rate_limiter("search").acquire(timeout=remaining):
+                    raise DeadlineExceeded(f"deadline exceeded waiting for search rate limit: {url}")
+                # 只在真正发请求时占用并发名额，重试等待期间不占用
+                if not self._semaphore.acquire(timeout=remaining_time()):
+                    raise DeadlineExceeded(f"deadline exceeded waiting for search slot: {url}")
+
+                # 请求超时不超过剩余时间
+                timeout = self.config.timeout
+                remaining = remaining_time()
+                if remaining is not None:
+                    timeout = max(min(timeout, remaining), 0.001)
+                try:
+                    # 熔断器只统计上游请求本身，本地限流和排队超时不计为上游失败
+                    response = breaker.call(self._send, method, url, timeout, **kwargs)
+                except _UpstreamStatusError as e:
+                    # 已计入熔断统计，响应仍交给 SDK 按原逻辑处理
+                    response = e.response
+                finally:
+                    self._semaphore.release()
+
+                if attempt == 0:
+                    self._log_response(response, is_stream=is_stream)
+
+                return response
+
+            except requests.exceptions.RequestException as e:
+                last_error = NetworkError(str(e), e)
+                if attempt < self.config.retry_times - 1:
+                    delay = self.config.retry_delay * (attempt + 1)
+                    remaining = remaining_time()
+                    if remaining is not None and remaining <= delay:
+                        break
+                    time.sleep(delay)
+                    continue
+
+        raise last_error
+
+    def _send(self, method: str, url: str, timeout: float, **kwargs) -> requests.Response:
+        """发送请求；上游 5xx 以 _UpstreamStatusError 抛出，计入熔断统计"""
+        response = self._session.request(method=method, url=url, timeout=timeout, **kwargs)
+        if response.status_code >= 500:
+            raise _UpstreamStatusError(response)
+        return response
+
+
+class SearchClientPool:
+    """
+    进程级搜索客户端池
+
+    Session 与连接池全局共享；每次调用 client() 都返回携带本次 ctx 的轻量客户端，
+    因此不同请求的链路头不会串用。
+    """
+
+    def __init__(self, pool_maxsize: int = SEARCH_POOL_MAXSIZE,
+                 max_in_flight: int = SEARCH_MAX_IN_FLIGHT):
+        self.pool_maxsize = pool_maxsize
+        self.max_in_flight = max_in_flight
+        self._semaphore = threading.BoundedSemaphore(max_in_flight)
+        self._session = self._create_session()
+
+    def _create_session(self) -> requests.Session:
+        session = requests.Session()
+        # 重试由客户端自己处理，适配器不再重试
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_maxsize, max_retries=0)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def client(self, method: str = "search", ctx: Optional[Context] = None,
+               use_cache: bool = True) -> PooledSearchClient:
+        """
+        获取一个使用共享连接池的搜索客户端
+
+        Args:
+            method: 调用方标识，如 "search.web"；用作缓存键中的工具名，未传 ctx 时也用于创建新 context
+            ctx: 请求上下文，传入时直接使用
+            use_cache: 是否使用多级搜索缓存
+
+        Returns:
+            PooledSearchClient 实例
+        """
+        if ctx is None:
+            ctx = new_context(method=method)
+        return PooledSearchClient(
+            session=self._session,
+            semaphore=self._semaphore,
+            ctx=ctx,
+            tool=method,
+            cache=get_search_cache() if use_cache else None,
+        )
+
+    def close(self) -> None:
+        """关闭连接池"""
+        self._session.close()
+
+
+# 全局搜索客户端池实例
+_search_client_pool = None
+_search_client_pool_lock = threading.Lock()
+
+def get_search_client_pool() -> SearchClientPool:
+    """获取全局搜索客户端池实例"""
+    global _search_client_pool
+    if _search_client_pool is None:
+        with _search_client_pool_lock:
+            if _search_client_pool is None:
+                _search_client_pool = SearchClientPool()
+    return _search_client_pool
+
+
+def get_search_client(method: str = "search", ctx: Optional[Context] = None,
+                      use_cache: bool = True) -> PooledSearchClient:
+    """获取使用共享连接池（默认带多级缓存）的搜索客户端"""
+    return get_search_client_pool().client(method=method, ctx=ctx, use_cache=use_cache)
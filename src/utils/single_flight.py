@@ -0,0 +1,116 @@
+"""
+单飞请求合并
+相同键的并发调用只执行一次上游请求，其余调用等待并共享同一结果（或异常）
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from utils.deadline_executor import DeadlineExceeded, remaining_time
+
+
+class _Call:
+    """一次进行中的调用"""
+
+    __slots__ = ("event", "result", "error", "waiters")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    按键合并并发调用
+
+    第一个到达的调用（leader）执行函数，同一键上后续到达的调用（follower）等待其完成。
+    结果不做缓存：leader 完成后，新的调用会重新执行。
+    follower 在截止时间约束内调用时，最多等待到截止时间。
+    leader 因自身截止时间耗尽而失败（DeadlineExceeded）时，预算仍有剩余的 follower 重新竞争，
+    其中一个成为新的 leader 重新执行；其他异常原样传递给所有 follower。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._stats = {"executed": 0, "shared": 0, "retried": 0}
+
+    def do(self, key: str, fn: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        """
+        执行或加入相同键的进行中调用
+
+        Args:
+            key: 合并键
+            fn: 无参函数
+            timeout: follower 最长等待时间（秒），为 None 时使用当前截止时间的剩余时间
+
+        Returns:
+            函数返回值
+
+        Raises:
+            DeadlineExceeded: follower 等待超时，或 leader 超时且本调用也已没有剩余预算
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                if call is None:
+                    call = _Call()
+                    self._calls[key] = call
+                    leader = True
+                    self._stats["executed"] += 1
+                else:
+                    call.waiters += 1
+                    leader = False
+                    self._stats["shared"] += 1
+
+            if leader:
+                try:
+                    call.result = fn()
+                    return call.result
+                except BaseException as e:
+                    call.error = e
+                    raise
+                finally:
+                    with self._lock:
+                        self._calls.pop(key, None)
+                    call.event.set()
+
+            wait = remaining_time() if deadline is None else deadline - time.monotonic()
+            if wait is not None and wait <= 0:
+                raise DeadlineExceeded(f"deadline exceeded waiting for in-flight call: {key}")
+            if not call.event.wait(wait):
+                raise DeadlineExceeded(f"deadline exceeded waiting for in-flight call: {key}")
+            if call.error is None:
+                return call.result
+            # leader 只是用完了自己的预算，预算还有剩余的 follower 重新竞争执行，而不是跟着失败
+            if isinstance(call.error, DeadlineExceeded):
+                wait = remaining_time() if deadline is None else deadline - time.monotonic()
+                if wait is None or wait > 0:
+                    with self._lock:
+                        self._stats["retried"] += 1
+                    continue
+            raise call.error
+
+    def get_stats(self) -> Dict[str, int]:
+        """获取执行次数、共享次数、leader 超时后的重试次数和当前进行中的调用数"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._calls)
+            return stats
+
+
+# 全局单飞实例
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+def get_single_flight() -> SingleFlight:
+    """获取全局单飞实例"""
+    global _single_flight
+    if _single_flight is None:
+        with _single_flight_lock:
+            if _single_flight is None:
+                _single_flight = SingleFlight()
+    return _single_flight
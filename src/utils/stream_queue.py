@@ -0,0 +1,238 @@
+"""
+有界流式队列
+在后台生产者线程和 SSE 消费协程之间传递 chunk，支持高/低水位背压和小块合并；
+以及按时间窗口合并文本片段再推送的发送器
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 队列长度达到高水位时生产者开始合并/阻塞，降到低水位后恢复
+STREAM_QUEUE_HIGH_WATERMARK = int(os.getenv("STREAM_QUEUE_HIGH_WATERMARK", "256"))
+STREAM_QUEUE_LOW_WATERMARK = int(os.getenv("STREAM_QUEUE_LOW_WATERMARK", "64"))
+
+# 合并函数：返回合并后的 chunk，无法合并时返回 None
+MergeFunc = Callable[[Any, Any], Optional[Any]]
+
+
+class QueueStats:
+    """单次运行的队列统计"""
+
+    __slots__ = (
+        "run_id", "depth", "max_depth", "total_items", "coalesced",
+        "blocked_count", "blocked_seconds", "started_at", "finished_at",
+    )
+
+    def __init__(self, run_id: str):
+        self.run_id = run_id
+        self.depth = 0
+        self.max_depth = 0
+        self.total_items = 0
+        self.coalesced = 0
+        self.blocked_count = 0
+        self.blocked_seconds = 0.0
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        end = self.finished_at or time.time()
+        return {
+            "run_id": self.run_id,
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "total_items": self.total_items,
+            "coalesced": self.coalesced,
+            "blocked_count": self.blocked_count,
+            "blocked_ms": int(self.blocked_seconds * 1000),
+            "duration_ms": int((end - self.started_at) * 1000),
+            "active": self.finished_at is None,
+        }
+
+
+class StreamQueueRegistry:
+    """记录正在运行和最近结束的流式队列统计，用于观察慢客户端"""
+
+    def __init__(self, max_recent: int = 100):
+        self._lock = threading.Lock()
+        self._active: Dict[str, QueueStats] = {}
+        self._recent: Deque[QueueStats] = deque(maxlen=max_recent)
+
+    def register(self, stats: QueueStats) -> None:
+        with self._lock:
+            self._active[stats.run_id] = stats
+
+    def unregister(self, stats: QueueStats) -> None:
+        with self._lock:
+            if self._active.get(stats.run_id) is stats:
+                del self._active[stats.run_id]
+            self._recent.append(stats)
+
+    def snapshot(self) -> Dict[str, List[Dict[str, Any]]]:
+        with self._lock:
+            return {
+                "active": [s.to_dict() for s in self._active.values()],
+                "recent": [s.to_dict() for s in self._recent],
+            }
+
+
+# 全局流式队列统计实例
+_stream_queue_registry = None
+
+def get_stream_queue_registry() -> StreamQueueRegistry:
+    """获取全局流式队列统计实例"""
+    global _stream_queue_registry
+    if _stream_queue_registry is None:
+        _stream_queue_registry = StreamQueueRegistry()
+    return _stream_queue_registry
+
+
+class BackpressureQueue:
+    """
+    线程生产者 -> asyncio 消费者的有界队列
+
+    - put() 在生产者线程调用。队列达到高水位时，先尝试把新 chunk 合并进队尾
+      （如相邻的回答增量），无法合并则阻塞，直到消费者把队列消费到低水位
+    - get() 在事件循环中 await，返回 None 表示生产结束
+    - 消费者取消时调用 close()，阻塞中的生产者会立即返回，后续 put() 直接丢弃
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        run_id: str,
+        high_watermark: int = STREAM_QUEUE_HIGH_WATERMARK,
+        low_watermark: int = STREAM_QUEUE_LOW_WATERMARK,
+        merge: Optional[MergeFunc] = None,
+    ):
+        if low_watermark >= high_watermark:
+            low_watermark = max(high_watermark // 4, 0)
+        self._loop = loop
+        self._items: Deque[Any] = deque()
+        self._cond = threading.Condition()
+        self._not_empty = asyncio.Event()
+        self._closed = False
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self._merge = merge
+        self.stats = QueueStats(run_id)
+        get_stream_queue_registry().register(self.stats)
+
+    def _notify_consumer(self) -> None:
+        try:
+            self._loop.call_soon_threadsafe(self._not_empty.set)
+        except RuntimeError:
+            # 事件循环已关闭，消费者不存在了
+            pass
+
+    def put(self, item: Any) -> bool:
+        """
+        生产者线程写入 chunk
+
+        Returns:
+            是否写入（或合并）成功，队列已关闭时返回 False
+        """
+        with self._cond:
+            if self._closed:
+                return False
+
+            if len(self._items) >= self.high_watermark:
+                # 消费者落后：优先合并进队尾，避免阻塞模型输出
+                if self._merge is not None and self._items and item is not None:
+                    merged = self._merge(self._items[-1], item)
+                    if merged is not None:
+                        self._items[-1] = merged
+                        self.stats.coalesced += 1
+                        return True
+
+                self.stats.blocked_count += 1
+                blocked_at = time.monotonic()
+                while not self._closed and len(self._items) > self.low_watermark:
+                    self._cond.wait()
+                self.stats.blocked_seconds += time.monotonic() - blocked_at
+                if self._closed:
+                    return False
+
+            self._items.append(item)
+            self.stats.total_items += 1
+            self.stats.depth = len(self._items)
+            if self.stats.depth > self.stats.max_depth:
+                self.stats.max_depth = self.stats.depth
+
+        self._notify_consumer()
+        return True
+
+    def put_end(self) -> None:
+        """写入结束标记；结束标记不受水位限制"""
+        with self._cond:
+            if self._closed:
+                return
+            self._items.append(None)
+        self._notify_consumer()
+
+    async def get(self) -> Any:
+        """消费者获取下一个 chunk，None 表示结束"""
+        while True:
+            with self._cond:
+                if self._items:
+                    item = self._items.popleft()
+                    self.stats.depth = len(self._items)
+                    if self.stats.depth <= self.low_watermark:
+                        self._cond.notify_all()
+                    return item
+                self._not_empty.clear()
+            await self._not_empty.wait()
+
+    def close(self) -> None:
+        """关闭队列，唤醒阻塞的生产者并记录统计"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._items.clear()
+            self.stats.depth = 0
+            self._cond.notify_all()
+        self.stats.finished_at = time.time()
+        get_stream_queue_registry().unregister(self.stats)
+        if self.stats.blocked_count or self.stats.coalesced:
+            logger.info(f"Stream queue stats for slow consumer: {self.stats.to_dict()}")
+
+
+class TimeWindowBatcher:
+    """
+    按时间窗口合并流式文本片段后再发送
+
+    第一个片段立即发送（首字延迟不受影响），之后同一窗口内到达的片段合并为一次发送，
+    减少 Socket.IO 等逐帧推送的开销。窗口只在新片段到达时检查，
+    调用方在模型输出告一段落（如开始调用工具、回答结束）时应调用 flush()
+    """
+
+    def __init__(self, send: Callable[[str], Any], window_seconds: float):
+        self._send = send
+        self.window_seconds = window_seconds
+        self._parts: List[str] = []
+        self._last_flush = float("-inf")
+        self.flushes = 0
+
+    def add(self, text: str) -> None:
+        """加入一个片段，距上次发送超过窗口时立即发送"""
+        if not text:
+            return
+        self._parts.append(text)
+        if time.monotonic() - self._last_flush >= self.window_seconds:
+            self.flush()
+
+    def flush(self) -> None:
+        """发送缓冲中的片段"""
+        if not self._parts:
+            return
+        text = "".join(self._parts)
+        self._parts.clear()
+        self._last_flush = time.monotonic()
+        self.flushes += 1
+        self._send(text)
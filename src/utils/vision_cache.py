@@ -0,0 +1,224 @@
+"""
+视觉模型分析结果缓存
+按图片内容缓存：同一张图（包括缩放、重新压缩后的副本）在同一分析类型、同一提示词版本下
+只调用一次视觉模型。精确匹配用预处理后图片的 sha256，近似匹配要求感知哈希接近且颜色缩略图一致，
+同款不同色的商品图不会共用分析结果。结果保存在 SQLite 中，进程重启后仍可命中，按过期时间和容量淘汰
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from utils.image_prep import color_distance
+from utils.paths import project_path
+
+logger = logging.getLogger(__name__)
+
+# 缓存有效期（秒），默认 7 天
+VISION_CACHE_TTL = int(os.getenv("VISION_CACHE_TTL", str(7 * 24 * 3600)))
+# SQLite 文件路径（相对路径按项目根目录解析），设为空字符串时关闭缓存
+VISION_CACHE_DB_PATH = project_path(os.getenv("VISION_CACHE_DB_PATH", "assets/cache/vision_cache.sqlite3"))
+# 最多保留的条目数
+VISION_CACHE_MAX_ROWS = int(os.getenv("VISION_CACHE_MAX_ROWS", "5000"))
+# 感知哈希汉明距离不超过该值视为同一张图；哈希分 4 段各 16 位，距离不超过 3 时至少有一段完全相同
+VISION_CACHE_MAX_DISTANCE = int(os.getenv("VISION_CACHE_MAX_DISTANCE", "3"))
+# 近似匹配时颜色缩略图各像素各通道允许的最大差值；重新压缩、缩放带来的偏差远小于该值
+VISION_CACHE_COLOR_TOLERANCE = int(os.getenv("VISION_CACHE_COLOR_TOLERANCE", "24"))
+
+_BANDS = 4
+_BAND_BITS = 16
+
+
+def _bands(phash: int):
+    mask = (1 << _BAND_BITS) - 1
+    return [(phash >> (i * _BAND_BITS)) & mask for i in range(_BANDS)]
+
+
+def _to_signed(value: int) -> int:
+    """64 位无符号整数转为 SQLite INTEGER 可存的有符号数"""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def _to_unsigned(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+class VisionCache:
+    """
+    视觉分析结果缓存
+
+    查找顺序：先按内容键精确匹配（本地图片为内容摘要，网络图片为 URL），
+    再按感知哈希的分段找候选，汉明距离和颜色缩略图都接近时命中近似重复的图片
+    """
+
+    def __init__(self, db_path: Optional[str] = VISION_CACHE_DB_PATH,
+                 ttl: int = VISION_CACHE_TTL,
+                 max_rows: int = VISION_CACHE_MAX_ROWS,
+                 max_distance: int = VISION_CACHE_MAX_DISTANCE,
+                 color_tolerance: int = VISION_CACHE_COLOR_TOLERANCE):
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.max_distance = max_distance
+        self.color_tolerance = color_tolerance
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "near_hits": 0, "misses": 0, "writes": 0}
+        self._writes_since_trim = 0
+        self._db: Optional[sqlite3.Connection] = self._open_db(db_path) if db_path else None
+
+    @staticmethod
+    def _open_db(db_path: str) -> Optional[sqlite3.Connection]:
+        try:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(db_path, check_same_thread=False, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS vision_cache ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "content_key TEXT NOT NULL, variant TEXT NOT NULL, "
+                "phash INTEGER, band0 INTEGER, band1 INTEGER, band2 INTEGER, band3 INTEGER, "
+                "color BLOB, value TEXT NOT NULL, expires_at REAL NOT NULL, "
+                "UNIQUE (content_key, variant))"
+            )
+            # 旧版本的表没有 color 列；旧条目没有颜色信息，不参与近似匹配
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(vision_cache)")}
+            if "color" not in columns:
+                conn.execute("ALTER TABLE vision_cache ADD COLUMN color BLOB")
+            for i in range(_BANDS):
+                conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS idx_vision_cache_band{i} ON vision_cache (variant, band{i})"
+                )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_vision_cache_expires ON vision_cache (expires_at)")
+            conn.commit()
+            return conn
+        except sqlite3.Error as e:
+            logger.warning(f"Vision cache disabled: {e}")
+            return None
+
+    @staticmethod
+    def variant(analysis_type: str, prompt_version: Any, model: str) -> str:
+        """分析类型、提示词版本和模型组成的缓存维度，任一变化都不会命中旧结果"""
+        return f"{analysis_type}|v{prompt_version}|{model}"
+
+    @staticmethod
+    def content_key(digest: Optional[str] = None, url: Optional[str] = None) -> str:
+        """内容键：本地图片用预处理后图片的 sha256，网络图片用 URL"""
+        if digest is not None:
+            return f"sha256:{digest}"
+        return f"url:{url}"
+
+    def get(self, content_key: str, variant: str, phash: Optional[int] = None,
+            color: Optional[bytes] = None) -> Optional[str]:
+        """
+        获取缓存的分析结果
+
+        Args:
+            content_key: content_key() 生成的内容键
+            variant: variant() 生成的缓存维度
+            phash: 感知哈希，与 color 都提供时还会查找近似重复的图片
+            color: 颜色缩略图（image_prep.color_signature）
+
+        Returns:
+            分析结果，未命中返回 None
+        """
+        if self._db is None:
+            return None
+        now = time.time()
+        with self._lock:
+            try:
+                row = self._db.execute(
+                    "SELECT value FROM vision_cache WHERE content_key = ? AND variant = ? AND expires_at > ?",
+                    (content_key, variant, now),
+                ).fetchone()
+                if row is not None:
+                    self._stats["hits"] += 1
+                    return row[0]
+
+                if phash is not None and color is not None and self.max_distance > 0:
+                    best = None
+                    conditions = " OR ".join(f"band{i} = ?" for i in range(_BANDS))
+                    for stored, stored_color, value in self._db.execute(
+                        f"SELECT phash, color, value FROM vision_cache "
+                        f"WHERE variant = ? AND expires_at > ? AND color IS NOT NULL AND ({conditions})",
+                        (variant, now, *_bands(phash)),
+                    ):
+                        if color_distance(color, stored_color) > self.color_tolerance:
+                            continue
+                        distance = bin(_to_unsigned(stored) ^ phash).count("1")
+                        if distance <= self.max_distance and (best is None or distance < best[0]):
+                            best = (distance, value)
+                    if best is not None:
+                        self._stats["near_hits"] += 1
+                        return best[1]
+            except sqlite3.Error as e:
+                logger.warning(f"Vision cache read failed: {e}")
+
+            self._stats["misses"] += 1
+            return None
+
+    def set(self, content_key: str, variant: str, value: str, phash: Optional[int] = None,
+            color: Optional[bytes] = None) -> None:
+        """写入分析结果；phash 和 color 用于之后的近似匹配"""
+        if self._db is None:
+            return
+        bands = _bands(phash) if phash is not None else [None] * _BANDS
+        with self._lock:
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO vision_cache "
+                    "(content_key, variant, phash, band0, band1, band2, band3, color, value, expires_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (content_key, variant, _to_signed(phash) if phash is not None else None,
+                     *bands, color, value, time.time() + self.ttl),
+                )
+                self._stats["writes"] += 1
+                self._writes_since_trim += 1
+                if self._writes_since_trim >= 50:
+                    self._trim()
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Vision cache write failed: {e}")
+
+    def _trim(self) -> None:
+        """删除过期条目，并在超过容量时删除最早过期的条目"""
+        self._writes_since_trim = 0
+        self._db.execute("DELETE FROM vision_cache WHERE expires_at <= ?", (time.time(),))
+        (rows,) = self._db.execute("SELECT COUNT(*) FROM vision_cache").fetchone()
+        if rows > self.max_rows:
+            self._db.execute(
+                "DELETE FROM vision_cache WHERE id IN ("
+                "SELECT id FROM vision_cache ORDER BY expires_at LIMIT ?)",
+                (rows - self.max_rows,),
+            )
+
+    def clear(self) -> None:
+        """清空缓存"""
+        if self._db is None:
+            return
+        with self._lock:
+            self._db.execute("DELETE FROM vision_cache")
+            self._db.commit()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取命中统计"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["enabled"] = self._db is not None
+            return stats
+
+
+# 全局视觉分析缓存实例
+_vision_cache = None
+_vision_cache_lock = threading.Lock()
+
+def get_vision_cache() -> VisionCache:
+    """获取全局视觉分析缓存实例"""
+    global _vision_cache
+    if _vision_cache is None:
+        with _vision_cache_lock:
+            if _vision_cache is None:
+                _vision_cache = VisionCache()
+    return _vision_cache
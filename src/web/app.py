@@ -5,6 +5,7 @@
 
 import os
 import json
+import time
 import uuid
 from datetime import datetime
 from flask import Flask, render_template, request, jsonify
@@ -29,6 +30,18 @@ socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
 import sys
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 from agents.agent import build_agent
+from utils.image_store import get_image_store, is_image_ref
+from utils.helper.agent_helper import agent_iter_server_messages
+from utils.messages.server import (
+    MESSAGE_END_CODE_SUCCESS,
+    MESSAGE_TYPE_ANSWER,
+    MESSAGE_TYPE_MESSAGE_END,
+    MESSAGE_TYPE_TOOL_REQUEST,
+)
+from utils.stream_queue import TimeWindowBatcher
+
+# message_chunk 合并发送的时间窗口（毫秒）
+WEB_STREAM_FLUSH_MS = int(os.getenv('WEB_STREAM_FLUSH_MS', '40'))
 
 # 全局变量：存储Agent实例和会话
 agent_instances = {}
@@ -189,37 +202,31 @@ def handle_chat(data):
         
         # 构建输入消息
         from langchain_core.messages import HumanMessage
-        import base64
         
         # 如果有图片，使用多模态消息
         if image_url:
-            # 检查是否是相对路径，转换为绝对路径
+            # 上传的图片缩放后存入图片存储，消息（及检查点）中只保存引用，调用模型前再解析
             if image_url.startswith('/uploads/'):
-                filename = image_url.replace('/uploads/', '')
+                filename = os.path.basename(image_url.replace('/uploads/', ''))
                 image_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
                 
-                # 读取图片并转换为 base64
                 try:
                     with open(image_path, 'rb') as f:
-                        image_data = f.read()
-                    # 检测图片格式
-                    import imghdr
-                    image_format = imghdr.what(None, h=image_data)
-                    if not image_format:
-                        image_format = 'png'  # 默认使用 png
-                    
-                    # 转换为 base64
-                    image_base64 = base64.b64encode(image_data).decode('utf-8')
-                    image_url = f"data:image/{image_format};base64,{image_base64}"
-                    logger.info(f"图片已转换为 base64，格式: {image_format}, 大小: {len(image_base64)} 字符")
+                        image_url = get_image_store().put(f.read())
+                    logger.info(f"图片已存储: {image_url}")
                 except Exception as e:
-                    logger.error(f"图片转换失败: {str(e)}")
+                    logger.error(f"图片存储失败: {str(e)}")
                     raise
             
+            text = user_message
+            if is_image_ref(image_url):
+                # 让模型调用图片分析工具时可以直接传入引用
+                text = f"{user_message}\n（图片引用: {image_url}）"
+            
             input_message = HumanMessage(content=[
                 {
                     "type": "text",
-                    "text": user_message
+                    "text": text
                 },
                 {
                     "type": "image_url",
@@ -239,48 +246,59 @@ def handle_chat(data):
             'message': '正在思考...'
         })
         
-        # 流式调用Agent
-        full_response = ""
-        chunk_count = 0
+        # 流式调用Agent：messages 模式逐 token 输出，按时间窗口合并后发送
+        session_id = user_sessions[request.sid]['thread_id']
+        msg_id = str(uuid.uuid4())
+        t0 = time.monotonic()
+        first_token_ms = None
+        full_response_length = 0
+        error_message = None
         
-        logger.info(f"开始流式调用 Agent...")
+        batcher = TimeWindowBatcher(
+            lambda text: emit('message_chunk', {'content': text}),
+            WEB_STREAM_FLUSH_MS / 1000,
+        )
         
-        for chunk in agent.stream(inputs, config=session_config):
-            chunk_count += 1
-            logger.info(f"收到 chunk #{chunk_count}: {list(chunk.keys())}")
-            
-            # 提取响应内容
-            # 注意：LangGraph 流式输出格式为 {'model': {'messages': [...]}}
-            if chunk and 'model' in chunk:
-                logger.info(f"  chunk['model'] 存在")
-                model_data = chunk.get('model', {})
-                if 'messages' in model_data:
-                    messages = model_data.get('messages', [])
-                    logger.info(f"  消息数量: {len(messages)}")
-                    
-                    for i, msg in enumerate(messages):
-                        if hasattr(msg, 'content'):
-                            content = msg.content
-                            logger.info(f"  消息 #{i}: content 类型={type(content)}, 长度={len(content) if isinstance(content, str) else 'N/A'}")
-                            
-                            if isinstance(content, str) and content:
-                                # 流式发送响应
-                                emit('message_chunk', {
-                                    'content': content
-                                })
-                                full_response += content
-                                logger.info(f"  发送 message_chunk, 累计长度: {len(full_response)}")
-                else:
-                    logger.warning(f"  chunk['model'] 中没有 'messages' 键")
-            else:
-                logger.warning(f"  chunk 中没有 'model' 键, 实际键: {list(chunk.keys())}")
+        items = agent.stream(inputs, config=session_config, stream_mode="messages")
+        for sm in agent_iter_server_messages(
+            items,
+            session_id=session_id,
+            query_msg_id=msg_id,
+            local_msg_id=msg_id,
+            run_id=str(uuid.uuid4()),
+            log_id="",
+        ):
+            if sm.type == MESSAGE_TYPE_ANSWER:
+                text = sm.content.answer or ""
+                if text and first_token_ms is None:
+                    first_token_ms = int((time.monotonic() - t0) * 1000)
+                full_response_length += len(text)
+                batcher.add(text)
+                if sm.finish:
+                    batcher.flush()
+            elif sm.type == MESSAGE_TYPE_TOOL_REQUEST:
+                # 开始调用工具，之前的回答片段不必等窗口结束
+                batcher.flush()
+                logger.debug(f"调用工具: {sm.content.tool_request.tool_name}")
+            elif sm.type == MESSAGE_TYPE_MESSAGE_END:
+                end = sm.content.message_end
+                if end.code != MESSAGE_END_CODE_SUCCESS:
+                    error_message = end.message
+        batcher.flush()
         
-        logger.info(f"流式调用完成，总 chunk 数: {chunk_count}, 完整响应长度: {len(full_response)}")
+        if error_message:
+            emit('error', {
+                'error': f'处理失败: {error_message}',
+                'timestamp': datetime.now().isoformat()
+            })
         
         # 发送完成信号
         emit('thinking_end', {})
         
-        logger.info(f"响应完成，长度: {len(full_response)} (session: {request.sid})")
+        logger.info(
+            f"响应完成，长度: {full_response_length}, 首字: {first_token_ms}ms, "
+            f"发送 {batcher.flushes} 次, 耗时: {int((time.monotonic() - t0) * 1000)}ms (session: {request.sid})"
+        )
     
     except Exception as e:
         logger.error(f"处理聊天消息失败: {str(e)}", exc_info=True)
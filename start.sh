@@ -36,10 +36,17 @@ if [ -n "$VENV_PATH" ]; then
         echo "✅ 版本正确: $VERSION"
     fi
 
+    # 初始化数据库（创建缺失的表、回填产品排名表），可重复执行
+    echo "=== 初始化数据库 ==="
+    $VENV_PATH/bin/python scripts/init_db.py || echo "⚠️  数据库初始化失败，请检查 PGDATABASE_URL 后手动执行 scripts/init_db.py"
+
     # 启动应用
     echo "=== 启动应用 ==="
     exec $VENV_PATH/bin/python src/web/app.py
 else
+    echo "=== 初始化数据库 ==="
+    python scripts/init_db.py || echo "⚠️  数据库初始化失败，请检查 PGDATABASE_URL 后手动执行 scripts/init_db.py"
+
     echo "=== 启动应用（系统 Python）==="
     exec python src/web/app.py
 fi
@@ -0,0 +1,49 @@
+"""
+测试公共夹具
+"""
+import os
+import sys
+
+import pytest
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+# 被测模块内部按 src 为根导入（与服务运行时一致）
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+
+def create_sqlite_session(*models):
+    """
+    创建内存 SQLite 数据库，并为给定的模型建表
+
+    Returns:
+        (engine, session)
+    """
+    engine = create_engine("sqlite://")
+    for model in models:
+        try:
+            model.__table__.create(engine)
+        except Exception as e:
+            # user_preferences 上的 user_id 索引重复定义，表本身已创建（同 init_db.py）
+            if "already exists" not in str(e):
+                raise
+    return engine, sessionmaker(bind=engine)()
+
+
+@pytest.fixture
+def sqlite_session():
+    """内存 SQLite 会话工厂：sqlite_session(Supplier, Product) -> (engine, session)，用例结束后释放"""
+    created = []
+
+    def factory(*models):
+        engine, db = create_sqlite_session(*models)
+        created.append((engine, db))
+        return engine, db
+
+    yield factory
+    for engine, db in created:
+        db.close()
+        engine.dispose()
@@ -0,0 +1,115 @@
+"""
+测试 Agent 注册表的缓存与配置热更新
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+import types
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.utils.helper.agent_registry import AgentRegistry, agent_configurable, REQUEST_HEADERS_KEY
+
+
+def _make_fake_agent_module(config_path: str) -> types.ModuleType:
+    """构造一个记录构建次数的假 Agent 模块"""
+    module = types.ModuleType("fake_agent_module")
+    module.build_count = 0
+
+    def resolve_llm_config_path():
+        return config_path
+
+    def build_agent(ctx=None, cfg=None):
+        module.build_count += 1
+        return {"model": cfg["config"]["model"], "build": module.build_count}
+
+    module.resolve_llm_config_path = resolve_llm_config_path
+    module.build_agent = build_agent
+    sys.modules[module.__name__] = module
+    return module
+
+
+def _write_config(path: str, model: str) -> None:
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"config": {"model": model}, "sp": "test"}, f)
+
+
+def test_agent_registry_reuses_and_reloads():
+    """测试 Agent 复用与配置变更后重建"""
+    print("\n=== 测试 Agent 注册表 ===")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config_path = os.path.join(tmp, "agent_llm_config.json")
+        _write_config(config_path, "model-a")
+        module = _make_fake_agent_module(config_path)
+        registry = AgentRegistry()
+
+        first = registry.get(module.__name__)
+        second = registry.get(module.__name__)
+        assert first is second, "相同配置应该复用同一个 Agent"
+        assert module.build_count == 1
+        print("✓ 相同配置复用 Agent")
+
+        # 修改配置文件，确保 mtime 变化
+        time.sleep(0.01)
+        _write_config(config_path, "model-b")
+        os.utime(config_path, ns=(time.time_ns(), time.time_ns() + 1_000_000))
+
+        third = registry.get(module.__name__)
+        assert third["model"] == "model-b", "配置变更后应该重建 Agent"
+        assert module.build_count == 2
+        print("✓ 配置变更后自动重建")
+
+        registry.invalidate(module.__name__)
+        registry.get(module.__name__)
+        assert module.build_count == 3
+        print("✓ 手动失效后重建")
+
+
+def test_agent_registry_rebuilds_after_ttl():
+    """测试编译结果到期后重建（刷新凭证），重建失败时继续使用旧结果"""
+    print("\n=== 测试 Agent 到期重建 ===")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config_path = os.path.join(tmp, "agent_llm_config.json")
+        _write_config(config_path, "model-a")
+        module = _make_fake_agent_module(config_path)
+        registry = AgentRegistry(ttl=0.05, retry_seconds=0.05)
+
+        first = registry.get(module.__name__)
+        assert registry.get(module.__name__) is first
+        time.sleep(0.06)
+        second = registry.get(module.__name__)
+        assert second is not first and module.build_count == 2
+        print("✓ 到期后重新构建")
+
+        build_agent = module.build_agent
+
+        def failing_build_agent(ctx=None, cfg=None):
+            raise RuntimeError("凭证服务不可用")
+
+        module.build_agent = failing_build_agent
+        time.sleep(0.06)
+        assert registry.get(module.__name__) is second
+        module.build_agent = build_agent
+        assert registry.get(module.__name__) is second, "重试间隔内不再重建"
+        time.sleep(0.06)
+        assert registry.get(module.__name__)["build"] == 3
+        print("✓ 重建失败时沿用旧 Agent，稍后重试")
+
+
+def test_agent_configurable():
+    """测试 configurable 携带 thread_id 和请求头"""
+    configurable = agent_configurable("session-1", None)
+    assert configurable["thread_id"] == "session-1"
+    assert configurable[REQUEST_HEADERS_KEY] == {}
+    print("✓ configurable 构建正确")
+
+
+if __name__ == "__main__":
+    test_agent_registry_reuses_and_reloads()
+    test_agent_registry_rebuilds_after_ttl()
+    test_agent_configurable()
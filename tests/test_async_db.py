@@ -0,0 +1,103 @@
+"""
+测试异步数据库路径：连接串转换与 AsyncSupplierManager 委托
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+# 被测模块内部按 src 为根导入（与服务运行时一致）
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from storage.database import db as db_module
+from storage.database.db import to_async_url
+from storage.database.shared.model import Supplier
+from storage.database.supplier_manager import AsyncSupplierManager, SupplierCreate
+
+
+class _RunSyncSession:
+    """只实现 run_sync 的 AsyncSession 替身，在同步 sqlite 会话上执行"""
+
+    def __init__(self, session):
+        self.session = session
+        self.calls = 0
+
+    async def run_sync(self, fn, *args, **kwargs):
+        self.calls += 1
+        return fn(self.session, *args, **kwargs)
+
+
+def test_to_async_url():
+    """测试连接串换成 psycopg3 异步驱动"""
+    print("\n=== 测试异步连接串 ===")
+    assert to_async_url("postgresql://u:p@h:5432/db") == "postgresql+psycopg://u:p@h:5432/db"
+    assert to_async_url("postgres://u@h/db?sslmode=require") == "postgresql+psycopg://u@h/db?sslmode=require"
+    assert to_async_url("postgresql+psycopg2://u@h/db") == "postgresql+psycopg://u@h/db"
+    assert to_async_url("postgresql+psycopg://u@h/db") == "postgresql+psycopg://u@h/db"
+    assert to_async_url("sqlite:///x.db") == "sqlite:///x.db"
+    print("✅ 连接串转换正确")
+
+
+def test_async_manager_delegates_to_sync_methods():
+    """测试 AsyncSupplierManager 的方法通过 run_sync 复用同步实现"""
+    print("\n=== 测试 AsyncSupplierManager ===")
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'async.db')}")
+        Supplier.__table__.create(engine)
+        session = sessionmaker(bind=engine)()
+        db = _RunSyncSession(session)
+        mgr = AsyncSupplierManager()
+
+        async def run():
+            created = await mgr.create_supplier(db, SupplierCreate(name="义乌小商品", platform="1688",
+                                                                   categories=["收纳盒"]))
+            found = await mgr.get_supplier_by_id(db, created.id)
+            page = await mgr.get_suppliers(db, limit=10)
+            return created, found, page
+
+        try:
+            created, found, page = asyncio.run(run())
+        finally:
+            session.close()
+            engine.dispose()
+
+    assert found.id == created.id and found.name == "义乌小商品"
+    assert [s.id for s in page] == [created.id]
+    assert db.calls == 3
+    assert AsyncSupplierManager.search_suppliers.__doc__ == \
+        AsyncSupplierManager()._manager.search_suppliers.__doc__
+    assert asyncio.iscoroutinefunction(AsyncSupplierManager.recommend_product_rows)
+    print("✅ 异步方法复用同步实现")
+
+
+def test_async_pool_fits_connection_budget():
+    """测试异步引擎与检查点连接池合计不超过 DB_MAX_CONNECTIONS"""
+    print("\n=== 测试连接数预算 ===")
+    saved = (db_module.DB_POOL_SIZE, db_module.DB_MAX_OVERFLOW,
+             db_module.DB_MAX_CONNECTIONS, db_module.DB_CHECKPOINT_POOL_SIZE)
+    try:
+        for pool_size, overflow, limit, checkpoint in [(5, 10, 20, 5), (5, 10, 12, 5), (10, 0, 8, 5)]:
+            db_module.DB_POOL_SIZE, db_module.DB_MAX_OVERFLOW = pool_size, overflow
+            db_module.DB_MAX_CONNECTIONS, db_module.DB_CHECKPOINT_POOL_SIZE = limit, checkpoint
+            size, max_overflow = db_module.async_pool_limits()
+            assert size + max_overflow + checkpoint <= limit, (size, max_overflow, limit)
+            assert size >= 1 and max_overflow >= 0
+        db_module.DB_POOL_SIZE, db_module.DB_MAX_OVERFLOW = 5, 10
+        db_module.DB_MAX_CONNECTIONS, db_module.DB_CHECKPOINT_POOL_SIZE = 20, 5
+        assert db_module.async_pool_limits() == (5, 10)
+    finally:
+        (db_module.DB_POOL_SIZE, db_module.DB_MAX_OVERFLOW,
+         db_module.DB_MAX_CONNECTIONS, db_module.DB_CHECKPOINT_POOL_SIZE) = saved
+    print("✅ 两个连接池合计不超过上限")
+
+
+if __name__ == "__main__":
+    test_to_async_url()
+    test_async_manager_delegates_to_sync_methods()
+    test_async_pool_fits_connection_budget()
+    print("\n✅ 所有测试通过！")
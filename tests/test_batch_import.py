@@ -0,0 +1,175 @@
+"""
+测试供应商批量导入
+"""
+import os
+import sys
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+# 被测模块内部按 src 为根导入（与服务运行时一致）
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from sqlalchemy import event, text
+from sqlalchemy.exc import IntegrityError
+
+from conftest import create_sqlite_session
+from storage.database.shared.model import Product, Supplier
+from storage.database.supplier_manager import SupplierCreate, SupplierManager
+
+
+def test_bulk_insert_with_row_failures(sqlite_session):
+    """测试分批插入，校验失败的行单独报告"""
+    print("\n=== 测试批量插入 ===")
+    engine, db = sqlite_session(Supplier)
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    rows = [{"name": f"供应商{i}", "platform": "1688", "categories": ["手机壳"]} for i in range(250)]
+    rows[5]["rating"] = 9
+    rows[120]["name"] = "x" * 300
+    result = SupplierManager().batch_import_suppliers(db, rows, chunk_size=100)
+
+    assert result["inserted"] == 248
+    assert result["failed"] == 2
+    assert [item["index"] for item in result["failed_items"]] == [5, 120]
+    assert "rating" in result["failed_items"][0]["error"]
+    assert db.query(Supplier).count() == 248
+    # 每批一次自然键查询 + 一次批量插入，而不是每行一次
+    inserts = [s for s in statements if s.startswith("INSERT INTO suppliers")]
+    assert len(inserts) <= 3 * 2
+    print(f"✓ 250 行导入，{len(statements)} 条 SQL")
+
+
+def test_upsert_on_natural_key(sqlite_session):
+    """测试按名称 + 平台更新已存在的供应商，只覆盖提供的字段"""
+    print("\n=== 测试自然键更新 ===")
+    _, db = sqlite_session(Supplier)
+    mgr = SupplierManager()
+    mgr.batch_import_suppliers(db, [{"name": "义乌小商品", "platform": "1688", "region": "浙江", "tags": ["源头"]}])
+
+    result = mgr.batch_import_suppliers(db, [
+        {"name": "义乌小商品", "platform": "1688", "rating": 4.8},
+        {"name": "义乌小商品", "platform": "1688", "notes": "复购"},
+        {"name": "义乌小商品", "platform": "alibaba"},
+    ])
+    assert result["inserted"] == 1
+    assert result["updated"] == 2
+
+    supplier = db.query(Supplier).filter(Supplier.platform == "1688").one()
+    assert supplier.region == "浙江"
+    assert supplier.tags == ["源头"]
+    assert supplier.rating == 4.8
+    assert supplier.notes == "复购"
+    assert db.query(Supplier).count() == 2
+    print("✓ 已存在的供应商按自然键更新")
+
+
+def test_concurrent_insert_becomes_update(sqlite_session):
+    """测试查询之后被其他导入抢先插入的供应商改为更新，不插入重复行"""
+    print("\n=== 测试并发导入同一供应商 ===")
+    engine, db = sqlite_session(Supplier)
+    mgr = SupplierManager()
+    lookup = SupplierManager._supplier_ids
+    calls = []
+
+    def racing_lookup(session, keys):
+        # 第一次查询之后，另一个导入插入了同一供应商
+        if not calls:
+            calls.append(1)
+            with engine.begin() as conn:
+                conn.execute(Supplier.__table__.insert(), {"name": "义乌小商品", "platform": "1688",
+                                                           "region": "浙江", "status": "active"})
+            return {}
+        return lookup(session, keys)
+
+    SupplierManager._supplier_ids = staticmethod(racing_lookup)
+    try:
+        result = mgr.batch_import_suppliers(db, [
+            {"name": "义乌小商品", "platform": "1688", "rating": 4.5},
+            {"name": "永康五金", "platform": "1688"},
+        ])
+    finally:
+        SupplierManager._supplier_ids = staticmethod(lookup)
+
+    assert result["failed"] == 0, result["failed_items"]
+    assert (result["inserted"], result["updated"]) == (1, 1)
+    supplier = db.query(Supplier).filter(Supplier.name == "义乌小商品").one()
+    assert supplier.region == "浙江" and supplier.rating == 4.5
+    print("✓ 冲突的行改为更新")
+
+
+def test_merge_duplicates_before_unique_index(sqlite_session):
+    """测试预览不修改数据；合并时补齐空字段、保留不同的值，产品改挂到保留的供应商"""
+    print("\n=== 测试重复供应商合并 ===")
+    engine, db = sqlite_session(Supplier, Product)
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX uq_suppliers_name_platform"))
+    rows = [
+        Supplier(name="义乌小商品", platform="1688", contact_phone="111", categories=["收纳盒"], status="active"),
+        Supplier(name="义乌小商品", platform="1688", contact_phone="222", wechat_id="yiwu",
+                 categories=["收纳盒", "挂钩"], notes="老客户", status="active"),
+        Supplier(name="义乌小商品", platform=None, status="active"),
+        Supplier(name="义乌小商品", platform=None, address="义乌国际商贸城", status="active"),
+        Supplier(name="义乌小商品", platform="alibaba", status="active"),
+    ]
+    db.add_all(rows)
+    db.commit()
+    ids = [row.id for row in rows]
+    db.add(Product(supplier_id=ids[1], name="收纳盒", status="active"))
+    db.commit()
+
+    mgr = SupplierManager()
+    plans = mgr.find_duplicate_suppliers(db)
+    assert sorted((plan["keep_id"], plan["duplicate_ids"]) for plan in plans) == [(ids[0], [ids[1]]), (ids[2], [ids[3]])]
+    assert db.query(Supplier).count() == 5, "预览不修改数据"
+
+    mgr.merge_duplicate_suppliers(db)
+    db.expire_all()
+    assert sorted(row.id for row in db.query(Supplier)) == [ids[0], ids[2], ids[4]]
+    kept = db.get(Supplier, ids[0])
+    assert kept.contact_phone == "111" and kept.wechat_id == "yiwu"
+    assert kept.categories == ["收纳盒", "挂钩"]
+    assert "老客户" in kept.notes and f"[合并自 #{ids[1]}] contact_phone: 222" in kept.notes
+    assert db.get(Supplier, ids[2]).address == "义乌国际商贸城"
+    assert db.query(Product).one().supplier_id == ids[0]
+
+    index = next(i for i in Supplier.__table__.indexes if i.name == "uq_suppliers_name_platform")
+    index.create(bind=engine)
+    db.add(Supplier(name="义乌小商品", platform=None, status="active"))
+    try:
+        db.commit()
+        raise AssertionError("唯一索引应拒绝重复的自然键")
+    except IntegrityError:
+        db.rollback()
+    assert mgr.find_duplicate_suppliers(db) == []
+    print("✓ 重复行合并且不丢字段，唯一索引创建成功")
+
+
+def test_upsert_supplier_updates_existing(sqlite_session):
+    """测试重复保存同一供应商时更新提供的字段，而不是因唯一索引失败"""
+    print("\n=== 测试保存已存在的供应商 ===")
+    _, db = sqlite_session(Supplier)
+    mgr = SupplierManager()
+    first, created = mgr.upsert_supplier(db, SupplierCreate(name="永康五金", platform="1688",
+                                                            region="浙江", source="智能体搜索"))
+    assert created and first.categories == [] and first.is_verified is False
+
+    second, created = mgr.upsert_supplier(db, SupplierCreate(name="永康五金", platform="1688", rating=4.6))
+    assert not created and second.id == first.id
+    assert second.region == "浙江" and second.rating == 4.6 and second.source == "智能体搜索"
+    assert db.query(Supplier).count() == 1
+
+    try:
+        mgr.create_supplier(db, SupplierCreate(name="永康五金", platform="1688"))
+        raise AssertionError("create_supplier 遇到重复自然键应抛出 ValueError")
+    except ValueError:
+        pass
+    print("✓ 已存在的供应商被更新")
+
+
+if __name__ == "__main__":
+    test_bulk_insert_with_row_failures(create_sqlite_session)
+    test_upsert_on_natural_key(create_sqlite_session)
+    test_concurrent_insert_becomes_update(create_sqlite_session)
+    test_merge_duplicates_before_unique_index(create_sqlite_session)
+    test_upsert_supplier_updates_existing(create_sqlite_session)
@@ -0,0 +1,76 @@
+"""
+测试缓存管理器的容量上限、过期清理与统计
+"""
+import os
+import sys
+import threading
+import time
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.utils.cache_manager import CacheManager
+
+
+def test_bounded_lru_eviction():
+    """测试超过容量时淘汰最久未使用的条目"""
+    print("\n=== 测试容量上限 ===")
+    cache = CacheManager(max_size=3, sweep_interval=0)
+    for i in range(3):
+        cache.set(f"k{i}", i)
+    assert cache.get("k0") == 0  # k0 变为最近使用
+    cache.set("k3", 3)           # 淘汰 k1
+
+    assert cache.get("k1") is None
+    assert cache.get("k0") == 0
+    stats = cache.get_stats()
+    assert stats["total_keys"] == 3
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 2 and stats["misses"] == 1
+    print(f"✓ 统计: {stats}")
+
+
+def test_background_sweep_removes_expired():
+    """测试后台线程清理未被读取的过期条目"""
+    print("\n=== 测试后台清理 ===")
+    cache = CacheManager(max_size=100, sweep_interval=0.05)
+    try:
+        for i in range(10):
+            cache.set(f"short{i}", i, ttl=0.01)
+        cache.set("long", "v", ttl=60)
+        time.sleep(0.3)
+        stats = cache.get_stats()
+        assert stats["total_keys"] == 1, f"过期条目应被清理: {stats}"
+        assert stats["expirations"] == 10
+        assert cache.get("long") == "v"
+        print("✓ 过期条目已清理")
+    finally:
+        cache.close()
+
+
+def test_concurrent_access():
+    """测试多线程并发读写时容量不超限且计数一致"""
+    print("\n=== 测试并发访问 ===")
+    cache = CacheManager(max_size=50, sweep_interval=0)
+
+    def worker(n):
+        for i in range(500):
+            cache.set(f"{n}:{i % 80}", i)
+            cache.get(f"{n}:{(i + 1) % 80}")
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    stats = cache.get_stats()
+    assert stats["total_keys"] <= 50
+    assert stats["hits"] + stats["misses"] == 8 * 500
+    print(f"✓ 并发后统计: {stats}")
+
+
+if __name__ == "__main__":
+    test_bounded_lru_eviction()
+    test_background_sweep_removes_expired()
+    test_concurrent_access()
@@ -0,0 +1,134 @@
+"""
+测试熔断器
+"""
+import os
+import sys
+import time
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+# 被测模块内部按 src 为根导入（与服务运行时一致）
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from src.utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+
+def _fail():
+    raise ConnectionError("上游 502")
+
+
+def test_opens_on_failure_rate():
+    """测试失败率超过阈值后熔断，熔断期间直接拒绝"""
+    print("\n=== 测试失败率熔断 ===")
+    breaker = CircuitBreaker("search.test", window_size=10, min_calls=4, failure_rate=0.5, open_seconds=30)
+
+    breaker.call(lambda: "ok")
+    breaker.call(lambda: "ok")
+    for _ in range(2):
+        try:
+            breaker.call(_fail)
+        except ConnectionError:
+            pass
+    assert breaker.state == "open"
+
+    calls = []
+    start = time.monotonic()
+    try:
+        breaker.call(lambda: calls.append(1))
+        assert False, "熔断期间应拒绝调用"
+    except CircuitOpenError as e:
+        assert e.retry_after > 0
+    assert not calls
+    assert time.monotonic() - start < 0.05
+    assert breaker.get_status()["rejected"] == 1
+    print("✓ 失败率达到 50% 后熔断")
+
+
+def test_opens_on_slow_calls():
+    """测试慢调用率超过阈值后熔断"""
+    print("\n=== 测试慢调用熔断 ===")
+    breaker = CircuitBreaker("llm.test", window_size=5, min_calls=3,
+                             slow_call_seconds=0.5, slow_call_rate=0.6)
+    for _ in range(2):
+        breaker.record(True, 0.01)
+    assert breaker.state == "closed"
+    for _ in range(2):
+        breaker.record(True, 1.0)
+    assert breaker.state == "closed"
+    breaker.record(True, 1.0)
+    assert breaker.state == "open"
+    print("✓ 慢调用率达到 60% 后熔断")
+
+
+def test_half_open_limits_probes():
+    """测试半开状态只放行有限的探测请求，探测成功后恢复"""
+    print("\n=== 测试半开探测 ===")
+    breaker = CircuitBreaker("vision.test", half_open_probes=2)
+    breaker.trip(0.05)
+    assert not breaker.is_available()
+    time.sleep(0.06)
+    assert breaker.state == "half_open"
+
+    first = breaker.before_call()
+    second = breaker.before_call()
+    try:
+        breaker.before_call()
+        assert False, "探测名额已满时应拒绝"
+    except CircuitOpenError:
+        pass
+
+    breaker.record(True, 0.01, first)
+    assert breaker.state == "half_open"
+    breaker.record(True, 0.01, second)
+    assert breaker.state == "closed"
+    print("✓ 2 个探测成功后恢复")
+
+
+def test_half_open_failure_reopens():
+    """测试半开状态下探测失败重新熔断"""
+    print("\n=== 测试探测失败 ===")
+    breaker = CircuitBreaker("search.probe", open_seconds=30)
+    breaker.trip(0.01)
+    time.sleep(0.02)
+    try:
+        breaker.call(_fail)
+    except ConnectionError:
+        pass
+    assert breaker.state == "open"
+    assert breaker.get_status()["opened"] == 2
+    print("✓ 探测失败后重新熔断")
+
+
+def test_half_open_ignores_non_probe_calls():
+    """测试熔断前放行的调用在半开期间返回时不计入探测结果"""
+    print("\n=== 测试半开期间的非探测结果 ===")
+    breaker = CircuitBreaker("llm.stale", half_open_probes=1)
+    assert breaker.before_call() is None
+    breaker.trip(0.01)
+    time.sleep(0.02)
+    probe = breaker.before_call()
+    assert probe is not None
+
+    # 熔断前放行的慢调用/失败调用此时才返回，不重新熔断，也不占用探测名额
+    breaker.record(False, 0.01)
+    assert breaker.state == "half_open"
+    assert not breaker.is_available()
+
+    # 上一轮半开的探测在新一轮半开中返回同样不计入
+    breaker.trip(0.01)
+    time.sleep(0.02)
+    breaker.record(True, 0.01, probe)
+    assert breaker.state == "half_open"
+    current = breaker.before_call()
+    assert current != probe
+    breaker.record(True, 0.01, current)
+    assert breaker.state == "closed"
+    print("✓ 只有本轮探测的结果决定恢复")
+
+
+if __name__ == "__main__":
+    test_opens_on_failure_rate()
+    test_opens_on_slow_calls()
+    test_half_open_limits_probes()
+    test_half_open_failure_reopens()
+    test_half_open_ignores_non_probe_calls()
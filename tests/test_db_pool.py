@@ -0,0 +1,97 @@
+"""
+测试数据库会话与连接池指标
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+# 被测模块内部按 src 为根导入（与服务运行时一致）
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from sqlalchemy import create_engine, text
+
+from storage.database import db as db_module
+
+
+def _engine(path, **kwargs):
+    engine = create_engine(f"sqlite:///{path}", poolclass=db_module.InstrumentedQueuePool, **kwargs)
+    db_module._instrument_pool(engine)
+    return engine
+
+
+def test_checkout_wait_and_age_metrics():
+    """测试连接池耗尽时记录等待时间和超时"""
+    print("\n=== 测试连接池指标 ===")
+    db_module._pool_metrics = db_module.PoolMetrics()
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = _engine(os.path.join(tmp, "pool.db"), pool_size=1, max_overflow=0, pool_timeout=0.2)
+
+        held = engine.connect()
+        released = threading.Event()
+
+        def release_later():
+            time.sleep(0.1)
+            held.close()
+            released.set()
+
+        threading.Thread(target=release_later).start()
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        released.wait()
+
+        # 唯一的连接被占用且不释放时，取连接超时
+        held = engine.connect()
+        try:
+            engine.connect()
+            assert False, "应超时"
+        except Exception:
+            pass
+        held.close()
+        engine.dispose()
+
+    stats = db_module._pool_metrics.snapshot()
+    assert stats["checkouts"] == 3
+    assert stats["checkout_timeouts"] == 1
+    assert stats["checkout_wait_max_ms"] >= 80
+    assert stats["connects"] == 1
+    assert stats["connection_age_max_s"] >= 0.1
+    print(f"✓ {stats}")
+
+
+def test_session_scope_closes_and_rolls_back():
+    """测试 session_scope 异常时回滚并关闭会话"""
+    print("\n=== 测试 session_scope ===")
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = _engine(os.path.join(tmp, "scope.db"))
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE t (x INTEGER)"))
+        from sqlalchemy.orm import sessionmaker
+        original = db_module._SessionLocal
+        db_module._SessionLocal = sessionmaker(bind=engine)
+        try:
+            try:
+                with db_module.session_scope() as db:
+                    db.execute(text("INSERT INTO t VALUES (1)"))
+                    raise RuntimeError("工具出错")
+            except RuntimeError:
+                pass
+            assert engine.pool.checkedout() == 0
+
+            with db_module.session_scope() as db:
+                db.execute(text("INSERT INTO t VALUES (2)"))
+                db.commit()
+            with db_module.session_scope() as db:
+                assert [r[0] for r in db.execute(text("SELECT x FROM t"))] == [2]
+        finally:
+            db_module._SessionLocal = original
+            engine.dispose()
+    print("✓ 异常回滚，连接归还")
+
+
+if __name__ == "__main__":
+    test_checkout_wait_and_age_metrics()
+    test_session_scope_closes_and_rolls_back()
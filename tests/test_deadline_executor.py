@@ -0,0 +1,104 @@
+"""
+测试共享截止时间执行器的超时返回与统计
+"""
+import os
+import sys
+import threading
+import time
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.utils.deadline_executor import DeadlineExecutor, DeadlineExceeded, remaining_time
+
+
+def test_timeout_returns_within_budget():
+    """测试挂起的调用在预算内返回，不等待后台线程"""
+    print("\n=== 测试超时返回 ===")
+    executor = DeadlineExecutor(max_workers=2)
+    release = threading.Event()
+
+    start = time.monotonic()
+    try:
+        executor.run("hung_tool", release.wait, 5, timeout=0.2)
+        assert False, "应该超时"
+    except DeadlineExceeded:
+        pass
+    elapsed = time.monotonic() - start
+    release.set()
+
+    assert elapsed < 0.5, f"超时后应立即返回，实际耗时 {elapsed:.2f}s"
+    assert executor.get_stats()["hung_tool"] == {"calls": 1, "timeouts": 1, "errors": 0}
+    print(f"✓ {elapsed:.2f}s 内返回")
+
+
+def test_queued_call_is_cancelled():
+    """测试线程占满时排队的调用同样按预算超时，且不会再被执行"""
+    print("\n=== 测试排队调用取消 ===")
+    executor = DeadlineExecutor(max_workers=1)
+    release = threading.Event()
+    ran = []
+
+    try:
+        executor.run("blocker", release.wait, 5, timeout=0.1)
+    except DeadlineExceeded:
+        pass
+
+    try:
+        executor.run("queued", lambda: ran.append(1), timeout=0.1)
+        assert False, "应该超时"
+    except DeadlineExceeded:
+        pass
+
+    release.set()
+    time.sleep(0.1)
+    assert ran == [], "超时的排队任务不应再执行"
+    print("✓ 排队任务被取消")
+
+
+def test_deadline_visible_to_callee():
+    """测试被调用函数可以读取剩余时间，结果和异常正常传递"""
+    print("\n=== 测试截止时间传递 ===")
+    executor = DeadlineExecutor(max_workers=2)
+
+    remaining = executor.run("probe", remaining_time, timeout=1.0)
+    assert 0 < remaining <= 1.0
+    assert remaining_time() is None
+
+    try:
+        executor.run("failing", lambda: 1 / 0, timeout=1.0)
+        assert False, "应该抛出原始异常"
+    except ZeroDivisionError:
+        pass
+    assert executor.get_stats()["failing"]["errors"] == 1
+    print("✓ 截止时间和异常传递正确")
+
+
+def test_run_all_concurrent():
+    """测试 run_all 并发执行、按顺序返回结果，失败和超时的项不影响其他项"""
+    print("\n=== 测试并发执行 ===")
+    executor = DeadlineExecutor(max_workers=4)
+
+    def work(item):
+        if item == "fail":
+            raise ValueError(item)
+        time.sleep(5 if item == "slow" else 0.2)
+        return item.upper()
+
+    start = time.monotonic()
+    results = executor.run_all("fan_out", work, ["a", "b", "fail", "slow"], timeout=0.5)
+    elapsed = time.monotonic() - start
+
+    assert results[:2] == ["A", "B"]
+    assert isinstance(results[2], ValueError)
+    assert isinstance(results[3], DeadlineExceeded)
+    assert elapsed < 0.8, f"各项应并发执行，实际耗时 {elapsed:.2f}s"
+    assert executor.get_stats()["fan_out"] == {"calls": 4, "timeouts": 1, "errors": 1}
+    print(f"✓ {elapsed:.2f}s 内完成 4 项")
+
+
+if __name__ == "__main__":
+    test_timeout_returns_within_budget()
+    test_queued_call_is_cancelled()
+    test_deadline_visible_to_callee()
+    test_run_all_concurrent()
@@ -0,0 +1,97 @@
+"""
+测试视觉模型图片预处理
+"""
+import os
+import sys
+from io import BytesIO
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+# 被测模块内部按 src 为根导入（与服务运行时一致）
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from PIL import Image, ImageFilter
+
+from utils import image_prep
+from utils.image_prep import MAX_BASE64_SIZE, prepare_image
+
+
+def _photo(width, height, fmt="JPEG", mode="RGB", exif=None, **save_kwargs):
+    """生成带噪声的类照片图片（难以压缩）"""
+    noise = Image.frombytes("L", (width, height), os.urandom(width * height)).filter(ImageFilter.GaussianBlur(1))
+    gradient = Image.linear_gradient("L").resize((width, height))
+    img = Image.merge("RGB", (noise, gradient, Image.blend(noise, gradient, 0.5))).convert(mode)
+    buffer = BytesIO()
+    if exif is not None:
+        save_kwargs["exif"] = exif
+    img.save(buffer, format=fmt, **save_kwargs)
+    return buffer.getvalue()
+
+
+def test_small_image_passthrough():
+    """测试预算内的图片原样返回"""
+    print("\n=== 测试小图直通 ===")
+    data = _photo(200, 150, quality=80)
+    prepared = prepare_image(data)
+    assert prepared.data == data
+    assert prepared.mime_subtype == "jpeg"
+    assert prepared.to_data_url().startswith("data:image/jpeg;base64,")
+    print("✅ 小图不解码不重编码")
+
+
+def test_large_photo_fits_budget_in_one_pass():
+    """测试大图一次缩放到预算内，编码次数有限"""
+    print("\n=== 测试大图预处理 ===")
+    data = _photo(3000, 2000, quality=95)
+    assert len(data) > MAX_BASE64_SIZE
+
+    calls = []
+    original_encode = image_prep._encode_jpeg
+    image_prep._encode_jpeg = lambda img, quality: calls.append(quality) or original_encode(img, quality)
+    try:
+        prepared = prepare_image(data)
+    finally:
+        image_prep._encode_jpeg = original_encode
+
+    assert prepared.base64_size <= MAX_BASE64_SIZE
+    assert len(prepared.to_data_url().split(",", 1)[1]) == prepared.base64_size
+    assert abs(prepared.width / prepared.height - 1.5) < 0.01
+    # 一次最低质量探测 + 二分查找，不需要缩小尺寸重试
+    assert len(calls) <= 8, calls
+    print(f"✅ {prepared.width}x{prepared.height}, 编码 {len(calls)} 次")
+
+
+def test_transparent_png_and_orientation():
+    """测试透明 PNG 转 JPEG，EXIF 方向摆正"""
+    print("\n=== 测试格式与方向 ===")
+    prepared = prepare_image(_photo(900, 900, fmt="PNG", mode="RGBA"), max_base64_size=200000)
+    assert prepared.mime_subtype == "jpeg"
+    assert Image.open(BytesIO(prepared.data)).mode == "RGB"
+
+    exif = Image.Exif()
+    exif[0x0112] = 6  # 顺时针旋转 90 度
+    prepared = prepare_image(_photo(1600, 1200, exif=exif, quality=95), max_base64_size=200000)
+    assert prepared.width < prepared.height
+
+    prepared = prepare_image(_photo(1600, 1200, quality=60), max_side=800)
+    assert max(prepared.width, prepared.height) <= 800
+    print("✅ 格式与方向正确")
+
+
+def test_invalid_image():
+    """测试无法识别的图片"""
+    print("\n=== 测试无效图片 ===")
+    try:
+        prepare_image(b"not an image")
+        assert False, "应抛出 ValueError"
+    except ValueError:
+        pass
+    print("✅ 无效图片抛出 ValueError")
+
+
+if __name__ == "__main__":
+    test_small_image_passthrough()
+    test_large_photo_fits_budget_in_one_pass()
+    test_transparent_png_and_orientation()
+    test_invalid_image()
+    print("\n✅ 所有测试通过！")
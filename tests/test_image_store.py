@@ -0,0 +1,146 @@
+"""
+测试对话图片存储：按内容去重、缩放到模型输入尺寸、消息中的引用解析
+"""
+import base64
+import os
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+# 被测模块内部按 src 为根导入（与服务运行时一致）
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from langchain_core.messages import AIMessage, HumanMessage
+from PIL import Image, ImageFilter
+
+from utils.image_store import ImageStore, is_image_ref
+
+
+def _large_photo(width=4000, height=3000) -> bytes:
+    """生成几 MB 的高噪声照片，模拟手机原图"""
+    noise = Image.frombytes("L", (width, height), os.urandom(width * height)).filter(ImageFilter.GaussianBlur(1))
+    img = Image.merge("RGB", (noise, noise.rotate(90, expand=False), noise))
+    buffer = BytesIO()
+    img.save(buffer, format="JPEG", quality=95)
+    return buffer.getvalue()
+
+
+class _FakeS3:
+    """记录上传和签名请求的对象存储替身"""
+
+    def __init__(self):
+        self.objects = {}
+        self.sign_calls = 0
+
+    def upload_file(self, *, file_content, file_name, content_type, unique=True):
+        assert unique is False
+        self.objects[file_name] = file_content
+        return file_name
+
+    def read_file(self, *, file_key):
+        return self.objects[file_key]
+
+    def generate_presigned_url(self, *, key, expire_time):
+        self.sign_calls += 1
+        return f"https://bucket.example.com/{key}?sig=abc"
+
+
+def test_put_downscales_and_dedups():
+    """测试上传的图片缩放到模型输入尺寸，相同内容只保存一次"""
+    print("\n=== 测试存储与去重 ===")
+    data = _large_photo()
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ImageStore(backend="local", directory=tmp, max_side=1280)
+        ref = store.put(data)
+        assert is_image_ref(ref)
+        assert store.put(data) == ref
+        assert len(os.listdir(tmp)) == 1
+        assert store.get_stats()["dedup_hits"] == 1
+
+        stored = store.read(ref)
+        img = Image.open(BytesIO(stored))
+        assert max(img.size) <= 1280
+        assert len(stored) < len(data)
+        print(f"✓ {len(data)} 字节 -> {len(stored)} 字节 ({img.width}x{img.height})，引用 {len(ref)} 字符")
+
+
+def test_resolve_messages_local():
+    """测试本地后端把引用解析为 data URL，原消息保持不变"""
+    print("\n=== 测试本地引用解析 ===")
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ImageStore(backend="local", directory=tmp)
+        ref = store.put(_large_photo(1600, 1200))
+        message = HumanMessage(content=[
+            {"type": "text", "text": "分析这张图"},
+            {"type": "image_url", "image_url": {"url": ref}},
+        ])
+        plain = AIMessage(content="好的")
+
+        resolved = store.resolve_messages([message, plain])
+        assert resolved[1] is plain
+        url = resolved[0].content[1]["image_url"]["url"]
+        assert url.startswith("data:image/jpeg;base64,")
+        assert base64.b64decode(url.split(",", 1)[1]) == store.read(ref)
+        assert message.content[1]["image_url"]["url"] == ref
+        print("✓ 引用解析为 data URL，检查点中的消息仍为引用")
+
+
+def test_resolve_messages_s3_and_missing():
+    """测试 s3 后端解析为签名 URL 并复用签名，缺失的图片替换为文字说明"""
+    print("\n=== 测试签名 URL 与缺失图片 ===")
+    with tempfile.TemporaryDirectory() as tmp:
+        s3 = _FakeS3()
+        store = ImageStore(backend="s3", directory=tmp, s3_storage=s3)
+        ref = store.put(_large_photo(800, 600))
+        assert len(s3.objects) == 1
+
+        for _ in range(3):
+            assert store.resolve(ref).startswith("https://bucket.example.com/chat-images/")
+        assert s3.sign_calls == 1
+
+        local_store = ImageStore(backend="local", directory=tmp)
+        missing = HumanMessage(content=[
+            {"type": "image_url", "image_url": {"url": "image://" + "0" * 32 + ".jpeg"}},
+        ])
+        resolved = local_store.resolve_messages([missing])
+        assert resolved[0].content == [{"type": "text", "text": "[图片已过期或不存在]"}]
+        assert local_store.get_stats()["missing"] == 1
+        print("✓ 签名 URL 复用，缺失图片不影响模型调用")
+
+
+def test_trim_expired_and_over_capacity():
+    """测试清理过期图片，超出容量时先删除最久未使用的图片"""
+    print("\n=== 测试目录清理 ===")
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ImageStore(backend="local", directory=tmp, ttl=3600)
+        refs = [store.put(_large_photo(400 + i * 10, 300)) for i in range(3)]
+        paths = [os.path.join(tmp, ref[len("image://"):]) for ref in refs]
+        now = time.time()
+        os.utime(paths[0], (now - 7200, now - 7200))
+        os.utime(paths[1], (now - 600, now - 600))
+
+        assert store.trim() == 1
+        assert not os.path.exists(paths[0])
+        resolved = store.resolve_messages([HumanMessage(content=[
+            {"type": "image_url", "image_url": {"url": refs[0]}},
+        ])])
+        assert resolved[0].content == [{"type": "text", "text": "[图片已过期或不存在]"}]
+
+        # 读取会刷新使用时间，超出容量时保留最近使用的图片
+        os.utime(paths[2], (now - 60, now - 60))
+        store.read(refs[1])
+        store.max_bytes = os.path.getsize(paths[1])
+        assert store.trim() == 1
+        assert os.path.exists(paths[1]) and not os.path.exists(paths[2])
+        assert store.get_stats()["trimmed"] == 2
+        print("✓ 过期图片与超出容量的图片被清理")
+
+
+if __name__ == "__main__":
+    test_put_downscales_and_dedups()
+    test_resolve_messages_local()
+    test_resolve_messages_s3_and_missing()
+    test_trim_expired_and_over_capacity()
@@ -0,0 +1,89 @@
+"""
+测试游标分页
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+# 被测模块内部按 src 为根导入（与服务运行时一致）
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from sqlalchemy import insert
+
+from conftest import create_sqlite_session
+from storage.database.pagination import InvalidCursorError, decode_cursor, encode_cursor, next_cursor
+from storage.database.shared.model import MarketTrend, Supplier
+from storage.database.supplier_manager import SupplierManager
+
+
+def _collect(fetch, sort_col, limit):
+    seen, cursor = [], None
+    while True:
+        page = fetch(cursor)
+        seen.extend(item.id for item in page)
+        cursor = next_cursor(page, sort_col, limit)
+        if cursor is None:
+            return seen
+
+
+def test_cursor_roundtrip():
+    """测试游标编解码"""
+    print("\n=== 测试游标编解码 ===")
+    ts = datetime(2025, 3, 1, 12, 30)
+    assert decode_cursor(encode_cursor(ts, 42)) == (ts, 42)
+    assert decode_cursor(encode_cursor(None, 7)) == (None, 7)
+    assert decode_cursor(encode_cursor(8, 3)) == (8, 3)
+    try:
+        decode_cursor("not-a-cursor")
+        assert False, "应拒绝无效游标"
+    except InvalidCursorError:
+        pass
+    print("✓ 游标可逆且不透明")
+
+
+def test_pages_cover_all_rows_with_ties(sqlite_session):
+    """测试创建时间相同的行按 id 定序，翻页不重复不遗漏"""
+    print("\n=== 测试供应商翻页 ===")
+    _, db = sqlite_session(Supplier, MarketTrend)
+    base = datetime(2025, 1, 1)
+    db.execute(insert(Supplier), [
+        {"name": f"供应商{i}", "is_verified": False, "status": "active",
+         "created_at": base + timedelta(minutes=i // 3)}
+        for i in range(25)
+    ])
+    db.commit()
+    mgr = SupplierManager()
+
+    ids = _collect(lambda c: mgr.get_suppliers(db, limit=4, cursor=c), Supplier.created_at, 4)
+    assert len(ids) == 25 and len(set(ids)) == 25
+    assert ids == [s.id for s in mgr.get_suppliers(db, limit=100)]
+    print("✓ 25 行分 7 页取完")
+
+
+def test_nullable_sort_column(sqlite_session):
+    """测试排序列为空的行排在最后且能翻到"""
+    print("\n=== 测试趋势翻页（含空日期）===")
+    _, db = sqlite_session(Supplier, MarketTrend)
+    db.execute(insert(MarketTrend), [
+        {"category": "面膜", "data_date": datetime(2025, 1, 1) + timedelta(days=i) if i % 4 else None}
+        for i in range(18)
+    ])
+    db.commit()
+    mgr = SupplierManager()
+
+    ids = _collect(lambda c: mgr.get_market_trends(db, category="面膜", limit=5, cursor=c),
+                   MarketTrend.data_date, 5)
+    assert len(ids) == 18 and len(set(ids)) == 18
+    trends = {t.id: t for t in mgr.get_market_trends(db, limit=100)}
+    dates = [trends[i].data_date for i in ids]
+    assert all(d is None for d in dates[-5:])
+    assert dates[:-5] == sorted(dates[:-5], reverse=True)
+    print("✓ 空日期排在最后")
+
+
+if __name__ == "__main__":
+    test_cursor_roundtrip()
+    test_pages_cover_all_rows_with_ties(create_sqlite_session)
+    test_nullable_sort_column(create_sqlite_session)
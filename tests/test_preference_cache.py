@@ -0,0 +1,98 @@
+"""
+测试用户偏好缓存
+"""
+import os
+import sys
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+# 被测模块内部按 src 为根导入（与服务运行时一致）
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from sqlalchemy import event
+
+from conftest import create_sqlite_session
+from storage.database import preference_cache
+from storage.database.preference_cache import PreferenceCache, PreferenceSnapshot
+from storage.database.shared.model import Product, ProductRanking, Supplier, UserPreference
+from storage.database.supplier_manager import SupplierManager
+
+
+def _session(sqlite_session):
+    engine, db = sqlite_session(Supplier, Product, ProductRanking, UserPreference)
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    return db, statements
+
+
+def _preference_queries(statements):
+    return [s for s in statements if s.lstrip().upper().startswith("SELECT") and "user_preferences" in s]
+
+
+def test_recommend_reuses_cached_preference(sqlite_session):
+    """测试推荐命中缓存后不再查询偏好表，更新后立即生效"""
+    print("\n=== 测试偏好读穿透与写穿透 ===")
+    preference_cache._preference_cache = PreferenceCache()
+    db, statements = _session(sqlite_session)
+    mgr = SupplierManager()
+    supplier = Supplier(name="义乌小商品", platform="1688")
+    db.add(supplier)
+    db.flush()
+    db.add_all([
+        Product(supplier_id=supplier.id, name="手机壳A", category="手机壳", roi=80, potential_score=9, status="active"),
+        Product(supplier_id=supplier.id, name="面膜B", category="面膜", roi=120, potential_score=8, status="active"),
+    ])
+    db.commit()
+
+    mgr.create_or_update_preference(db, "u1", preferred_categories=["手机壳"])
+    statements.clear()
+
+    first = mgr.recommend_product_rows(db, "u1", 10)
+    second = mgr.recommend_product_rows(db, "u1", 10)
+    assert [r.name for r in first] == [r.name for r in second] == ["手机壳A"]
+    assert _preference_queries(statements) == []
+
+    pref = mgr.get_user_preference(db, "u1")
+    assert isinstance(pref, PreferenceSnapshot)
+    assert pref.preferred_categories == ("手机壳",)
+
+    mgr.create_or_update_preference(db, "u1", preferred_categories=["面膜"])
+    assert [r.name for r in mgr.recommend_product_rows(db, "u1", 10)] == ["面膜B"]
+    assert mgr.get_user_preference(db, "u1").preferred_categories == ("面膜",)
+    db.close()
+    print("✅ 偏好缓存命中，更新后写入新快照")
+
+
+def test_cache_expiry_and_eviction():
+    """测试过期和容量淘汰"""
+    print("\n=== 测试过期与淘汰 ===")
+    cache = PreferenceCache(max_size=2, ttl=60)
+    for user_id in ("a", "b", "c"):
+        cache.set(PreferenceSnapshot(user_id=user_id))
+    assert cache.get("a") is None
+    assert cache.get("c").user_id == "c"
+
+    expired = PreferenceCache(ttl=0)
+    expired.set(PreferenceSnapshot(user_id="a"))
+    assert expired.get("a") is None
+
+    assert not hasattr(PreferenceSnapshot(user_id="a"), "__dict__")
+    print("✅ 过期与淘汰正确")
+
+
+def test_snapshot_decodes_legacy_json_strings():
+    """测试迁移前二次编码的 JSON 字符串被解码，而不是拆成单个字符"""
+    print("\n=== 测试旧行的二次编码 JSON ===")
+    legacy = UserPreference(user_id="u2", preferred_categories='["面膜", "手机壳"]', keywords="null")
+    snapshot = PreferenceSnapshot.from_model(legacy)
+    assert snapshot.preferred_categories == ("面膜", "手机壳")
+    assert snapshot.keywords == ()
+    assert snapshot.preferred_platforms == ()
+    print("✅ 旧行解码正确")
+
+
+if __name__ == "__main__":
+    test_recommend_reuses_cached_preference(create_sqlite_session)
+    test_cache_expiry_and_eviction()
+    test_snapshot_decodes_legacy_json_strings()
+    print("\n✅ 所有测试通过！")
@@ -0,0 +1,125 @@
+"""
+测试产品排名表的增量维护和推荐查询
+"""
+import os
+import random
+import sys
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+# 被测模块内部按 src 为根导入（与服务运行时一致）
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from sqlalchemy import insert
+
+from conftest import create_sqlite_session
+from storage.database import preference_cache
+from storage.database.preference_cache import PreferenceCache
+from storage.database.shared import model
+from storage.database.shared.model import Product, ProductRanking, Supplier, UserPreference
+from storage.database.supplier_manager import ProductUpdate, SupplierManager
+
+CATEGORIES = ["手机壳", "面膜", "收纳盒", "宠物用品"]
+
+
+def _session(sqlite_session, models=(Supplier, Product, ProductRanking, UserPreference)):
+    _, db = sqlite_session(*models)
+    supplier = Supplier(name="义乌小商品", platform="1688")
+    db.add(supplier)
+    db.commit()
+    return db, supplier.id
+
+
+def _ranking(db, product_id):
+    return db.query(ProductRanking).filter(ProductRanking.product_id == product_id).first()
+
+
+def test_ranking_follows_product_writes(sqlite_session):
+    """测试产品增删改时排名行同步"""
+    print("\n=== 测试排名行增量维护 ===")
+    db, supplier_id = _session(sqlite_session)
+    product = Product(supplier_id=supplier_id, name="手机壳A", category="手机壳",
+                      roi=80, potential_score=9, status="active")
+    db.add(product)
+    db.commit()
+    assert _ranking(db, product.id).potential_score == 9
+
+    SupplierManager().update_product(db, product.id, ProductUpdate(potential_score=3, status="inactive"))
+    db.expire_all()
+    ranking = _ranking(db, product.id)
+    assert (ranking.potential_score, ranking.status) == (3, "inactive")
+
+    SupplierManager().delete_product(db, product.id)
+    assert _ranking(db, product.id) is None
+    db.close()
+    print("✅ 排名行随产品增删改同步")
+
+
+def test_product_writes_without_ranking_table(sqlite_session):
+    """测试尚未迁移（没有排名表）的库上产品写入照常成功，建表回填后恢复增量维护"""
+    print("\n=== 测试排名表缺失 ===")
+    db, supplier_id = _session(sqlite_session, models=(Supplier, Product))
+    product = Product(supplier_id=supplier_id, name="面膜A", category="面膜", potential_score=8, status="active")
+    db.add(product)
+    db.commit()
+    SupplierManager().update_product(db, product.id, ProductUpdate(potential_score=6))
+    assert db.get(Product, product.id).potential_score == 6
+
+    ProductRanking.__table__.create(db.get_bind())
+    assert SupplierManager().refresh_product_rankings(db) == 1
+    # 检查结果按间隔缓存，这里让下一次写入立即重新检查
+    model._ranking_table_state.clear()
+    SupplierManager().update_product(db, product.id, ProductUpdate(potential_score=9))
+    db.expire_all()
+    assert _ranking(db, product.id).potential_score == 9
+    print("✓ 产品写入不受影响，迁移后排名同步恢复")
+
+
+def test_recommendations_match_full_sort(sqlite_session):
+    """测试按品类分支取前 N 再合并的结果与在产品表上整体过滤排序一致"""
+    print("\n=== 测试推荐结果 ===")
+    preference_cache._preference_cache = PreferenceCache()
+    db, supplier_id = _session(sqlite_session)
+    rng = random.Random(7)
+    rows = [{
+        "supplier_id": supplier_id,
+        "name": f"产品{i}",
+        "category": rng.choice(CATEGORIES),
+        "purchase_price": rng.uniform(1, 100),
+        "roi": rng.uniform(0, 200),
+        "profit_margin": rng.uniform(0, 80),
+        "potential_score": rng.randint(1, 10),
+        "status": rng.choice(["active", "active", "inactive"]),
+    } for i in range(500)]
+    # 批量 INSERT 绕过 ORM 事件，需要全量重建
+    db.execute(insert(Product), rows)
+    db.commit()
+    mgr = SupplierManager()
+    assert mgr.refresh_product_rankings(db) == 500
+
+    def expected(categories, min_roi=None, min_score=None):
+        matched = [r for r in rows if r["status"] == "active"
+                   and (not categories or r["category"] in categories)
+                   and (min_roi is None or r["roi"] >= min_roi)
+                   and (min_score is None or r["potential_score"] >= min_score)]
+        matched.sort(key=lambda r: (r["potential_score"], r["roi"]), reverse=True)
+        return [r["name"] for r in matched[:20]]
+
+    # 无偏好：潜力分 >= 7
+    assert [p.name for p in mgr.recommend_products(db, "nobody", 20)] == expected([], min_score=7)
+
+    mgr.create_or_update_preference(db, "u1", preferred_categories=["手机壳", "面膜"], min_roi=50)
+    assert [r.name for r in mgr.recommend_product_rows(db, "u1", 20)] == expected(["手机壳", "面膜"], min_roi=50)
+    assert all(r.supplier_name == "义乌小商品" for r in mgr.recommend_product_rows(db, "u1", 20))
+
+    mgr.create_or_update_preference(db, "u1", preferred_categories=["宠物用品"])
+    assert [p.name for p in mgr.recommend_products(db, "u1", 20)] == expected(["宠物用品"], min_roi=50)
+    db.close()
+    print("✅ 推荐结果与整体排序一致")
+
+
+if __name__ == "__main__":
+    test_ranking_follows_product_writes(create_sqlite_session)
+    test_product_writes_without_ranking_table(create_sqlite_session)
+    test_recommendations_match_full_sort(create_sqlite_session)
+    print("\n✅ 所有测试通过！")
@@ -8,6 +8,8 @@ import os
 
 # 添加项目根目录到 Python 路径
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+# 被测模块内部按 src 为根导入（与服务运行时一致）
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 
 from src.utils.cache_manager import get_cache_manager
 from src.utils.rate_limiter import RateLimiter, check_service_available, handle_service_error
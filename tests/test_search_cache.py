@@ -0,0 +1,68 @@
+"""
+测试多级搜索缓存
+"""
+import os
+import sys
+import tempfile
+import time
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+# 被测模块内部按 src 为根导入（与服务运行时一致）
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from src.utils.search_cache import SearchCache, normalize_search_key
+
+
+def test_normalize_search_key():
+    """测试查询词、站点列表规范化后生成相同的键"""
+    print("\n=== 测试缓存键规范化 ===")
+    a = normalize_search_key("search.1688", "  面膜  批发 ", count=10, sites="1688.com, Taobao.com")
+    b = normalize_search_key("search.1688", "面膜 批发", count=10, sites="taobao.com,1688.com")
+    assert a == b
+    assert a != normalize_search_key("search.1688", "面膜 批发", count=20, sites="taobao.com,1688.com")
+    assert a != normalize_search_key("search.web", "面膜 批发", count=10, sites="taobao.com,1688.com")
+    assert a != normalize_search_key("search.1688", "面膜 批发", count=10, sites="taobao.com,1688.com",
+                                     time_range="1w")
+    print("✓ 缓存键规范化正确")
+
+
+def test_memory_lru_eviction():
+    """测试内存层容量上限与 LRU 淘汰"""
+    print("\n=== 测试内存 LRU ===")
+    cache = SearchCache(db_path=None, memory_size=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"  # a 变为最近使用
+    cache.set("c", "3")           # 淘汰 b
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+    assert cache.get_stats()["memory_keys"] == 2
+    print("✓ LRU 淘汰正确")
+
+
+def test_disk_tier_survives_restart():
+    """测试持久层在新实例中命中并回填内存层，过期条目不返回"""
+    print("\n=== 测试持久层 ===")
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "search_cache.sqlite3")
+        first = SearchCache(db_path=db_path, memory_size=8)
+        first.set("hot", "面膜结果")
+        first.set("short", "很快过期", ttl=0)
+
+        second = SearchCache(db_path=db_path, memory_size=8)
+        assert second.get("hot") == "面膜结果"
+        assert second.get("hot") == "面膜结果"
+        stats = second.get_stats()
+        assert stats["disk_hits"] == 1 and stats["memory_hits"] == 1
+
+        time.sleep(0.01)
+        assert second.get("short") is None
+        print("✓ 持久层跨实例命中")
+
+
+if __name__ == "__main__":
+    test_normalize_search_key()
+    test_memory_lru_eviction()
+    test_disk_tier_survives_restart()
@@ -0,0 +1,220 @@
+"""
+测试共享搜索客户端连接池的连接复用与并发上限
+"""
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+# 被测模块内部按 src 为根导入（与服务运行时一致）
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+# 测试不受默认 search 配额限制
+os.environ.setdefault("RATE_LIMIT_SEARCH", "10000/1")
+
+RESPONSE = json.dumps({
+    "ResponseMetadata": {},
+    "Result": {
+        "WebResults": [{"Id": "1", "SortId": 1, "Title": "面膜", "Snippet": "摘要",
+                        "AuthInfoDes": "", "AuthInfoLevel": 0}],
+        "Choices": [{"Message": {"Content": "总结"}}],
+    },
+}).encode("utf-8")
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    lock = threading.Lock()
+    connections = 0
+    requests = 0
+    in_flight = 0
+    max_in_flight = 0
+    delay = 0.0
+
+    def setup(self):
+        super().setup()
+        with _StubHandler.lock:
+            _StubHandler.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with _StubHandler.lock:
+            _StubHandler.requests += 1
+            _StubHandler.in_flight += 1
+            _StubHandler.max_in_flight = max(_StubHandler.max_in_flight, _StubHandler.in_flight)
+        time.sleep(_StubHandler.delay)
+        with _StubHandler.lock:
+            _StubHandler.in_flight -= 1
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(RESPONSE)))
+        self.end_headers()
+        self.wfile.write(RESPONSE)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _start_stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ["COZE_INTEGRATION_BASE_URL"] = base_url
+    os.environ.setdefault("COZE_INTEGRATION_MODEL_BASE_URL", base_url)
+    os.environ.setdefault("COZE_WORKLOAD_IDENTITY_API_KEY", "test-key")
+    return server
+
+
+def test_search_client_pool_reuses_connection():
+    """测试顺序调用复用同一条 keep-alive 连接"""
+    print("\n=== 测试连接复用 ===")
+    from src.utils.search_client_pool import SearchClientPool
+
+    server = _start_stub_server()
+    try:
+        _StubHandler.connections = 0
+        _StubHandler.delay = 0.0
+        pool = SearchClientPool(pool_maxsize=4, max_in_flight=4)
+        for i in range(5):
+            client = pool.client("search.test", use_cache=False)
+            client.web_search(query=f"q{i}", count=1)
+        assert _StubHandler.connections == 1, f"应复用连接，实际建立 {_StubHandler.connections} 个"
+        pool.close()
+        print("✓ 5 次调用只建立 1 个连接")
+    finally:
+        server.shutdown()
+
+
+def test_search_client_pool_limits_in_flight():
+    """测试并发请求数不超过上限"""
+    print("\n=== 测试并发上限 ===")
+    from src.utils.search_client_pool import SearchClientPool
+
+    server = _start_stub_server()
+    try:
+        _StubHandler.max_in_flight = 0
+        _StubHandler.delay = 0.05
+        pool = SearchClientPool(pool_maxsize=8, max_in_flight=2)
+
+        def call(i):
+            pool.client("search.test", use_cache=False).web_search(query=f"q{i}", count=1)
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert _StubHandler.max_in_flight <= 2, f"并发超过上限: {_StubHandler.max_in_flight}"
+        pool.close()
+        print(f"✓ 最大并发 {_StubHandler.max_in_flight}")
+    finally:
+        server.shutdown()
+
+
+def test_search_client_pool_cache_hit():
+    """测试相同搜索第二次命中缓存，不再请求上游"""
+    print("\n=== 测试搜索缓存命中 ===")
+    from src.utils.search_client_pool import PooledSearchClient, SearchClientPool
+    from src.utils.search_cache import SearchCache
+
+    server = _start_stub_server()
+    try:
+        _StubHandler.delay = 0.0
+        _StubHandler.requests = 0
+        pool = SearchClientPool(pool_maxsize=4, max_in_flight=4)
+        cache = SearchCache(db_path=None)
+
+        def make_client():
+            return PooledSearchClient(session=pool._session, semaphore=pool._semaphore,
+                                      tool="search.test", cache=cache)
+
+        first = make_client().search(query="面膜  热销", count=5, sites="1688.com")
+        second = make_client().search(query="面膜 热销", count=5, sites="1688.com")
+        assert _StubHandler.requests == 1, f"第二次应命中缓存，实际请求 {_StubHandler.requests} 次"
+        assert second.model_dump() == first.model_dump()
+        pool.close()
+        print("✓ 重复搜索命中缓存")
+    finally:
+        server.shutdown()
+
+
+def test_search_client_pool_coalesces_concurrent_calls():
+    """测试相同参数的并发搜索只请求一次上游，且都拿到结果"""
+    print("\n=== 测试并发搜索合并 ===")
+    from src.utils.search_client_pool import SearchClientPool
+
+    server = _start_stub_server()
+    try:
+        _StubHandler.delay = 0.1
+        _StubHandler.requests = 0
+        pool = SearchClientPool(pool_maxsize=8, max_in_flight=8)
+        results = []
+
+        def call():
+            response = pool.client("search.trend", use_cache=False).web_search(query="面膜", count=5)
+            results.append(len(response.web_items))
+
+        threads = [threading.Thread(target=call) for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert results == [1] * 5
+        assert _StubHandler.requests == 1, f"应只请求一次上游，实际 {_StubHandler.requests} 次"
+        pool.close()
+        print("✓ 5 个并发调用共享 1 次上游请求")
+    finally:
+        server.shutdown()
+
+
+def test_search_client_pool_local_wait_not_counted_by_breaker():
+    """测试等待本地并发名额超时不计入熔断统计，上游请求才计入"""
+    print("\n=== 测试熔断只统计上游请求 ===")
+    from src.utils.search_client_pool import SearchClientPool
+    from utils.circuit_breaker import get_circuit_breaker
+    from utils.deadline_executor import DeadlineExceeded, run_with_deadline
+
+    server = _start_stub_server()
+    try:
+        _StubHandler.delay = 0.0
+        pool = SearchClientPool(pool_maxsize=2, max_in_flight=1)
+        breaker = get_circuit_breaker("search.breaker_test")
+        breaker.reset()
+
+        # 占住唯一的并发名额，搜索只能在本地排队直到截止时间
+        pool._semaphore.acquire()
+        try:
+            run_with_deadline(
+                "search_1688",
+                lambda: pool.client("search.breaker_test", use_cache=False).web_search(query="面膜", count=1),
+                timeout=0.2,
+            )
+            raise AssertionError("应超出截止时间")
+        except DeadlineExceeded:
+            pass
+        finally:
+            # 等后台线程也因截止时间放弃后再归还名额
+            time.sleep(0.3)
+            pool._semaphore.release()
+        status = breaker.get_status()
+        assert status["calls"] == 0 and status["failures"] == 0, status
+
+        pool.client("search.breaker_test", use_cache=False).web_search(query="面膜", count=1)
+        assert breaker.get_status()["calls"] == 1
+        pool.close()
+        print("✓ 本地排队超时不计为上游失败")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    test_search_client_pool_reuses_connection()
+    test_search_client_pool_limits_in_flight()
+    test_search_client_pool_cache_hit()
+    test_search_client_pool_coalesces_concurrent_calls()
+    test_search_client_pool_local_wait_not_counted_by_breaker()
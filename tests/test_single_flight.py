@@ -0,0 +1,112 @@
+"""
+测试单飞请求合并
+"""
+import os
+import sys
+import threading
+import time
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+# 被测模块内部按 src 为根导入（与服务运行时一致）
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from src.utils.single_flight import SingleFlight
+from utils.deadline_executor import DeadlineExceeded, run_with_deadline
+
+
+def _run_concurrently(n, target):
+    threads = [threading.Thread(target=target) for _ in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def test_concurrent_calls_share_result():
+    """测试相同键的并发调用只执行一次并共享结果"""
+    print("\n=== 测试并发合并 ===")
+    flight = SingleFlight()
+    calls = []
+    results = []
+
+    def upstream():
+        calls.append(1)
+        time.sleep(0.1)
+        return "面膜趋势"
+
+    _run_concurrently(5, lambda: results.append(flight.do("trend:面膜", upstream)))
+
+    assert len(calls) == 1
+    assert results == ["面膜趋势"] * 5
+    stats = flight.get_stats()
+    assert stats == {"executed": 1, "shared": 4, "retried": 0, "in_flight": 0}
+
+    # 完成后不缓存结果，新的调用会重新执行
+    flight.do("trend:面膜", upstream)
+    assert len(calls) == 2
+    print("✓ 5 个并发调用只执行 1 次")
+
+
+def test_error_propagates_to_followers():
+    """测试 leader 的异常传递给所有等待者"""
+    print("\n=== 测试异常传递 ===")
+    flight = SingleFlight()
+    errors = []
+
+    def failing():
+        time.sleep(0.1)
+        raise ValueError("上游限流")
+
+    def call():
+        try:
+            flight.do("search:手机壳", failing)
+        except ValueError as e:
+            errors.append(str(e))
+
+    _run_concurrently(3, call)
+    assert errors == ["上游限流"] * 3
+    print("✓ 异常传递给所有调用")
+
+
+def test_follower_retries_after_leader_deadline():
+    """测试 leader 预算比 follower 短时，leader 超时后 follower 重新执行并拿到结果"""
+    print("\n=== 测试 leader 超时后重试 ===")
+    flight = SingleFlight()
+    calls = []
+    outcome = {}
+
+    def upstream():
+        calls.append(1)
+        time.sleep(0.15)
+        if len(calls) == 1:
+            # 模拟下游客户端按 leader 的截止时间放弃
+            raise DeadlineExceeded("leader budget exhausted")
+        return "面膜趋势"
+
+    def leader():
+        try:
+            run_with_deadline("search_1688", flight.do, "trend:面膜", upstream, timeout=0.1)
+        except DeadlineExceeded:
+            outcome["leader"] = "timeout"
+
+    def follower():
+        time.sleep(0.03)
+        outcome["follower"] = run_with_deadline("search_1688", flight.do, "trend:面膜", upstream, timeout=2)
+
+    threads = [threading.Thread(target=leader), threading.Thread(target=follower)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert outcome == {"leader": "timeout", "follower": "面膜趋势"}, outcome
+    assert len(calls) == 2
+    assert flight.get_stats()["retried"] == 1
+    print("✓ follower 在自己的预算内重新执行")
+
+
+if __name__ == "__main__":
+    test_concurrent_calls_share_result()
+    test_error_propagates_to_followers()
+    test_follower_retries_after_leader_deadline()
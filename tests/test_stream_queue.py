@@ -0,0 +1,153 @@
+"""
+测试有界流式队列的背压与增量合并
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.utils.stream_queue import BackpressureQueue, TimeWindowBatcher, get_stream_queue_registry
+from src.utils.messages.server import merge_delta_message_dicts
+
+
+def _answer(seq: int, text: str, finish: bool = False) -> dict:
+    return {
+        "type": "answer",
+        "msg_id": "m1",
+        "sequence_id": seq,
+        "finish": finish,
+        "content": {"answer": text},
+    }
+
+
+async def _run_slow_consumer(queue: BackpressureQueue, delay: float) -> list:
+    received = []
+    while True:
+        item = await queue.get()
+        if item is None:
+            break
+        received.append(item)
+        await asyncio.sleep(delay)
+    queue.close()
+    return received
+
+
+def test_backpressure_coalesces_answer_deltas():
+    """测试消费者落后时合并回答增量，且内容和顺序不丢失"""
+    print("\n=== 测试回答增量合并 ===")
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        queue = BackpressureQueue(loop, "run-merge", high_watermark=4, low_watermark=1,
+                                  merge=merge_delta_message_dicts)
+
+        def producer():
+            for i in range(50):
+                queue.put(_answer(i + 1, str(i % 10)))
+            queue.put(_answer(51, "", finish=True))
+            queue.put_end()
+
+        threading.Thread(target=producer, daemon=True).start()
+        received = await _run_slow_consumer(queue, 0.002)
+        return queue, received
+
+    queue, received = asyncio.run(main())
+    text = "".join(m["content"]["answer"] for m in received)
+    assert text == "".join(str(i % 10) for i in range(50))
+    assert received[-1]["finish"] is True
+    seqs = [m["sequence_id"] for m in received]
+    assert seqs == sorted(seqs), "合并后序号应保持单调递增"
+    assert queue.stats.coalesced > 0
+    assert queue.stats.max_depth <= 4
+    print(f"✓ 合并 {queue.stats.coalesced} 次，最大深度 {queue.stats.max_depth}")
+
+
+def test_backpressure_blocks_producer():
+    """测试无法合并时生产者阻塞，队列深度不超过高水位"""
+    print("\n=== 测试生产者阻塞 ===")
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        queue = BackpressureQueue(loop, "run-block", high_watermark=3, low_watermark=1)
+
+        def producer():
+            for i in range(20):
+                queue.put(i)
+            queue.put_end()
+
+        threading.Thread(target=producer, daemon=True).start()
+        received = await _run_slow_consumer(queue, 0.001)
+        return queue, received
+
+    queue, received = asyncio.run(main())
+    assert received == list(range(20))
+    assert queue.stats.max_depth <= 3
+    assert queue.stats.blocked_count > 0
+    snapshot = get_stream_queue_registry().snapshot()
+    assert any(s["run_id"] == "run-block" and not s["active"] for s in snapshot["recent"])
+    print(f"✓ 阻塞 {queue.stats.blocked_count} 次，最大深度 {queue.stats.max_depth}")
+
+
+def test_close_releases_blocked_producer():
+    """测试消费者关闭队列后阻塞的生产者立即返回"""
+    print("\n=== 测试关闭释放生产者 ===")
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        queue = BackpressureQueue(loop, "run-close", high_watermark=2, low_watermark=0)
+        results = []
+
+        def producer():
+            for i in range(10):
+                if not queue.put(i):
+                    results.append("stopped")
+                    return
+
+        thread = threading.Thread(target=producer, daemon=True)
+        thread.start()
+        await queue.get()
+        await asyncio.sleep(0.05)
+        queue.close()
+        await asyncio.to_thread(thread.join, 2)
+        return thread, results
+
+    thread, results = asyncio.run(main())
+    assert not thread.is_alive()
+    assert results == ["stopped"]
+    print("✓ 关闭后生产者退出")
+
+
+def test_time_window_batcher():
+    """测试首个片段立即发送，窗口内的片段合并发送，flush 发送剩余片段"""
+    print("\n=== 测试时间窗口合并 ===")
+    sent = []
+    batcher = TimeWindowBatcher(sent.append, window_seconds=0.05)
+
+    batcher.add("你")
+    assert sent == ["你"], "首个片段应立即发送"
+    for token in ["好", "，", "世", "界"]:
+        batcher.add(token)
+    assert sent == ["你"]
+
+    time.sleep(0.06)
+    batcher.add("！")
+    assert sent == ["你", "好，世界！"]
+
+    batcher.add("再见")
+    batcher.add("")
+    batcher.flush()
+    batcher.flush()
+    assert sent == ["你", "好，世界！", "再见"]
+    assert batcher.flushes == 3
+    print(f"✓ 7 个片段合并为 {batcher.flushes} 次发送")
+
+
+if __name__ == "__main__":
+    test_backpressure_coalesces_answer_deltas()
+    test_backpressure_blocks_producer()
+    test_close_releases_blocked_producer()
+    test_time_window_batcher()
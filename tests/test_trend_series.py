@@ -0,0 +1,73 @@
+"""
+测试趋势数据按天聚合
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+# 被测模块内部按 src 为根导入（与服务运行时一致）
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import sessionmaker
+
+from storage.database.shared.model import MarketTrend
+from storage.database.supplier_manager import SupplierManager
+
+
+def test_daily_buckets_over_date_window():
+    """测试按天分组、时间窗口过滤，且只执行一条 SQL"""
+    print("\n=== 测试趋势按天聚合 ===")
+    engine = create_engine("sqlite://")
+    MarketTrend.__table__.create(engine)
+    db = sessionmaker(bind=engine)()
+    now = datetime(2026, 3, 31, 12, 0)
+    rows = [
+        (now - timedelta(days=1, hours=2), 10.0),
+        (now - timedelta(days=1, hours=5), 30.0),
+        (now - timedelta(days=1, hours=6), None),
+        (now - timedelta(days=3), -5.0),
+        (now - timedelta(days=40), 99.0),  # 超出窗口
+    ]
+    db.add_all([MarketTrend(category="手机壳", growth_rate=rate, data_date=date, summary="长摘要" * 100)
+                for date, rate in rows])
+    db.add(MarketTrend(category="面膜", growth_rate=50.0, data_date=now - timedelta(days=1)))
+    db.commit()
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    buckets = SupplierManager().get_trend_series(db, category="手机壳", days=30, now=now)
+
+    assert len(statements) == 1
+    assert "summary" not in statements[0] and "hot_keywords" not in statements[0]
+    assert [str(b.day) for b in buckets] == ["2026-03-28", "2026-03-30"]
+    last = buckets[-1]
+    assert (last.avg_growth_rate, last.min_growth_rate, last.max_growth_rate) == (20.0, 10.0, 30.0)
+    assert (last.growth_samples, last.trend_count) == (2, 3)
+    db.close()
+    print("✅ 聚合结果正确")
+
+
+def test_postgresql_uses_date_trunc():
+    """测试 PostgreSQL 上按 date_trunc 分组"""
+    print("\n=== 测试 PostgreSQL 聚合 SQL ===")
+
+    class _Bind:
+        dialect = postgresql.dialect()
+
+    class _Session:
+        def get_bind(self):
+            return _Bind()
+
+    expr = SupplierManager._day_bucket(_Session(), MarketTrend.data_date)
+    assert "date_trunc" in str(expr.compile(dialect=postgresql.dialect()))
+    print("✅ 使用 date_trunc")
+
+
+if __name__ == "__main__":
+    test_daily_buckets_over_date_window()
+    test_postgresql_uses_date_trunc()
+    print("\n✅ 所有测试通过！")
@@ -0,0 +1,135 @@
+"""
+测试视觉分析结果缓存与感知哈希
+"""
+import os
+import sys
+import tempfile
+from io import BytesIO
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+# 被测模块内部按 src 为根导入（与服务运行时一致）
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from PIL import Image, ImageDraw
+
+from utils.image_prep import fingerprint, perceptual_hash
+from utils.vision_cache import VisionCache
+
+
+def _product_photo(seed: int, size=(1200, 900), quality=92) -> Image.Image:
+    """生成带几何图形的测试图"""
+    img = Image.new("RGB", size, (240, 240, 235))
+    draw = ImageDraw.Draw(img)
+    w, h = size
+    draw.ellipse((w * 0.2, h * 0.15, w * 0.6, h * (0.6 + seed * 0.05)), fill=(200, 40 * seed % 255, 60))
+    draw.rectangle((w * (0.5 - seed * 0.05), h * 0.5, w * 0.9, h * 0.85), fill=(30, 90, 160 + seed * 10))
+    return img
+
+
+def _jpeg(img: Image.Image, quality=92) -> bytes:
+    buffer = BytesIO()
+    img.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def _distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def test_perceptual_hash_near_duplicates():
+    """测试缩放、重新压缩后哈希接近，不同图片哈希差异大"""
+    print("\n=== 测试感知哈希 ===")
+    original = _product_photo(1)
+    h1 = perceptual_hash(_jpeg(original))
+    h2 = perceptual_hash(_jpeg(original.resize((600, 450)), quality=60))
+    h3 = perceptual_hash(_jpeg(_product_photo(2).transpose(Image.Transpose.ROTATE_180)))
+    assert _distance(h1, h2) <= 3, _distance(h1, h2)
+    assert _distance(h1, h3) > 6, _distance(h1, h3)
+    print(f"✅ 近似副本距离 {_distance(h1, h2)}，不同图片距离 {_distance(h1, h3)}")
+
+
+def test_cache_exact_near_and_variants():
+    """测试精确命中、近似命中和分析类型隔离"""
+    print("\n=== 测试视觉缓存 ===")
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = VisionCache(db_path=os.path.join(tmp, "vision.sqlite3"))
+        general = VisionCache.variant("general", 1, "vision-model")
+        sourcing = VisionCache.variant("sourcing", 1, "vision-model")
+
+        fp = fingerprint(_jpeg(_product_photo(1)))
+        key = VisionCache.content_key(fp.digest)
+        cache.set(key, general, "通用分析结果", fp.phash, fp.color)
+
+        assert cache.get(key, general, fp.phash, fp.color) == "通用分析结果"
+        assert cache.get(key, sourcing, fp.phash, fp.color) is None
+        assert cache.get(key, VisionCache.variant("general", 2, "vision-model"), fp.phash, fp.color) is None
+
+        # 重新压缩后的副本按近似哈希命中；高位也有差异的哈希同样能被分段找到
+        copy = fingerprint(_jpeg(_product_photo(1).resize((600, 450)), quality=60))
+        assert copy.digest != fp.digest
+        assert cache.get(VisionCache.content_key(copy.digest), general, copy.phash, copy.color) == "通用分析结果"
+        near = fp.phash ^ 0b101 ^ (1 << 63)
+        assert cache.get(VisionCache.content_key("near"), general, near, fp.color) == "通用分析结果"
+        far = fp.phash ^ 0xFFFF
+        assert cache.get(VisionCache.content_key("far"), general, far, fp.color) is None
+
+        url_key = VisionCache.content_key(url="https://example.com/a.jpg")
+        cache.set(url_key, general, "网络图片结果")
+        assert cache.get(url_key, general) == "网络图片结果"
+
+        stats = cache.get_stats()
+        assert (stats["hits"], stats["near_hits"], stats["writes"]) == (2, 2, 2)
+    print("✅ 缓存命中规则正确")
+
+
+def test_color_variants_miss():
+    """测试同款不同色的商品图感知哈希相同，但不会命中彼此的分析结果"""
+    print("\n=== 测试颜色变体 ===")
+
+    def variant_photo(color) -> bytes:
+        img = Image.new("RGB", (800, 800), (255, 255, 255))
+        ImageDraw.Draw(img).rounded_rectangle((200, 150, 600, 650), radius=60, fill=color)
+        return _jpeg(img)
+
+    red, blue, gray = (fingerprint(variant_photo(c)) for c in ((200, 30, 30), (30, 60, 200), (128, 128, 128)))
+    assert _distance(red.phash, blue.phash) <= 3 and _distance(red.phash, gray.phash) <= 3
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = VisionCache(db_path=os.path.join(tmp, "vision.sqlite3"))
+        general = VisionCache.variant("general", 1, "vision-model")
+        cache.set(VisionCache.content_key(red.digest), general, "颜色: 红色", red.phash, red.color)
+
+        for other in (blue, gray):
+            assert cache.get(VisionCache.content_key(other.digest), general, other.phash, other.color) is None
+        recompressed = fingerprint(_jpeg(Image.open(BytesIO(variant_photo((200, 30, 30)))), quality=60))
+        assert cache.get(
+            VisionCache.content_key(recompressed.digest), general, recompressed.phash, recompressed.color
+        ) == "颜色: 红色"
+    print(f"✅ 颜色变体哈希距离 {_distance(red.phash, blue.phash)}，仍按颜色区分")
+
+
+def test_cache_eviction():
+    """测试过期和容量淘汰"""
+    print("\n=== 测试淘汰 ===")
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = VisionCache(db_path=os.path.join(tmp, "vision.sqlite3"), max_rows=10)
+        variant = VisionCache.variant("general", 1, "m")
+        for i in range(60):
+            cache.set(VisionCache.content_key(url=f"u{i}"), variant, str(i))
+        (rows,) = cache._db.execute("SELECT COUNT(*) FROM vision_cache").fetchone()
+        assert rows <= 20
+        assert cache.get(VisionCache.content_key(url="u59"), variant) == "59"
+
+        expired = VisionCache(db_path=os.path.join(tmp, "expired.sqlite3"), ttl=-1)
+        expired.set(VisionCache.content_key(url="x"), variant, "x")
+        assert expired.get(VisionCache.content_key(url="x"), variant) is None
+    print("✅ 淘汰正确")
+
+
+if __name__ == "__main__":
+    test_perceptual_hash_near_duplicates()
+    test_cache_exact_near_and_variants()
+    test_color_variants_miss()
+    test_cache_eviction()
+    print("\n✅ 所有测试通过！")